@@ -1,4 +1,4 @@
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.service import async_register_admin_service
@@ -6,6 +6,7 @@ from homeassistant.helpers.script import Script
 from homeassistant.components.button import ButtonEntity
 from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry
 import logging
+import voluptuous as vol
 from .const import *
 
 _LOGGER = logging.getLogger(__name__)
@@ -28,13 +29,16 @@ async def async_setup(hass: HomeAssistant, config: dict):
             return
 
         evse_minimum_charge_current = entry.data.get(CONF_EVSE_MINIMUM_CHARGE_CURRENT, 6)  # Default to 6 if not set
+        # Address the charger when the OCPP integration manages several of them
+        device_data = {"devid": entry.data[CONF_CHARGER_ID]} if entry.data.get(CONF_CHARGER_ID) else {}
 
         sequence = [
-            {"service": "ocpp.clear_profile", "data": {}},
+            {"service": "ocpp.clear_profile", "data": dict(device_data)},
             {"delay": {"seconds": 30}},
             {
                 "service": "ocpp.set_charge_rate",
                 "data": {
+                    **device_data,
                     "custom_profile": {
                         "chargingProfileId": 10,
                         "stackLevel": 2,
@@ -55,12 +59,53 @@ async def async_setup(hass: HomeAssistant, config: dict):
 
     hass.services.async_register(DOMAIN, "reset_ocpp_evse", handle_reset_service)
 
+    async def handle_get_decision_trace(call: ServiceCall):
+        """Return the recent charge current decisions and the current targets of all modes of a config entry."""
+        entry_data = hass.data.get(DOMAIN, {}).get(call.data["entry_id"])
+        if entry_data is None or entry_data.get("coordinator") is None:
+            return {}
+        controller = entry_data["coordinator"].controller
+        response = controller.trace.as_dict(call.data.get("records"))
+        response["mode_targets"] = controller.request_mode_targets()
+        return response
+
+    hass.services.async_register(
+        DOMAIN,
+        "get_decision_trace",
+        handle_get_decision_trace,
+        schema=vol.Schema({
+            vol.Required("entry_id"): cv.string,
+            vol.Optional("records"): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        }),
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def handle_profile(call: ServiceCall):
+        """Profile the next ticks of a config entry and report the hottest functions."""
+        entry_data = hass.data.get(DOMAIN, {}).get(call.data["entry_id"])
+        if entry_data is None or entry_data.get("coordinator") is None:
+            return {}
+        return await entry_data["coordinator"].async_profile(call.data["ticks"], call.data["top"])
+
+    hass.services.async_register(
+        DOMAIN,
+        "profile",
+        handle_profile,
+        schema=vol.Schema({
+            vol.Required("entry_id"): cv.string,
+            vol.Optional("ticks", default=DEFAULT_PROFILE_TICKS): vol.All(vol.Coerce(int), vol.Range(min=1, max=MAX_PROFILE_TICKS)),
+            vol.Optional("top", default=DEFAULT_PROFILE_TOP): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        }),
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
     return True
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Set up Dynamic OCPP EVSE from a config entry."""
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry
+    # The sensor platform adds the coordinator
+    hass.data[DOMAIN][entry.entry_id] = {"entry": entry, "coordinator": None}
 
     # Check if this is an update and we need to migrate entities
     await _migrate_entities_if_needed(hass, entry)
@@ -0,0 +1,200 @@
+"""Share one grid connection between several chargers.
+
+Entries that share the same grid connection (same main breaker and phase
+sensors) form a site. Every entry removes the current drawn by the other
+chargers of the site from its grid readings and calculates its target as if
+it were the only charger. The site allocator then splits the capacity
+between them with priority water-filling:
+
+- Higher priority chargers are served first, chargers with the same
+  priority share fairly.
+- A charger is only admitted if it can get its minimum current on all of its
+  phases, otherwise it gets 0. Chargers that are already charging are
+  admitted first to avoid flapping.
+- Admitted chargers are raised together from their minimum current until
+  they reach their target or a constraint is exhausted: the breaker headroom
+  of every phase they use, the pooled import/export/battery current of the
+  site, and the surplus the chargers in Solar and Excess mode share.
+"""
+from dataclasses import dataclass
+from .const import *
+
+PHASE_COUNT = 3
+
+# Allocations closer than this are considered equal (A)
+EPSILON = 1e-9
+
+
+@dataclass(frozen=True)
+class ChargerDemand:
+    """What one charger wants from the site on this tick."""
+    key: str
+    phases: tuple  # phase indices (0 = A, 1 = B, 2 = C) the charger draws from
+    draw: float  # current per phase the charger draws now (A)
+    min_current: float
+    target: float  # mode target per phase, below min_current means the charger should not charge
+    mode_pool: float = None  # site surplus (A, summed over phases) the charging mode may use, None = no extra limit
+    priority: int = 0
+
+
+@dataclass(frozen=True)
+class SiteCapacity:
+    """Capacity the grid connection leaves for all chargers together, read once per tick."""
+    phase_headroom: tuple  # breaker current per phase not used by other loads (A)
+    pool: float  # import limit + export + battery current not used by other loads, summed over phases (A)
+
+
+class _Constraint:
+    __slots__ = ("members", "cap", "phase")
+
+    def __init__(self, members, cap, phase):
+        self.members = members
+        self.cap = cap
+        self.phase = phase  # per phase constraints weigh every charger once, pools by phase count
+
+    def weight(self, demand):
+        return 1 if self.phase else len(demand.phases)
+
+    def used(self, demands, allocation):
+        return sum(allocation[key] * self.weight(demands[key]) for key in self.members)
+
+
+def allocate(capacity: SiteCapacity, demands):
+    """Return the current per phase allocated to every charger, keyed by ChargerDemand.key."""
+    demands = {demand.key: demand for demand in demands}
+    allocation = {key: 0.0 for key in demands}
+    if not demands:
+        return allocation
+
+    constraints = [
+        _Constraint(frozenset(key for key, demand in demands.items() if phase in demand.phases), capacity.phase_headroom[phase], True)
+        for phase in range(PHASE_COUNT)
+    ]
+    constraints.append(_Constraint(frozenset(demands), capacity.pool, False))
+    # A mode pool limits its charger together with every charger in a mode with a smaller pool,
+    # the Excess surplus above the threshold is part of the Solar surplus
+    mode_pools = sorted({demand.mode_pool for demand in demands.values() if demand.mode_pool is not None})
+    for mode_pool in mode_pools:
+        members = frozenset(
+            key for key, demand in demands.items()
+            if demand.mode_pool is not None and demand.mode_pool <= mode_pool
+        )
+        constraints.append(_Constraint(members, mode_pool, False))
+
+    def fits(key, current):
+        for constraint in constraints:
+            if key in constraint.members:
+                used = constraint.used(demands, allocation)
+                if used + current * constraint.weight(demands[key]) > constraint.cap + EPSILON:
+                    return False
+        return True
+
+    for priority in sorted({demand.priority for demand in demands.values()}, reverse=True):
+        group = [demand for demand in demands.values() if demand.priority == priority and demand.target >= demand.min_current]
+        # Admission at minimum current, chargers that are charging already go first
+        group.sort(key=lambda demand: (demand.draw <= 0, demand.key))
+        active = []
+        for demand in group:
+            if fits(demand.key, demand.min_current):
+                allocation[demand.key] = demand.min_current
+                active.append(demand.key)
+
+        # Water-filling from the minimum current up to the targets
+        active = [key for key in active if allocation[key] < demands[key].target - EPSILON]
+        while active:
+            step = min(demands[key].target - allocation[key] for key in active)
+            for constraint in constraints:
+                users = [key for key in active if key in constraint.members]
+                if users:
+                    slack = constraint.cap - constraint.used(demands, allocation)
+                    step = min(step, slack / sum(constraint.weight(demands[key]) for key in users))
+            step = max(step, 0)
+            for key in active:
+                allocation[key] += step
+            saturated = [
+                constraint for constraint in constraints
+                if constraint.cap - constraint.used(demands, allocation) <= EPSILON
+            ]
+            active = [
+                key for key in active
+                if allocation[key] < demands[key].target - EPSILON
+                and not any(key in constraint.members for constraint in saturated)
+            ]
+    return allocation
+
+
+def site_key(config_data):
+    """Return the key of the grid connection a config entry belongs to."""
+    return (
+        config_data.get(CONF_MAIN_BREAKER_RATING),
+        config_data.get(CONF_PHASE_A_CURRENT_ENTITY_ID),
+        config_data.get(CONF_PHASE_B_CURRENT_ENTITY_ID),
+        config_data.get(CONF_PHASE_C_CURRENT_ENTITY_ID),
+    )
+
+
+class SiteAllocator:
+    """Allocation state shared by the config entries of one grid connection."""
+
+    def __init__(self):
+        self._demands = {}
+        self._on_reduced = {}
+        self._read_draw = {}
+        self.capacity = None
+        self.allocation = {}
+
+    def __len__(self):
+        return len(self._on_reduced)
+
+    def add_member(self, key, on_reduced=None, read_draw=None):
+        """Join the site.
+
+        on_reduced is called when another charger's tick lowers this allocation.
+        read_draw returns the current per phase the charger draws right now, the
+        draw of its last demand is used without it.
+        """
+        self._on_reduced[key] = on_reduced
+        self._read_draw[key] = read_draw
+
+    def other_draw(self, key):
+        """Return the current per phase drawn by the other chargers on the phases of their last demand."""
+        draw = [0.0] * PHASE_COUNT
+        for other_key, demand in self._demands.items():
+            if other_key != key:
+                read_draw = self._read_draw.get(other_key)
+                # The grid readings are newer than the other charger's last tick
+                current = read_draw() if read_draw is not None else demand.draw
+                for phase in demand.phases:
+                    draw[phase] += current
+        return draw
+
+    def remove_member(self, key):
+        self._on_reduced.pop(key, None)
+        self._read_draw.pop(key, None)
+        self._demands.pop(key, None)
+        self.allocation.pop(key, None)
+
+    def release(self, key):
+        """Drop the demand of a charger that does not charge, the others get its share on their next tick."""
+        self._demands.pop(key, None)
+        self.allocation.pop(key, None)
+
+    def preview(self, capacity: SiteCapacity, demand: ChargerDemand):
+        """Return the share demand would get next to the other demands, without storing it."""
+        demands = [other for key, other in self._demands.items() if key != demand.key]
+        demands.append(demand)
+        return allocate(capacity, demands)[demand.key]
+
+    def update(self, capacity: SiteCapacity, demand: ChargerDemand):
+        """Store the latest demand and capacity, reallocate and return the share of this charger."""
+        self.capacity = capacity
+        self._demands[demand.key] = demand
+        previous = self.allocation
+        self.allocation = allocate(capacity, self._demands.values())
+        # Other chargers only recalculate on their own ticks, tell them about reductions right away
+        for key, current in self.allocation.items():
+            if key != demand.key and current < previous.get(key, 0) - EPSILON:
+                on_reduced = self._on_reduced.get(key)
+                if on_reduced is not None:
+                    on_reduced()
+        return self.allocation[demand.key]
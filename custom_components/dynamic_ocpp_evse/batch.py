@@ -0,0 +1,211 @@
+"""Vectorized evaluation of the charge current calculation over many samples.
+
+Offline tool for tuning the excess export threshold, the power buffer or the
+breaker ratings against recorded meter data. It is not used by the integration
+itself, so numpy is only needed where this module is imported.
+
+Every column is a 1-D array with one entry per sample. Missing sensor readings
+are NaN, which is treated like an unavailable entity in the scalar path. The
+results are consistent with the scalar functions in calculation.py for
+the same inputs: calculate_max_evse_available, calculate_standard_mode,
+calculate_eco_mode, calculate_solar_mode and calculate_excess_mode (with the
+Excess mode selected for the whole batch).
+"""
+import numpy as np
+from .const import *
+from .calculation import EXCESS_HOLD_SECONDS
+
+# Input columns, named like the InputSnapshot fields
+BATCH_COLUMNS = (
+    "timestamp",  # seconds, monotonic
+    CONF_PHASE_A_CURRENT,
+    CONF_PHASE_B_CURRENT,
+    CONF_PHASE_C_CURRENT,
+    CONF_PHASE_E_CURRENT,
+    CONF_EVSE_CURRENT_IMPORT,
+    CONF_MAX_IMPORT_POWER,
+    CONF_PHASES,  # detected phase count per sample
+    CONF_MIN_CURRENT,
+    CONF_MAX_CURRENT,
+    CONF_POWER_BUFFER,
+    "battery_soc",
+    "battery_power",
+    "battery_soc_target",
+    "allow_grid_charging",
+)
+
+
+def _column(columns, key, size, default=np.nan):
+    """Return a column as a float64 array, filled with default when not given."""
+    if key not in columns or columns[key] is None:
+        return np.full(size, default, dtype=np.float64)
+    return np.asarray(columns[key], dtype=np.float64)
+
+
+def _or_default(values, default):
+    """Replace missing (NaN) readings with a default."""
+    return np.where(np.isnan(values), default, values)
+
+
+def _excess_hold(timestamp, trigger, refresh, excess_charge_start_time=None):
+    """Return for every sample whether the excess hold keeps charging.
+
+    Vectorized form of the hold recurrence in calculate_excess_mode: the hold
+    starts when export exceeds the threshold (trigger) and is extended by every
+    sample that would still exceed it at minimum current (refresh) while the
+    hold is active.
+    """
+    if excess_charge_start_time is not None:
+        # Treat a hold carried over from before the batch as an extra leading trigger
+        timestamp = np.concatenate(([excess_charge_start_time], timestamp))
+        trigger = np.concatenate(([True], trigger))
+        refresh = np.concatenate(([True], refresh))
+
+    # Hold events are refresh samples, chained from a trigger with gaps shorter than the hold
+    refresh_index = np.flatnonzero(refresh)
+    events = np.zeros(timestamp.size, dtype=bool)
+    if refresh_index.size:
+        refresh_time = timestamp[refresh_index]
+        position = np.arange(refresh_index.size)
+        chain_break = np.empty(refresh_index.size, dtype=bool)
+        chain_break[0] = True
+        chain_break[1:] = (refresh_time[1:] - refresh_time[:-1]) >= EXCESS_HOLD_SECONDS
+        chain_start = np.maximum.accumulate(np.where(chain_break, position, 0))
+        last_trigger = np.maximum.accumulate(np.where(trigger[refresh_index], position, -1))
+        events[refresh_index[last_trigger >= chain_start]] = True
+
+    last_event_time = np.maximum.accumulate(np.where(events, timestamp, -np.inf))
+    keep_charging = trigger | ((timestamp - last_event_time) < EXCESS_HOLD_SECONDS)
+    if excess_charge_start_time is not None:
+        keep_charging = keep_charging[1:]
+    return keep_charging
+
+
+def evaluate_batch(columns, config, excess_charge_start_time=None):
+    """Evaluate the max available current and every mode target for all samples.
+
+    columns: mapping of BATCH_COLUMNS keys to arrays, missing optional columns
+        are treated as unavailable.
+    config: the ChargerConfig, e.g. build_input_plan(data).config.
+    excess_charge_start_time: timestamp of an excess hold active before the
+        first sample, if any.
+
+    Returns a dict of float64 arrays keyed like the sensor attributes.
+    """
+    timestamp = np.asarray(columns["timestamp"], dtype=np.float64)
+    size = timestamp.size
+
+    voltage = config.phase_voltage
+    if voltage is None or isinstance(voltage, bool) or not isinstance(voltage, (int, float)):
+        voltage = 230
+    single_phase = bool(config.evse_single_phase)
+    main_breaker_rating = config.main_breaker_rating
+    evse_minimum_charge_current = config.evse_minimum_charge_current
+    evse_maximum_charge_current = config.evse_maximum_charge_current
+
+    # Charge context values, see get_charge_context_values
+    phase_a_current = _or_default(_column(columns, CONF_PHASE_A_CURRENT, size), 0)
+    phase_b_current = _or_default(_column(columns, CONF_PHASE_B_CURRENT, size), 0)
+    phase_c_current = _or_default(_column(columns, CONF_PHASE_C_CURRENT, size), 0)
+    phase_e_current = _or_default(_column(columns, CONF_PHASE_E_CURRENT, size), 0)
+    if config.invert_phases:
+        phase_a_current, phase_b_current, phase_c_current, phase_e_current = -phase_a_current, -phase_b_current, -phase_c_current, -phase_e_current
+
+    total_import_current = np.maximum(phase_a_current, 0) + np.maximum(phase_b_current, 0) + np.maximum(phase_c_current, 0)
+    phase_e_import_current = np.maximum(phase_e_current, 0)
+    total_export_current = np.maximum(-phase_a_current, 0) + np.maximum(-phase_b_current, 0) + np.maximum(-phase_c_current, 0)
+    total_export_power = total_export_current * voltage
+    evse_current_per_phase = _or_default(_column(columns, CONF_EVSE_CURRENT_IMPORT, size), 0)
+    min_current = _or_default(_column(columns, CONF_MIN_CURRENT, size), evse_minimum_charge_current)
+    max_current = _or_default(_column(columns, CONF_MAX_CURRENT, size), evse_maximum_charge_current)
+    phases = _column(columns, CONF_PHASES, size, 3)
+    allow_grid_charging = _column(columns, "allow_grid_charging", size, 1).astype(bool)
+
+    # Headroom, see calculate_headroom
+    headroom_a = main_breaker_rating - phase_a_current
+    headroom_b = main_breaker_rating - phase_b_current
+    headroom_c = main_breaker_rating - phase_c_current
+    headroom_e = main_breaker_rating - phase_e_current
+    max_import_current = _column(columns, CONF_MAX_IMPORT_POWER, size) / voltage
+    import_current = phase_e_import_current if single_phase else total_import_current
+
+    battery_soc = _column(columns, "battery_soc", size)
+    battery_soc_target = _or_default(_column(columns, "battery_soc_target", size), 0)
+    battery_power = _or_default(_column(columns, "battery_power", size), 0)
+    battery_max_discharge_power = config.battery_max_discharge_power
+    if battery_max_discharge_power is None:
+        battery_max_discharge_power = 0
+    battery_discharge_current = np.full(size, max(0, battery_max_discharge_power) / voltage)
+    battery_discharge_headroom_current = np.maximum(0, battery_max_discharge_power - battery_power) / voltage
+    battery_charge_offset_current = np.maximum(0, -battery_power) / voltage
+
+    def soc_above_target(soc_default):
+        return _or_default(battery_soc, soc_default) > battery_soc_target
+
+    def limit_to_phases(available_current):
+        # Vectorized limit_to_phases, the phase count can change from sample to sample
+        if single_phase:
+            return evse_current_per_phase + np.minimum(headroom_e, available_current)
+        return np.select(
+            [phases == 1, phases == 2, phases == 3],
+            [
+                evse_current_per_phase + np.minimum(headroom_a, available_current),
+                evse_current_per_phase + np.minimum(np.minimum(headroom_a, headroom_b), available_current / 2),
+                evse_current_per_phase + np.minimum(np.minimum(np.minimum(headroom_a, headroom_b), headroom_c), available_current / 3),
+            ],
+            default=evse_minimum_charge_current,
+        )
+
+    # calculate_max_evse_available
+    remaining_available_import_current = max_import_current - import_current
+    available_battery_current = np.where(
+        soc_above_target(0), battery_discharge_headroom_current, battery_charge_offset_current
+    )
+    max_evse_available = limit_to_phases(
+        remaining_available_import_current + total_export_current + available_battery_current
+    )
+
+    # calculate_standard_mode
+    remaining_available_import_current = np.where(allow_grid_charging, max_import_current - import_current, 0)
+    available_battery_current = np.where(
+        soc_above_target(100), battery_discharge_current, battery_charge_offset_current
+    )
+    target_evse = limit_to_phases(
+        remaining_available_import_current + total_export_current + available_battery_current
+    )
+    power_buffer = _or_default(_column(columns, CONF_POWER_BUFFER, size, 0), 0)
+    target_evse_buffered = target_evse - power_buffer / voltage
+    target_evse_standard = np.where(target_evse_buffered < min_current, target_evse, target_evse_buffered)
+
+    # calculate_solar_mode and calculate_eco_mode
+    remaining_available_import_current = np.where(allow_grid_charging, 0 - total_import_current, 0)
+    available_battery_current = np.where(
+        soc_above_target(0), battery_discharge_current, battery_charge_offset_current
+    )
+    target_evse_solar = np.maximum(
+        limit_to_phases(remaining_available_import_current + total_export_current + available_battery_current), 0
+    )
+    target_evse_eco = np.maximum(min_current, target_evse_solar)
+
+    # calculate_excess_mode
+    battery_max_charge_power = config.battery_max_charge_power
+    threshold = config.excess_export_threshold + np.where(
+        ~np.isnan(battery_soc) & (battery_soc < 100), battery_max_charge_power if battery_max_charge_power else 0, 0
+    )
+    keep_charging = _excess_hold(
+        timestamp,
+        total_export_power > threshold,
+        total_export_power + min_current * voltage > threshold,
+        excess_charge_start_time,
+    )
+    export_available_current = (total_export_power - threshold) / voltage + evse_current_per_phase
+    target_evse_excess = np.where(keep_charging, np.maximum(min_current, export_available_current), 0)
+    target_evse_excess = np.minimum(np.minimum(target_evse_excess, max_current), max_evse_available)
+
+    return {
+        "max_evse_available": max_evse_available,
+        "target_evse_standard": target_evse_standard,
+        "target_evse_eco": target_evse_eco,
+        "target_evse_solar": target_evse_solar,
+        "target_evse_excess": target_evse_excess,
+    }
@@ -0,0 +1,608 @@
+"""Charge current calculation core.
+
+Pure functions from one input snapshot to a charging decision. The snapshot
+is an InputSnapshot holding the static ChargerConfig and the input readings,
+which dynamic_ocpp_evse.py reads from the Home Assistant state machine
+through the InputPlan bindings. The control loop state that has to survive
+between ticks (ramp and excess hold) goes in and comes out as a LoopState.
+Nothing here imports Home Assistant or touches the state machine, so the
+same code runs in the integration, the replay and benchmark tools, the
+tests, an executor or a worker process.
+
+The snapshot, context and decision types are immutable NamedTuples: fields
+are read by position instead of string keys, a snapshot is a single tuple
+that is cheap to keep in a history buffer or pickle, and a derived value is
+never written back into its inputs.
+"""
+import datetime
+import logging
+from typing import NamedTuple
+
+_LOGGER = logging.getLogger(__name__)
+
+# Ramp limits of the available current
+RAMP_LIMIT_UP = 0.3  # Amps per second
+RAMP_LIMIT_DOWN = 0.6  # Amps per second, ramping down is faster
+
+# Excess mode keeps charging for this long after export last exceeded the threshold
+EXCESS_HOLD_SECONDS = 15 * 60
+
+# Phase detection from the charger phase currents
+PHASE_CURRENT_ON = 1.5  # Amps, an idle phase counts as charging above this
+PHASE_CURRENT_OFF = 0.5  # Amps, a charging phase counts as idle below this
+PHASE_DROP_SECONDS = 30  # a lower phase count is only taken over after this
+
+
+class ChargerConfig(NamedTuple):
+    """Static configuration values, compiled once from the config entry."""
+    main_breaker_rating: float = None
+    invert_phases: bool = False
+    evse_single_phase: bool = False
+    phase_voltage: float = 230
+    evse_minimum_charge_current: float = 6
+    evse_maximum_charge_current: float = 16
+    excess_export_threshold: float = 13600
+    battery_max_charge_power: float = 5000  # W
+    battery_max_discharge_power: float = 5000  # W
+
+
+class InputSnapshot(NamedTuple):
+    """Input readings of one tick.
+
+    The fields between config and stale_inputs are the InputPlan binding
+    keys in binding order, the grid inputs first so a snapshot is built
+    positionally from the shared GridSnapshot values and the charger
+    readings. Numeric readings are numbers, or None when unavailable.
+    """
+    config: ChargerConfig
+    # Grid inputs, shared by the chargers on a grid connection
+    phase_a_current: float = None  # A, positive is import unless invert_phases
+    phase_b_current: float = 0
+    phase_c_current: float = 0
+    max_import_power: float = None  # W
+    # Charger inputs
+    phases: int = None  # phase count published by our own sensor
+    charging_mode: str = None
+    phase_e_current: float = 0  # grid current of the phase a single phase EVSE is on
+    evse_current_import: float = None
+    evse_phase_currents: tuple = ()  # L1/L2/L3 currents the charger reports
+    evse_current_offered: float = None
+    min_current: float = None
+    max_current: float = None
+    battery_soc: float = None
+    battery_power: float = None
+    battery_soc_target: float = None
+    power_buffer: float = 0  # W
+    allow_grid_charging: bool = True
+    # Keys of the inputs whose entity stopped reporting, their last value is used
+    stale_inputs: tuple = ()
+
+
+class Headroom(NamedTuple):
+    """Per-tick grid and battery constraints shared by all charging modes.
+
+    Computed once per tick by calculate_headroom. Modes only apply their own
+    policy on top of it.
+    """
+    single_phase: bool  # EVSE is on a single phase of a multi-phase setup
+    phase_a: float  # remaining breaker current per phase (A)
+    phase_b: float
+    phase_c: float
+    phase_e: float
+    max_import_current: float  # import limit converted to current (A)
+    import_current: float  # import counted against the limit, EVSE phase only for a single phase EVSE (A)
+    battery_discharge_current: float  # battery discharging at max power (A)
+    battery_discharge_headroom_current: float  # discharge power left above the current battery power (A)
+    battery_charge_offset_current: float  # current freed by stopping battery charging (A)
+
+
+class ChargeContext(NamedTuple):
+    """Normalized inputs of one tick, see get_charge_context_values."""
+    snapshot: InputSnapshot
+    phases: int
+    voltage: float
+    total_import_current: float
+    phase_e_import_current: float
+    grid_phase_a_current: float
+    grid_phase_b_current: float
+    grid_phase_c_current: float
+    grid_phase_e_current: float
+    evse_current_per_phase: float
+    max_evse_available: float
+    min_current: float
+    max_current: float
+    total_export_current: float
+    total_export_power: float
+    # Battery-related fields
+    battery_soc: float = None
+    battery_power: float = None
+    battery_soc_target: float = None
+    battery_max_charge_power: float = None
+    battery_max_discharge_power: float = None
+    allow_grid_charging: bool = True
+    calc_used: str = None  # how the phase count was determined, see detect_phases
+    # Shared per-tick constraints, filled in by decide
+    headroom: Headroom = None
+
+
+def is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+def parse_number(value):
+    """Return value as a number, None if it is not one (unknown, unavailable, missing)."""
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+def calculate_headroom(context: ChargeContext):
+    """Compute the per-phase breaker, import and battery headroom once per tick."""
+    snapshot = context.snapshot
+    single_phase = snapshot.config.evse_single_phase
+    main_breaker_rating = snapshot.config.main_breaker_rating
+    max_import_current = snapshot.max_import_power / context.voltage
+
+    battery_power = context.battery_power if context.battery_power is not None else 0
+    battery_max_discharge_power = context.battery_max_discharge_power if context.battery_max_discharge_power is not None else 0
+    voltage = context.voltage
+    return Headroom(
+        single_phase=single_phase,
+        phase_a=main_breaker_rating - context.grid_phase_a_current,
+        phase_b=main_breaker_rating - context.grid_phase_b_current,
+        phase_c=main_breaker_rating - context.grid_phase_c_current,
+        phase_e=main_breaker_rating - context.grid_phase_e_current,
+        max_import_current=max_import_current,
+        # Only check the phase the EVSE is on for a single phase EVSE
+        import_current=context.phase_e_import_current if single_phase else context.total_import_current,
+        battery_discharge_current=max(0, battery_max_discharge_power) / voltage if voltage else 0,
+        battery_discharge_headroom_current=max(0, battery_max_discharge_power - battery_power) / voltage if voltage else 0,
+        # Only offset if battery is charging
+        battery_charge_offset_current=max(0, -battery_power) / voltage if voltage else 0,
+    )
+
+def get_headroom(context: ChargeContext):
+    """Return the headroom of the tick, computing it if the caller did not."""
+    if context.headroom is None:
+        return calculate_headroom(context)
+    return context.headroom
+
+def battery_soc_above_target(context: ChargeContext, soc_default):
+    """Return True if the battery may discharge, unknown SOC counts as soc_default."""
+    battery_soc = context.battery_soc if context.battery_soc is not None else soc_default
+    battery_soc_target = context.battery_soc_target if context.battery_soc_target is not None else 0
+    return battery_soc > battery_soc_target
+
+def limit_to_phases(context: ChargeContext, headroom: Headroom, available_current):
+    """Split the available pool current over the charging phases and apply the breaker headroom."""
+    if headroom.single_phase:
+        return context.evse_current_per_phase + min(
+            headroom.phase_e,
+            available_current
+        )
+    elif context.phases == 1:
+        return context.evse_current_per_phase + min(
+            headroom.phase_a,
+            available_current
+        )
+    elif context.phases == 2:
+        return context.evse_current_per_phase + min(
+            headroom.phase_a,
+            headroom.phase_b,
+            available_current / 2
+        )
+    elif context.phases == 3:
+        return context.evse_current_per_phase + min(
+            headroom.phase_a,
+            headroom.phase_b,
+            headroom.phase_c,
+            available_current / 3
+        )
+    else:
+        return context.snapshot.config.evse_minimum_charge_current
+
+def max_available_pool_current(context: ChargeContext, headroom: Headroom):
+    """Return the import, export and battery current available to the EVSE, summed over phases."""
+    remaining_available_import_current = headroom.max_import_current - headroom.import_current
+    # Only allow battery discharge if SOC > SOC target
+    if battery_soc_above_target(context, 0):
+        available_battery_current = headroom.battery_discharge_headroom_current
+    else:
+        # Only allow battery to stop charging (i.e., don't discharge below target)
+        available_battery_current = headroom.battery_charge_offset_current
+    return remaining_available_import_current + context.total_export_current + available_battery_current
+
+def calculate_max_evse_available(context: ChargeContext, headroom: Headroom = None):
+    if headroom is None:
+        headroom = get_headroom(context)
+
+    if _LOGGER.isEnabledFor(logging.DEBUG):
+        _LOGGER.debug("Calculating max EVSE available current with context: %s", context)
+        _LOGGER.debug(
+            "Max import current: %sA, Total import current: %sA, Remaining available import current: %sA",
+            headroom.max_import_current, context.total_import_current, headroom.max_import_current - headroom.import_current,
+        )
+        _LOGGER.debug(
+            "Remaining available current - Phase A: %sA, Phase B: %sA, Phase C: %sA",
+            headroom.phase_a, headroom.phase_b, headroom.phase_c,
+        )
+
+    max_evse_available = limit_to_phases(context, headroom, max_available_pool_current(context, headroom))
+    _LOGGER.debug("Max EVSE available (%s phases, single phase evse: %s): %sA", context.phases, headroom.single_phase, max_evse_available)
+    return max_evse_available
+
+
+class PhaseDetection(NamedTuple):
+    """Phase count of the last tick and the readings it was detected from, see detect_phases."""
+    phases: int = 0
+    calc_used: str = ""  # how the phase count was determined
+    currents: tuple = None  # charger phase currents the result was detected from
+    reported_phases: int = None  # phase count published by our own sensor
+    measuring: bool = False  # whether the charger offered a current
+    active: tuple = ()  # per phase, whether it counted as charging
+    measured_phases: int = 0  # phase count taken over from the currents
+    drop_since: datetime.datetime = None  # since when fewer phases are measured
+
+
+def detect_phases(detection: PhaseDetection, snapshot: InputSnapshot, now):
+    """Return the number of phases the EVSE charges on and how it was determined.
+
+    calc_used 1: from the L1/L2/L3 currents the charger reports, 2: from the
+    phase count published by our own sensor, 3: the safe default of 3 phases.
+
+    detection is the result of the previous tick, returned as is while its
+    readings did not change. A phase starts counting above PHASE_CURRENT_ON
+    and only stops below PHASE_CURRENT_OFF. More phases are taken over at
+    once, as the headroom of every phase is then checked, fewer only once
+    they were measured for PHASE_DROP_SECONDS.
+    """
+    currents = snapshot.evse_phase_currents
+    measuring = snapshot.evse_current_offered is not None
+    if (
+        detection.drop_since is None
+        and currents == detection.currents
+        and measuring == detection.measuring
+        and snapshot.phases == detection.reported_phases
+    ):
+        return detection
+
+    active = detection.active
+    measured_phases = detection.measured_phases
+    drop_since = None
+    if measuring:
+        active = tuple(
+            value > (PHASE_CURRENT_OFF if index < len(detection.active) and detection.active[index] else PHASE_CURRENT_ON)
+            for index, value in enumerate(currents)
+        )
+        count = sum(active)
+        if count >= measured_phases:
+            measured_phases = count
+        elif detection.drop_since is not None and (now - detection.drop_since).total_seconds() >= PHASE_DROP_SECONDS:
+            measured_phases = count
+        else:
+            drop_since = detection.drop_since or now
+
+    phases = measured_phases if measuring else 0
+    calc_used = f"1-{phases}" if phases else ""
+
+    # Fallback to the existing method if individual phase currents are not provided
+    if phases == 0 and snapshot.phases is not None:
+        phases = snapshot.phases
+        calc_used = f"2-{phases}"
+
+    # Finally just assume the safest case of 3 phases
+    if phases == 0:
+        phases = 3
+        calc_used = f"3-{phases}"
+    if phases != detection.phases and detection.currents is not None:
+        _LOGGER.debug("Phase count changed: %s -> %s (%s)", detection.phases, phases, calc_used)
+    return PhaseDetection(phases, calc_used, currents, snapshot.phases, measuring, active, measured_phases, drop_since)
+
+
+# functions for calculating current for different charge modes
+
+def calculate_standard_mode(context: ChargeContext):
+    headroom = get_headroom(context)
+    # If grid charging is not allowed, set available import current to 0
+    if not context.allow_grid_charging:
+        remaining_available_import_current = 0
+    else:
+        remaining_available_import_current = headroom.max_import_current - headroom.import_current
+
+    # Battery discharge logic for standard mode
+    if battery_soc_above_target(context, 100):
+        # Allow battery to discharge at max power
+        available_battery_current = headroom.battery_discharge_current
+    else:
+        # Only allow battery to stop charging (no discharge below target)
+        available_battery_current = headroom.battery_charge_offset_current
+
+    target_evse = limit_to_phases(
+        context, headroom,
+        remaining_available_import_current + context.total_export_current + available_battery_current
+    )
+
+    # Apply power buffer logic
+    # Buffer reduces target to prevent frequent charging stops
+    # If buffered target is below minimum, allow up to full target (but never exceed max_evse_available)
+    power_buffer = context.snapshot.power_buffer
+    if power_buffer is None:
+        power_buffer = 0
+    buffer_current = power_buffer / context.voltage if context.voltage else 0
+    
+    target_evse_buffered = target_evse - buffer_current
+    
+    # If buffered target is below minimum charge current, allow charging up to full target
+    # This prevents the buffer from causing unnecessary charging stops
+    if target_evse_buffered < context.min_current:
+        # Use full target (no buffer) if it allows charging at minimum rate
+        # This will be clamped by max_evse_available in calculate_available_current
+        _LOGGER.debug("Standard mode: buffered target %sA < min %sA, using full target %sA", target_evse_buffered, context.min_current, target_evse)
+        return target_evse
+    else:
+        _LOGGER.debug("Standard mode: using buffered target %sA (buffer: %sW = %sA)", target_evse_buffered, power_buffer, buffer_current)
+        return target_evse_buffered
+
+def solar_pool_current(context: ChargeContext, headroom: Headroom, target_import_current=0):
+    """Return the surplus current Solar mode may use on top of the EVSE draw, summed over phases."""
+    # If grid charging is not allowed, set available import current to 0
+    if not context.allow_grid_charging:
+        remaining_available_import_current = 0
+    else:
+        remaining_available_import_current = target_import_current - context.total_import_current
+
+    # Battery discharge logic for solar mode
+    if battery_soc_above_target(context, 0):
+        # Allow battery to discharge at max power
+        available_battery_current = headroom.battery_discharge_current
+    else:
+        # Only allow battery to stop charging (no discharge below target)
+        available_battery_current = headroom.battery_charge_offset_current
+    return remaining_available_import_current + context.total_export_current + available_battery_current
+
+def calculate_solar_mode(context: ChargeContext, target_import_current=0):
+    headroom = get_headroom(context)
+    target_evse = limit_to_phases(context, headroom, solar_pool_current(context, headroom, target_import_current))
+    return max(target_evse, 0) # Ensure non-negative current
+
+def calculate_eco_mode(context: ChargeContext):
+    target_evse = calculate_solar_mode(context)
+    target_evse = max(context.min_current, target_evse)
+    return target_evse
+
+def excess_threshold(context: ChargeContext):
+    """Return the export power (W) above which Excess mode charges."""
+    base_threshold = context.snapshot.config.excess_export_threshold
+    if context.battery_soc is not None and context.battery_soc < 100:
+        battery_max_charge_power = context.battery_max_charge_power
+    else:
+        battery_max_charge_power = 0
+    # Add battery max charge power to the threshold
+    return base_threshold + (battery_max_charge_power if battery_max_charge_power else 0)
+
+def calculate_excess_mode(context: ChargeContext, now, excess_charge_start_time=None, active=True):
+    """Calculate the Excess mode target.
+
+    Returns the target and the new start of the 15 minute excess hold. The
+    caller only keeps the new hold while Excess is the selected mode (active),
+    so the target can be previewed while another mode is selected.
+    """
+    voltage = context.voltage
+    total_export_power = context.total_export_power
+    threshold = excess_threshold(context)
+    if total_export_power > threshold:
+        if active:
+            _LOGGER.info("Excess mode: total_export_power %sW > threshold %sW, starting charge", total_export_power, threshold)
+        excess_charge_start_time = now
+    keep_charging = False
+    if excess_charge_start_time is not None and \
+       (now - excess_charge_start_time).total_seconds() < EXCESS_HOLD_SECONDS:
+        if total_export_power + context.min_current * voltage > threshold:
+            excess_charge_start_time = now
+        keep_charging = True
+    if keep_charging:
+        export_available_current = (total_export_power - threshold) / voltage + context.evse_current_per_phase
+        target_evse = max(context.min_current, export_available_current)
+    else:
+        target_evse = 0
+    target_evse = min(target_evse, context.max_current, context.max_evse_available)
+    return target_evse, excess_charge_start_time
+
+# Charging mode -> callable(context, now, excess_charge_start_time, active) returning
+# the mode target and the new excess hold start
+MODE_CALCULATORS = {
+    'Standard': lambda context, now, excess_charge_start_time, active: (calculate_standard_mode(context), excess_charge_start_time),
+    'Eco': lambda context, now, excess_charge_start_time, active: (calculate_eco_mode(context), excess_charge_start_time),
+    'Solar': lambda context, now, excess_charge_start_time, active: (calculate_solar_mode(context), excess_charge_start_time),
+    'Excess': calculate_excess_mode,
+}
+
+
+class LoopState(NamedTuple):
+    """Control loop state carried from one decision to the next."""
+    last_ramp_value: float = None
+    last_ramp_time: datetime.datetime = None
+    excess_charge_start_time: datetime.datetime = None
+    phase_detection: PhaseDetection = PhaseDetection()
+
+
+def apply_ramping(loop: LoopState, available_current, target_evse, min_current, evse_current_offered, now):
+    """Limit how fast the available current moves.
+
+    Returns the ramped current, which is also the base of the next ramp, and
+    whether the ramp limited it. The first decision starts from the current
+    the EVSE offers.
+    """
+    last_ramp_value = loop.last_ramp_value
+    ramp_limited = False
+    # Use last ramped value as base for ramping, fallback to EVSE current if None
+    if last_ramp_value is None:
+        ramped_value = evse_current_offered or available_current
+        last_ramp_value = ramped_value
+    else:
+        ramped_value = last_ramp_value
+        if ramped_value < min_current and target_evse > min_current:
+            ramped_value = min_current
+            last_ramp_value = ramped_value
+
+    if last_ramp_value is not None and loop.last_ramp_time is not None:
+        dt = (now - loop.last_ramp_time).total_seconds()
+        delta = available_current - last_ramp_value
+        if delta > 0:
+            max_delta = RAMP_LIMIT_UP * max(dt, 0.1)
+        else:
+            max_delta = RAMP_LIMIT_DOWN * max(dt, 0.1)
+        if abs(delta) > max_delta:
+            ramped_value = last_ramp_value + max_delta * (1 if delta > 0 else -1)
+            ramp_limited = True
+            _LOGGER.debug("Ramping limited: %s -> %s (requested %s)", last_ramp_value, ramped_value, available_current)
+        else:
+            ramped_value = available_current
+    return ramped_value, ramp_limited
+
+
+def get_charge_context_values(snapshot: InputSnapshot, detection: PhaseDetection = None):
+    """Normalize the snapshot, detection is the phase detection of this tick if the caller keeps one."""
+    config = snapshot.config
+    min_current = snapshot.min_current if snapshot.min_current is not None else config.evse_minimum_charge_current
+    max_current = snapshot.max_current if snapshot.max_current is not None else config.evse_maximum_charge_current
+    if detection is None:
+        detection = detect_phases(PhaseDetection(), snapshot, None)
+    phases, calc_used = detection.phases, detection.calc_used
+    voltage = config.phase_voltage if config.phase_voltage is not None and is_number(config.phase_voltage) else 230
+
+    # Unavailable phase currents count as 0
+    phase_a_current = snapshot.phase_a_current if snapshot.phase_a_current is not None else 0
+    phase_b_current = snapshot.phase_b_current if snapshot.phase_b_current is not None else 0
+    phase_c_current = snapshot.phase_c_current if snapshot.phase_c_current is not None else 0
+    # EVSE single phase current
+    phase_e_current = snapshot.phase_e_current if snapshot.phase_e_current is not None else 0
+
+    # Invert phase currents if configured
+    if config.invert_phases:
+        phase_a_current, phase_b_current, phase_c_current, phase_e_current = -phase_a_current, -phase_b_current, -phase_c_current, -phase_e_current
+
+    phase_a_import_current = max(phase_a_current, 0)
+    phase_b_import_current = max(phase_b_current, 0)
+    phase_c_import_current = max(phase_c_current, 0)
+    phase_e_import_current = max(phase_e_current, 0)
+    total_import_current = phase_a_import_current + phase_b_import_current + phase_c_import_current
+    evse_current = snapshot.evse_current_import
+
+    # Calculate total export current (sum of negative phase currents)
+    total_export_current = (
+        max(-phase_a_current, 0) +
+        max(-phase_b_current, 0) +
+        max(-phase_c_current, 0)
+    )
+    total_export_power = total_export_current * voltage
+
+    if evse_current is None:
+        evse_current = 0
+    # phases is always 1-3 at this point, so no need for additional checks
+    evse_current_per_phase = evse_current
+    return ChargeContext(
+        snapshot=snapshot,
+        phases=phases,
+        voltage=voltage,
+        total_import_current=total_import_current,
+        phase_e_import_current=phase_e_import_current,
+        grid_phase_a_current=phase_a_current,
+        grid_phase_b_current=phase_b_current,
+        grid_phase_c_current=phase_c_current,
+        grid_phase_e_current=phase_e_current,
+        evse_current_per_phase=evse_current_per_phase,
+        max_evse_available=0,  # set by decide
+        min_current=min_current,
+        max_current=max_current,
+        total_export_current=total_export_current,
+        total_export_power=total_export_power,
+        battery_soc=snapshot.battery_soc,
+        battery_power=snapshot.battery_power,
+        battery_soc_target=snapshot.battery_soc_target,
+        battery_max_charge_power=config.battery_max_charge_power,
+        battery_max_discharge_power=config.battery_max_discharge_power,
+        allow_grid_charging=snapshot.allow_grid_charging,
+        calc_used=calc_used,
+    )
+
+class Decision(NamedTuple):
+    """Result of one tick of the charge current calculation."""
+    available_current: float  # after the ramp and the EVSE min/max clamp, not rounded
+    phases: int
+    calc_used: str  # how the phase count was determined, see detect_phases
+    max_evse_available: float
+    mode_target: float  # target of the selected charging mode before any clamp
+    target_evse: float  # mode target after the max current, max available and site clamps
+    ramp_limited: bool
+    context: ChargeContext
+    loop: LoopState  # control loop state for the next decision
+
+
+def decide(snapshot: InputSnapshot, loop: LoopState, now, site_share=None):
+    """Calculate the charge current for one input snapshot.
+
+    site_share is an optional callable(context, target_evse) returning the
+    share of a grid connection shared with other chargers.
+    """
+    detection = detect_phases(loop.phase_detection, snapshot, now)
+    charge_context = get_charge_context_values(snapshot, detection)
+
+    # Per-phase headroom is computed once and shared by every mode
+    headroom = calculate_headroom(charge_context)
+    max_evse_available = calculate_max_evse_available(charge_context, headroom)
+    charge_context = charge_context._replace(max_evse_available=max_evse_available, headroom=headroom)
+
+    # Only the selected mode is evaluated
+    charging_mode = snapshot.charging_mode
+    calculate_mode = MODE_CALCULATORS.get(charging_mode)
+    if calculate_mode is None:
+        raise ValueError(f"Unknown charging mode: {charging_mode}")
+    mode_target, excess_charge_start_time = calculate_mode(charge_context, now, loop.excess_charge_start_time, True)
+
+    # Clamp target_evse to CONF_MAX_CURRENT
+    target_evse = min(mode_target, charge_context.max_current, max_evse_available)
+
+    # Take only the share of the grid the other chargers leave
+    if site_share is not None:
+        target_evse = min(target_evse, site_share(charge_context, target_evse))
+
+    # A meter that stopped reporting may hide a higher load, hold the current instead of raising it
+    if snapshot.stale_inputs and loop.last_ramp_value is not None:
+        target_evse = min(target_evse, loop.last_ramp_value)
+
+    # Clamp to available, then ramp
+    available_current, ramp_limited = apply_ramping(
+        loop,
+        min(max_evse_available, target_evse),
+        target_evse,
+        charge_context.min_current,
+        snapshot.evse_current_offered,
+        now,
+    )
+    last_ramp_value = available_current
+
+    config = snapshot.config
+    if available_current < config.evse_minimum_charge_current:
+        available_current = 0
+    if available_current > config.evse_maximum_charge_current:
+        available_current = config.evse_maximum_charge_current
+
+    return Decision(
+        available_current=available_current,
+        phases=charge_context.phases,
+        calc_used=charge_context.calc_used,
+        max_evse_available=max_evse_available,
+        mode_target=mode_target,
+        target_evse=target_evse,
+        ramp_limited=ramp_limited,
+        context=charge_context,
+        loop=LoopState(last_ramp_value, now, excess_charge_start_time, detection),
+    )
@@ -1,4 +1,3 @@
-import re
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import callback
@@ -6,6 +5,19 @@ from homeassistant.helpers.selector import selector
 from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry
 from typing import Any
 from .const import *  # Make sure DOMAIN is defined in const.py
+from .discovery import (
+    BATTERY_POWER_HINTS,
+    BATTERY_SOC_HINTS,
+    EVSE_CURRENT_IMPORT_PATTERN,
+    EVSE_CURRENT_OFFERED_PATTERN,
+    EVSE_STATUS_PATTERN,
+    MAX_IMPORT_POWER_PATTERN,
+    EntityIndex,
+    best_match,
+    rank_entities,
+    entity_select_selector,
+    unknown_entities,
+)
 
 class DynamicOcppEvseConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for Dynamic OCPP EVSE."""
@@ -15,6 +27,25 @@ class DynamicOcppEvseConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     def __init__(self):
         self._data = {}
+        self._entity_index = None
+        self._battery_candidates = None
+
+    def _get_entity_index(self):
+        """Return the entity index, built once per flow."""
+        if self._entity_index is None:
+            self._entity_index = EntityIndex.from_registry(async_get_entity_registry(self.hass))
+        return self._entity_index
+
+    def _get_battery_candidates(self):
+        """Return the ranked battery SOC and battery power candidates, built once per flow."""
+        if self._battery_candidates is None:
+            # Use states instead of entity registry to match the template behavior
+            sensors = EntityIndex.from_states(self.hass.states.async_all("sensor"))
+            self._battery_candidates = (
+                rank_entities(sensors.entity_ids("sensor", "battery"), BATTERY_SOC_HINTS),
+                rank_entities(sensors.entity_ids("sensor", "power"), BATTERY_POWER_HINTS),
+            )
+        return self._battery_candidates
 
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
@@ -26,8 +57,15 @@ class DynamicOcppEvseConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         errors: dict[str, str] = {}
         if user_input is not None:
-            self._data.update(user_input)
-            return await self.async_step_grid()
+            # Every charger needs its own entity ID
+            if any(
+                entry.data.get(CONF_ENTITY_ID) == user_input[CONF_ENTITY_ID]
+                for entry in self.hass.config_entries.async_entries(DOMAIN)
+            ):
+                errors[CONF_ENTITY_ID] = "entity_id_in_use"
+            else:
+                self._data.update(user_input)
+                return await self.async_step_grid()
 
         data_schema = vol.Schema(
             {
@@ -69,92 +107,12 @@ class DynamicOcppEvseConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             return await self.async_step_evse()
 
         try:
-            # Define pattern sets for different inverter types
-            PHASE_PATTERNS = [
-                {
-                    "name": "SolarEdge",
-                    "patterns": {
-                        "phase_a": r'sensor\..*m.*ac_current_a.*',
-                        "phase_b": r'sensor\..*m.*ac_current_b.*', 
-                        "phase_c": r'sensor\..*m.*ac_current_c.*'
-                    },
-                    "unit": "A",
-                },
-                {
-                    "name": "Solarman/Deye - external CTs",
-                    "patterns": {
-                        "phase_a": r'sensor\..*_external_ct1_current.*',
-                        "phase_b": r'sensor\..*_external_ct2_current.*',
-                        "phase_c": r'sensor\..*_external_ct3_current.*'
-                    },
-                    "unit": "A", 
-                },
-                {
-                    "name": "Solarman/Deye - internal CTs",
-                    "patterns": {
-                        "phase_a": r'sensor\..*_internal_ct1_current.*',
-                        "phase_b": r'sensor\..*_internal_ct2_current.*',
-                        "phase_c": r'sensor\..*_internal_ct3_current.*'
-                    },
-                    "unit": "A", 
-                },
-                {
-                    "name": "Solarman - grid power (individual phases)",
-                    "patterns": {
-                        "phase_a": r'sensor\..*grid_(?:1|l1|power_1|power_l1).*',
-                        "phase_b": r'sensor\..*grid_(?:2|l2|power_2|power_l2).*', 
-                        "phase_c": r'sensor\..*grid_(?:3|l3|power_3|power_l3).*'
-                    },
-                    "unit": "W", 
-                },
-                {
-                    "name": "Generic - phase currents",
-                    "patterns": {
-                        "phase_a": r'sensor\..*_current_r.*',
-                        "phase_b": r'sensor\..*_current_s.*',
-                        "phase_c": r'sensor\..*_current_t.*'
-                    },
-                    "unit": "A", 
-                }
-
-            ]
-            
-            # Fetch available entities
-            entity_registry = async_get_entity_registry(self.hass)
-            entities = entity_registry.entities
-            entity_ids = entities.keys()
-            
-            # Try to find a complete set of phases using pattern sets
-            default_phase_a = None
-            default_phase_b = None
-            default_phase_c = None
-            
-            for pattern_set in PHASE_PATTERNS:
-                phase_a_match = next((entity_id for entity_id in entity_ids if re.match(pattern_set["patterns"]["phase_a"], entity_id)), None)
-                phase_b_match = next((entity_id for entity_id in entity_ids if re.match(pattern_set["patterns"]["phase_b"], entity_id)), None)
-                phase_c_match = next((entity_id for entity_id in entity_ids if re.match(pattern_set["patterns"]["phase_c"], entity_id)), None)
-                
-                # If we found all three phases for this pattern set, use them
-                if phase_a_match and phase_b_match and phase_c_match:
-                    default_phase_a = phase_a_match
-                    default_phase_b = phase_b_match
-                    default_phase_c = phase_c_match
-                    break
-            
-            # If no complete set was found, fall back to individual pattern matching (backward compatibility)
-            if not (default_phase_a and default_phase_b and default_phase_c):
-                for pattern_set in PHASE_PATTERNS:
-                    if not default_phase_a:
-                        default_phase_a = next((entity_id for entity_id in entity_ids if re.match(pattern_set["patterns"]["phase_a"], entity_id)), None)
-                    if not default_phase_b:
-                        default_phase_b = next((entity_id for entity_id in entity_ids if re.match(pattern_set["patterns"]["phase_b"], entity_id)), None)
-                    if not default_phase_c:
-                        default_phase_c = next((entity_id for entity_id in entity_ids if re.match(pattern_set["patterns"]["phase_c"], entity_id)), None)
-            
-            # Find other default entities
-            default_evse_current_import = next((entity_id for entity_id in entity_ids if re.match(r'sensor\..*current_import.*', entity_id)), None)
-            default_evse_current_offered = next((entity_id for entity_id in entity_ids if re.match(r'sensor\..*current_offered.*', entity_id)), None)
-            default_max_import_power = next((entity_id for entity_id in entity_ids if re.match(r'sensor\..*power_limit.*', entity_id)), None)
+            # All defaults come from one pass over the entity registry
+            entity_index = self._get_entity_index()
+            default_phase_a, default_phase_b, default_phase_c = entity_index.discover_phases()
+            default_evse_current_import = entity_index.first_match(EVSE_CURRENT_IMPORT_PATTERN)
+            default_evse_current_offered = entity_index.first_match(EVSE_CURRENT_OFFERED_PATTERN)
+            default_max_import_power = entity_index.first_match(MAX_IMPORT_POWER_PATTERN)
 
             # Update the schema with the default values
             # Phase A is required, Phase B and C are optional for single-phase setups
@@ -208,6 +166,13 @@ class DynamicOcppEvseConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             CONF_CHARGE_PAUSE_DURATION: entry.data.get(CONF_CHARGE_PAUSE_DURATION, 180) if entry else 180,
             CONF_STACK_LEVEL: entry.data.get(CONF_STACK_LEVEL, 2) if entry else 2,
             CONF_UPDATE_FREQUENCY: entry.data.get(CONF_UPDATE_FREQUENCY, 5) if entry else 5,
+            CONF_EVENT_DRIVEN: entry.data.get(CONF_EVENT_DRIVEN, True) if entry else True,
+            CONF_ADAPTIVE_INTERVAL: entry.data.get(CONF_ADAPTIVE_INTERVAL, True) if entry else True,
+            CONF_DISPATCH_DEADBAND: entry.data.get(CONF_DISPATCH_DEADBAND, DEFAULT_DISPATCH_DEADBAND) if entry else DEFAULT_DISPATCH_DEADBAND,
+            CONF_DISPATCH_MIN_INTERVAL: entry.data.get(CONF_DISPATCH_MIN_INTERVAL, DEFAULT_DISPATCH_MIN_INTERVAL) if entry else DEFAULT_DISPATCH_MIN_INTERVAL,
+            CONF_EVSE_PRIORITY: entry.data.get(CONF_EVSE_PRIORITY, 0) if entry else 0,
+            CONF_CHARGER_ID: entry.data.get(CONF_CHARGER_ID, "") if entry else "",
+            CONF_EVSE_STATUS_ENTITY_ID: entry.data.get(CONF_EVSE_STATUS_ENTITY_ID, 'None') if entry else (self._get_entity_index().first_match(EVSE_STATUS_PATTERN) or 'None'),
         }
         
         data_schema = vol.Schema(
@@ -218,10 +183,17 @@ class DynamicOcppEvseConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 vol.Required(CONF_EVSE_MAXIMUM_CHARGE_CURRENT, default=initial_data[CONF_EVSE_MAXIMUM_CHARGE_CURRENT]): int,
                 vol.Required(CONF_EVSE_CURRENT_IMPORT_ENTITY_ID, default=initial_data[CONF_EVSE_CURRENT_IMPORT_ENTITY_ID]): selector({"entity": {"domain": "sensor", "device_class": "current"}}),
                 vol.Required(CONF_EVSE_CURRENT_OFFERED_ENTITY_ID, default=initial_data[CONF_EVSE_CURRENT_OFFERED_ENTITY_ID]): selector({"entity": {"domain": "sensor", "device_class": "current"}}),
+                vol.Optional(CONF_EVSE_STATUS_ENTITY_ID, default=initial_data[CONF_EVSE_STATUS_ENTITY_ID]): selector({"entity": {"domain": "sensor"}}),
                 vol.Required(CONF_OCPP_PROFILE_TIMEOUT, default=initial_data[CONF_OCPP_PROFILE_TIMEOUT]): int,
                 vol.Required(CONF_CHARGE_PAUSE_DURATION, default=initial_data[CONF_CHARGE_PAUSE_DURATION]): int,
                 vol.Required(CONF_STACK_LEVEL, default=initial_data[CONF_STACK_LEVEL]): int,
                 vol.Required(CONF_UPDATE_FREQUENCY, default=initial_data[CONF_UPDATE_FREQUENCY]): int,
+                vol.Required(CONF_EVENT_DRIVEN, default=initial_data[CONF_EVENT_DRIVEN]): bool,
+                vol.Required(CONF_ADAPTIVE_INTERVAL, default=initial_data[CONF_ADAPTIVE_INTERVAL]): bool,
+                vol.Required(CONF_DISPATCH_DEADBAND, default=initial_data[CONF_DISPATCH_DEADBAND]): vol.Coerce(float),
+                vol.Required(CONF_DISPATCH_MIN_INTERVAL, default=initial_data[CONF_DISPATCH_MIN_INTERVAL]): int,
+                vol.Required(CONF_EVSE_PRIORITY, default=initial_data[CONF_EVSE_PRIORITY]): int,
+                vol.Optional(CONF_CHARGER_ID, default=initial_data[CONF_CHARGER_ID]): str,
             }
         )
         
@@ -242,6 +214,13 @@ class DynamicOcppEvseConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         entry = self.hass.config_entries.async_get_entry(self.context["entry_id"]) if hasattr(self, 'context') and self.context.get("entry_id") else None
         if user_input is not None:
             _LOGGER.debug("async_step_battery user_input: %s", user_input)
+            # The sensors can also be entered by entity ID
+            for key in unknown_entities(
+                {key: user_input.get(key) for key in (CONF_BATTERY_SOC_ENTITY_ID, CONF_BATTERY_POWER_ENTITY_ID)},
+                self.hass.states,
+            ):
+                errors[key] = "entity_not_found"
+        if user_input is not None and not errors:
             self._data.update(user_input)
             # Per-step config entry update during reconfiguration
             if entry:
@@ -254,27 +233,13 @@ class DynamicOcppEvseConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         entry = self.hass.config_entries.async_get_entry(self.context["entry_id"]) if hasattr(self, 'context') and self.context.get("entry_id") else None
         
-        # Get all battery and power sensors for select options
-        # Use states instead of entity registry to match the template behavior
-        battery_entities = []
-        power_entities = []
-        
-        for state in self.hass.states.async_all():
-            entity_id = state.entity_id
-            if entity_id.startswith('sensor.'):
-                device_class = state.attributes.get('device_class')
-                if device_class == 'battery':
-                    battery_entities.append(entity_id)
-                elif device_class == 'power':
-                    power_entities.append(entity_id)
-        
-        battery_soc_options = ['None'] + sorted(battery_entities)
-        battery_power_options = ['None'] + sorted(power_entities)
+        # Battery and power sensors, likely battery sensors first
+        battery_soc_ranked, battery_power_ranked = self._get_battery_candidates()
         
         # Set up initial data - use entry data if available (reconfiguration), otherwise use defaults
         initial_data = {
-            CONF_BATTERY_SOC_ENTITY_ID: entry.data.get(CONF_BATTERY_SOC_ENTITY_ID) or 'None' if entry else 'None',
-            CONF_BATTERY_POWER_ENTITY_ID: entry.data.get(CONF_BATTERY_POWER_ENTITY_ID) or 'None' if entry else 'None',
+            CONF_BATTERY_SOC_ENTITY_ID: entry.data.get(CONF_BATTERY_SOC_ENTITY_ID) or 'None' if entry else best_match(battery_soc_ranked) or 'None',
+            CONF_BATTERY_POWER_ENTITY_ID: entry.data.get(CONF_BATTERY_POWER_ENTITY_ID) or 'None' if entry else best_match(battery_power_ranked) or 'None',
             CONF_BATTERY_MAX_CHARGE_POWER: entry.data.get(CONF_BATTERY_MAX_CHARGE_POWER, 5000) if entry else 5000,
             CONF_BATTERY_MAX_DISCHARGE_POWER: entry.data.get(CONF_BATTERY_MAX_DISCHARGE_POWER, 5000) if entry else 5000,
         }
@@ -282,8 +247,8 @@ class DynamicOcppEvseConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         _LOGGER.debug("async_step_battery initial_data: %s", initial_data)
         data_schema = vol.Schema(
             {
-                vol.Optional(CONF_BATTERY_SOC_ENTITY_ID, default=initial_data[CONF_BATTERY_SOC_ENTITY_ID]): selector({"select": {"options": battery_soc_options}}),
-                vol.Optional(CONF_BATTERY_POWER_ENTITY_ID, default=initial_data[CONF_BATTERY_POWER_ENTITY_ID]): selector({"select": {"options": battery_power_options}}),
+                vol.Optional(CONF_BATTERY_SOC_ENTITY_ID, default=initial_data[CONF_BATTERY_SOC_ENTITY_ID]): selector(entity_select_selector(battery_soc_ranked, initial_data[CONF_BATTERY_SOC_ENTITY_ID])),
+                vol.Optional(CONF_BATTERY_POWER_ENTITY_ID, default=initial_data[CONF_BATTERY_POWER_ENTITY_ID]): selector(entity_select_selector(battery_power_ranked, initial_data[CONF_BATTERY_POWER_ENTITY_ID])),
                 vol.Optional(CONF_BATTERY_MAX_CHARGE_POWER, default=initial_data[CONF_BATTERY_MAX_CHARGE_POWER]): int,
                 vol.Optional(CONF_BATTERY_MAX_DISCHARGE_POWER, default=initial_data[CONF_BATTERY_MAX_DISCHARGE_POWER]): int,
             }
@@ -21,6 +21,13 @@ CONF_CHARGE_PAUSE_DURATION = "charge_pause_duration"
 CONF_STACK_LEVEL = "stack_level"
 CONF_MIN_CURRENT_ENTITY_ID = "min_current_entity_id"
 CONF_MAX_CURRENT_ENTITY_ID = "max_current_entity_id"	
+CONF_EVENT_DRIVEN = "event_driven"  # Recalculate on input state changes instead of polling
+CONF_ADAPTIVE_INTERVAL = "adaptive_interval"  # Tick fast while the inputs move, back off while they are stable
+CONF_DISPATCH_DEADBAND = "dispatch_deadband"  # A, smaller limit changes are not sent to the charger
+CONF_DISPATCH_MIN_INTERVAL = "dispatch_min_interval"  # seconds between charging profiles
+CONF_EVSE_PRIORITY = "evse_priority"  # higher priority chargers are served first when several share the grid
+CONF_CHARGER_ID = "charger_id"  # OCPP charge point ID, needed when several chargers are connected
+CONF_EVSE_STATUS_ENTITY_ID = "evse_status_entity_id"  # OCPP connector status, the control loop idles while no vehicle is connected
 
 # sensor attributes
 CONF_PHASES = "phases"
@@ -48,3 +55,42 @@ CONF_BATTERY_MAX_DISCHARGE_POWER = "battery_max_discharge_power"  # W
 CONF_ALLOW_GRID_CHARGING_ENTITY_ID = "allow_grid_charging_entity_id"
 CONF_POWER_BUFFER_ENTITY_ID = "power_buffer_entity_id"
 CONF_POWER_BUFFER = "power_buffer"
+
+# Event driven update defaults
+DEFAULT_EVENT_DEBOUNCE = 0.5  # seconds, coalesces bursts of input state changes into one recalculation
+DEFAULT_HEARTBEAT_INTERVAL = 60  # seconds, fallback refresh when no input changes
+DEFAULT_GRID_SNAPSHOT_MAX_AGE = 0.5  # seconds, entries ticking within this window share one grid snapshot
+DEFAULT_STALE_INPUT_AGE = 300  # seconds, a meter that did not report for this long is stale
+
+# Adaptive update interval defaults
+DEFAULT_FAST_UPDATE_INTERVAL = 1  # seconds, while currents change, the ramp converges or a phase is near the breaker limit
+DEFAULT_STABLE_UPDATE_INTERVAL = 30  # seconds, the interval doubles up to this while charging with stable inputs
+DEFAULT_IDLE_UPDATE_INTERVAL = 60  # seconds, the interval doubles up to this while the charger draws nothing
+DEFAULT_ACTIVITY_THRESHOLD = 1.0  # A, an input moving this much since the last tick counts as activity
+DEFAULT_BREAKER_MARGIN = 2.0  # A, breaker headroom below this counts as close to the limit
+
+# Idle fast path
+EVSE_IDLE_STATUSES = ("Available", "Reserved", "Unavailable", "Faulted")  # OCPP connector states without a vehicle charging
+DEFAULT_IDLE_PREPARE_INTERVAL = 300  # seconds, the limit sent on plug-in is recalculated this often while idle
+
+# Instrumentation
+DEFAULT_METRICS_WINDOW = 256  # most recent samples the latency percentiles are taken from
+DEFAULT_METRICS_SUMMARY_INTERVAL = 10  # seconds, the percentiles are recalculated at most this often
+
+# Profile service
+DEFAULT_PROFILE_TICKS = 10  # ticks profiled when the service call does not say
+MAX_PROFILE_TICKS = 1000
+DEFAULT_PROFILE_TIMEOUT = 600  # seconds, profiling stops after this even if fewer ticks ran
+DEFAULT_PROFILE_TOP = 15  # hot functions reported
+
+# Targets of the charging modes that are not selected are only refreshed for diagnostics
+DEFAULT_MODE_DIAGNOSTICS_INTERVAL = 60  # seconds
+
+# Charging profile dispatch defaults
+DEFAULT_DISPATCH_DEADBAND = 0.5  # A
+DEFAULT_DISPATCH_MIN_INTERVAL = 10  # seconds
+DEFAULT_DISPATCH_TIMEOUT = 10  # seconds, a set_charge_rate call taking longer counts as failed
+DEFAULT_DISPATCH_RETRY_BASE = 1  # seconds, doubled after every failed attempt
+DEFAULT_DISPATCH_RETRY_MAX = 60  # seconds
+DEFAULT_DISPATCH_FAILURE_THRESHOLD = 5  # consecutive failures before the charger is considered offline
+DEFAULT_DISPATCH_BREAKER_COOLDOWN = 120  # seconds between calls while the charger is offline
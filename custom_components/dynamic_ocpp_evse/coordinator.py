@@ -0,0 +1,375 @@
+import logging
+from datetime import timedelta
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.event import async_call_later, async_track_state_change_event
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from .allocator import SiteAllocator, site_key
+from .dispatcher import ChargeRateDispatcher
+from .grid_snapshot import GridSnapshotCache
+from .profiler import TickProfiler, top_functions
+from .dynamic_ocpp_evse import EvseController
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DynamicOcppEvseCoordinator(DataUpdateCoordinator):
+    """Coordinator that owns the charge current calculation and the OCPP dispatch.
+
+    Every tick runs the calculation once, drives the charge pause timer and hands
+    the resulting limit to the dispatcher, which sends it to the charger in the
+    background. Entities only render ``coordinator.data``.
+    """
+
+    def __init__(self, hass: HomeAssistant, config_entry: ConfigEntry):
+        """Initialize the coordinator."""
+        self._update_frequency = config_entry.data.get(CONF_UPDATE_FREQUENCY, 5)  # Default to 5 seconds if not set
+        self._event_driven = config_entry.data.get(CONF_EVENT_DRIVEN, True)
+        self._adaptive_interval = config_entry.data.get(CONF_ADAPTIVE_INTERVAL, True)
+        _LOGGER.info(
+            "Initial update frequency: %s seconds, event driven: %s, adaptive: %s",
+            self._update_frequency, self._event_driven, self._adaptive_interval,
+        )
+        super().__init__(
+            hass,
+            _LOGGER,
+            name="Dynamic OCPP EVSE Coordinator",
+            update_interval=self._get_update_interval(),
+            # Refresh requests from input state changes are coalesced by the debouncer
+            request_refresh_debouncer=Debouncer(
+                hass, _LOGGER, cooldown=DEFAULT_EVENT_DEBOUNCE, immediate=False
+            ),
+        )
+        self.config_entry = config_entry
+        self._entity_id = config_entry.data[CONF_ENTITY_ID]
+        self._unsub_input_listener = None
+        self._unsub_status_listener = None
+        self._unsub_pending_dispatch = None
+        self._site_key = None
+        # The controller keeps the control loop state between ticks
+        self.controller = EvseController(hass, config_entry)
+        # Entries reading the same grid sensors share one snapshot per tick
+        self.controller.grid = hass.data.setdefault(DOMAIN, {}).setdefault("grid_snapshots", GridSnapshotCache())
+        # Armed by the profile service only
+        self.profiler = TickProfiler()
+        self._profile_done = None
+        self.dispatcher = ChargeRateDispatcher(
+            self._async_set_charge_rate,
+            on_sent=lambda limit: self.controller.mark_dispatched(),
+            latency=self.controller.metrics.dispatch,
+            # Sending awaits the charger, so it is timed instead of profiled
+            on_attempt=self.profiler.record_dispatch,
+        )
+
+    def _get_update_interval(self, data=None):
+        """Return the update interval for the configured update mode."""
+        # The controller picks the cadence from the activity of its inputs
+        if self._adaptive_interval and data is not None:
+            return timedelta(seconds=data["update_interval"])
+        ramp_limited = data is not None and data["ramp_limited"]
+        # In event driven mode inputs trigger the refresh, the interval is only a liveness heartbeat.
+        # While the ramp is still converging keep ticking at the update frequency.
+        if self._event_driven and not ramp_limited:
+            return timedelta(seconds=max(self._update_frequency, DEFAULT_HEARTBEAT_INTERVAL))
+        return timedelta(seconds=self._update_frequency)
+
+    @callback
+    def async_start_dispatcher(self):
+        """Start the charging profile dispatch worker, it is cancelled when the entry unloads."""
+        self.dispatcher.start(
+            lambda coro: self.config_entry.async_create_background_task(
+                self.hass, coro, f"{DOMAIN} {self._entity_id} dispatch"
+            )
+        )
+
+    @callback
+    def async_join_site(self):
+        """Share the grid connection with the other entries that use the same breaker and grid sensors."""
+        self.async_leave_site()
+        sites = self.hass.data[DOMAIN].setdefault("sites", {})
+        self._site_key = site_key(self.config_entry.data)
+        site = sites.setdefault(self._site_key, SiteAllocator())
+        site.add_member(
+            self.config_entry.entry_id,
+            on_reduced=self._async_site_allocation_reduced,
+            read_draw=self.controller.read_evse_draw,
+        )
+        self.controller.site = site
+        _LOGGER.debug("Joined site with %d charger(s)", len(site))
+
+    @callback
+    def async_leave_site(self):
+        """Leave the site, the remaining chargers get its capacity on their next tick."""
+        if self._site_key is None:
+            return
+        sites = self.hass.data.get(DOMAIN, {}).get("sites", {})
+        site = sites.get(self._site_key)
+        if site is not None:
+            site.remove_member(self.config_entry.entry_id)
+            if not len(site):
+                sites.pop(self._site_key)
+        self.controller.site = None
+        self._site_key = None
+
+    @callback
+    def _async_site_allocation_reduced(self):
+        """Another charger of the site took part of our share, recalculate right away."""
+        self.hass.async_create_task(self.async_request_refresh())
+
+    @callback
+    def async_subscribe_inputs(self):
+        """(Re)subscribe to state changes of the configured input entities."""
+        self.async_unsubscribe_inputs()
+        if self._event_driven:
+            input_entity_ids = self.controller.input_plan.input_entity_ids
+            _LOGGER.debug("Subscribing to input entities: %s", input_entity_ids)
+            self._unsub_input_listener = async_track_state_change_event(
+                self.hass, input_entity_ids, self._async_input_state_changed
+            )
+        # Plug-in events end the idle fast path right away, also when polling
+        status_entity_id = self.controller.input_plan.entity_ids.get(CONF_EVSE_STATUS_ENTITY_ID)
+        if status_entity_id is not None:
+            self._unsub_status_listener = async_track_state_change_event(
+                self.hass, [status_entity_id], self._async_status_changed
+            )
+
+    @callback
+    def async_unsubscribe_inputs(self):
+        """Stop listening to input state changes and cancel a scheduled dispatch."""
+        if self._unsub_input_listener is not None:
+            self._unsub_input_listener()
+            self._unsub_input_listener = None
+        if self._unsub_status_listener is not None:
+            self._unsub_status_listener()
+            self._unsub_status_listener = None
+        self._async_cancel_pending_dispatch()
+
+    @callback
+    def _async_cancel_pending_dispatch(self):
+        if self._unsub_pending_dispatch is not None:
+            self._unsub_pending_dispatch()
+            self._unsub_pending_dispatch = None
+
+    @callback
+    def _async_schedule_pending_dispatch(self, delay):
+        """Recalculate once a held back limit may be sent, in case no input changes until then."""
+        self._async_cancel_pending_dispatch()
+        self._unsub_pending_dispatch = async_call_later(self.hass, delay, self._async_pending_dispatch_due)
+
+    @callback
+    def _async_pending_dispatch_due(self, _now):
+        self._unsub_pending_dispatch = None
+        self.hass.async_create_task(self.async_request_refresh())
+
+    @callback
+    def _async_input_state_changed(self, event):
+        """Request a recalculation when one of the input entities changes."""
+        old_state = event.data.get("old_state")
+        new_state = event.data.get("new_state")
+        if (
+            old_state is not None
+            and new_state is not None
+            and old_state.state == new_state.state
+            and old_state.attributes == new_state.attributes
+        ):
+            return
+        # A snapshot holding the old reading must not be reused by any entry
+        self.controller.grid.invalidate(event.data["entity_id"])
+        self.hass.async_create_task(self.async_request_refresh())
+
+    @callback
+    def _async_status_changed(self, event):
+        """Resume full control as soon as a vehicle is plugged in."""
+        controller = self.controller
+        if controller.is_idle():
+            # Unplugged, the next tick switches to the idle fast path
+            self.hass.async_create_task(self.async_request_refresh())
+            return
+        # Send the limit prepared while idle right away, the refresh then takes over
+        limit = controller.take_prepared_limit()
+        timer_state = self.hass.states.get(f"timer.{self._entity_id}_charge_pause_timer")
+        pause_timer_active = timer_state is not None and timer_state.state == "active"
+        if limit is not None and not pause_timer_active and controller.needs_dispatch(limit):
+            _LOGGER.debug("Vehicle connected, sending prepared limit %sA", limit)
+            self.dispatcher.submit(limit)
+        self.hass.async_create_task(self.async_refresh())
+
+    async def async_update_config(self, entry: ConfigEntry):
+        """Apply a changed config entry without rebuilding the coordinator."""
+        self.config_entry = entry
+        # The input plan is only ever rebuilt here
+        self.controller.update_config(entry)
+        if site_key(entry.data) != self._site_key:
+            self.async_join_site()
+        new_update_frequency = entry.data.get(CONF_UPDATE_FREQUENCY, 5)
+        new_event_driven = entry.data.get(CONF_EVENT_DRIVEN, True)
+        new_adaptive_interval = entry.data.get(CONF_ADAPTIVE_INTERVAL, True)
+        _LOGGER.info(
+            "Detected update frequency change: %s seconds, event driven: %s, adaptive: %s",
+            new_update_frequency, new_event_driven, new_adaptive_interval,
+        )
+        if (
+            new_update_frequency != self._update_frequency
+            or new_event_driven != self._event_driven
+            or new_adaptive_interval != self._adaptive_interval
+        ):
+            self._update_frequency = new_update_frequency
+            self._event_driven = new_event_driven
+            self._adaptive_interval = new_adaptive_interval
+            # Retuned in place, the refresh below picks the adaptive interval up again
+            self.update_interval = self._get_update_interval()
+            _LOGGER.debug("Updated update_interval: %s", self.update_interval)
+        # Input entities may have changed as well
+        self.async_subscribe_inputs()
+        await self.async_request_refresh()
+
+    async def async_profile(self, ticks, top=DEFAULT_PROFILE_TOP):
+        """Profile the next ticks and write the stats to the config directory.
+
+        Returns the stats file, the hottest functions of the calculation and
+        the timing of the charging profiles sent meanwhile, once the ticks ran
+        or the profiling timeout passed.
+        """
+        if self.profiler.active:
+            raise HomeAssistantError(f"Profiling of {self._entity_id} is already running")
+        self.profiler.arm(ticks)
+        self._profile_done = self.hass.loop.create_future()
+        await self.async_request_refresh()
+        stats = await self._profile_done
+        report = {"ticks": self.profiler.ticks, "file": None, "top": [], "dispatch": self.profiler.dispatch_summary()}
+        if stats is None:
+            return report
+        report["file"] = self.hass.config.path(f"{DOMAIN}_{self._entity_id}.prof")
+        await self.hass.async_add_executor_job(stats.dump_stats, report["file"])
+        report["top"] = top_functions(stats, top)
+        _LOGGER.info(
+            "Profiled %d ticks, stats written to %s, hottest functions: %s",
+            report["ticks"], report["file"], ", ".join(row["function"] for row in report["top"][:5]),
+        )
+        return report
+
+    @callback
+    def async_cancel_profile(self):
+        """Stop profiling without a report, used when the entry unloads."""
+        self.profiler.take_stats()
+        if self._profile_done is not None:
+            self._profile_done.cancel()
+            self._profile_done = None
+
+    @callback
+    def _async_profile_finished(self):
+        done = self._profile_done
+        self._profile_done = None
+        stats = self.profiler.take_stats()
+        if done is not None and not done.done():
+            done.set_result(stats)
+
+    async def _async_update_data(self):
+        """Run a tick, report the profile once the profiled ticks ran."""
+        try:
+            return await self._async_tick()
+        finally:
+            if self.profiler.finished:
+                self._async_profile_finished()
+
+    async def _async_tick(self):
+        """Calculate the available current and send it to the charger."""
+        controller = self.controller
+        try:
+            # Only the calculation is profiled, the service calls below await other tasks
+            data = self.profiler.call(controller.calculate)
+            if data["idle"]:
+                # No vehicle connected, nothing to send until one is plugged in
+                self._async_cancel_pending_dispatch()
+                return self._finish_update(data)
+            available_current = data[CONF_AVAILABLE_CURRENT]
+
+            # Check if the state drops below 6
+            if controller.should_start_pause_timer(available_current):
+                # Start the Charge Pause Timer
+                await self.hass.services.async_call(
+                    "timer",
+                    "start",
+                    {
+                        "entity_id": f"timer.{self._entity_id}_charge_pause_timer",
+                        "duration": self.config_entry.data[CONF_CHARGE_PAUSE_DURATION]
+                    }
+                )
+
+            # Check if the timer is running
+            timer_state = self.hass.states.get(f"timer.{self._entity_id}_charge_pause_timer")
+            limit = controller.resolve_limit(
+                available_current, timer_state is not None and timer_state.state == "active"
+            )
+
+            # Only send an update if the limit changed enough, see EvseController.needs_dispatch.
+            # The dispatcher sends it without blocking the calculation.
+            if controller.needs_dispatch(limit):
+                self.dispatcher.submit(limit)
+
+            pending_delay = controller.pending_dispatch_delay()
+            if pending_delay is not None:
+                self._async_schedule_pending_dispatch(pending_delay)
+            else:
+                self._async_cancel_pending_dispatch()
+
+        except Exception as e:
+            raise UpdateFailed(f"Error updating Dynamic OCPP EVSE: {e}") from e
+
+        return self._finish_update(data)
+
+    def _finish_update(self, data):
+        """Retune the update interval and add the dispatch state to the tick result."""
+        controller = self.controller
+        self.update_interval = self._get_update_interval(data)
+        data["last_update"] = controller.last_update
+        data["pause_timer_running"] = controller.pause_timer_running
+        data["last_set_current"] = controller.last_set_current
+        data["commands_sent"] = controller.commands_sent
+        data["commands_suppressed"] = controller.commands_suppressed
+        data.update(self.dispatcher.as_dict())
+        return data
+
+    async def _async_set_charge_rate(self, limit):
+        """Send a charging profile with the given limit to the charger."""
+        # Prepare the data for the OCPP set_charge_rate service
+        # Get stackLevel from config, default to 2 if not set
+        stack_level = self.config_entry.data.get(CONF_STACK_LEVEL, 2)
+
+        charging_profile = {
+            "chargingProfileId": 11,
+            "stackLevel": stack_level,
+            "chargingProfileKind": "Relative",
+            "chargingProfilePurpose": "TxDefaultProfile",
+            "chargingSchedule": {
+                "chargingRateUnit": "A",
+                "chargingSchedulePeriod": [
+                    {
+                        "startPeriod": 0,
+                        "limit": limit
+                    }
+                ]
+            }
+        }
+
+        # Log the data being sent
+        _LOGGER.debug("Sending set_charge_rate with data: %s", charging_profile)
+
+        service_data = {
+            "custom_profile": charging_profile
+        }
+        # Address the charger when the OCPP integration manages several of them
+        charger_id = self.config_entry.data.get(CONF_CHARGER_ID)
+        if charger_id:
+            service_data["devid"] = charger_id
+
+        # Call the OCPP set_charge_rate service, blocking so the dispatcher sees failures and timeouts
+        await self.hass.services.async_call(
+            "ocpp",
+            "set_charge_rate",
+            service_data,
+            blocking=True,
+        )
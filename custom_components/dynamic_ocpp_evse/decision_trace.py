@@ -0,0 +1,148 @@
+"""Fixed-size trace of the recent charge current decisions.
+
+Every tick stores its inputs, the mode targets, the clamps, the ramp result
+and the limit sent to the charger as one row of floats in a preallocated
+array. Recording a tick reuses the same storage, so the trace can stay on
+without the cost of debug logging. Missing values are stored as NaN.
+"""
+import datetime
+import math
+from array import array
+
+# Default number of ticks kept, a few hours at the default update frequency
+DEFAULT_TRACE_CAPACITY = 4096
+
+TRACE_CHARGING_MODES = ("Standard", "Eco", "Solar", "Excess")
+
+TRACE_FIELDS = (
+    "time",  # epoch seconds
+    "charging_mode",  # index into TRACE_CHARGING_MODES
+    "phases",
+    "phase_a_current",
+    "phase_b_current",
+    "phase_c_current",
+    "phase_e_current",
+    "evse_current",
+    "total_export_power",
+    "max_import_current",
+    "battery_soc",
+    "battery_power",
+    "min_current",
+    "max_current",
+    "max_evse_available",
+    "target_evse_standard",
+    "target_evse_eco",
+    "target_evse_solar",
+    "target_evse_excess",
+    "target_evse",  # mode target after the max current and max available clamps
+    "available_current",  # after ramping and the EVSE min/max clamp
+    "ramp_limited",
+    "limit",  # limit applied after the charge pause timer
+    "limit_sent",  # limit sent to the charger on this tick
+)
+
+# Field offsets within a row
+(
+    TRACE_TIME,
+    TRACE_CHARGING_MODE,
+    TRACE_PHASES,
+    TRACE_PHASE_A_CURRENT,
+    TRACE_PHASE_B_CURRENT,
+    TRACE_PHASE_C_CURRENT,
+    TRACE_PHASE_E_CURRENT,
+    TRACE_EVSE_CURRENT,
+    TRACE_TOTAL_EXPORT_POWER,
+    TRACE_MAX_IMPORT_CURRENT,
+    TRACE_BATTERY_SOC,
+    TRACE_BATTERY_POWER,
+    TRACE_MIN_CURRENT,
+    TRACE_MAX_CURRENT,
+    TRACE_MAX_EVSE_AVAILABLE,
+    TRACE_TARGET_EVSE_STANDARD,
+    TRACE_TARGET_EVSE_ECO,
+    TRACE_TARGET_EVSE_SOLAR,
+    TRACE_TARGET_EVSE_EXCESS,
+    TRACE_TARGET_EVSE,
+    TRACE_AVAILABLE_CURRENT,
+    TRACE_RAMP_LIMITED,
+    TRACE_LIMIT,
+    TRACE_LIMIT_SENT,
+) = range(len(TRACE_FIELDS))
+
+TRACE_FIELD_COUNT = len(TRACE_FIELDS)
+
+
+class DecisionTrace:
+    """Ring buffer of tick records backed by a single array of doubles."""
+
+    __slots__ = ("capacity", "_data", "_blank", "_next", "_count", "_row")
+
+    def __init__(self, capacity=DEFAULT_TRACE_CAPACITY):
+        self.capacity = max(1, int(capacity))
+        self._blank = array("d", [math.nan]) * TRACE_FIELD_COUNT
+        self._data = self._blank * self.capacity
+        self._next = 0
+        self._count = 0
+        self._row = None
+
+    def __len__(self):
+        return self._count
+
+    def new_record(self):
+        """Start a new record, overwriting the oldest one when the trace is full."""
+        row = self._next * TRACE_FIELD_COUNT
+        self._data[row:row + TRACE_FIELD_COUNT] = self._blank
+        self._row = row
+        self._next = (self._next + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def set(self, field, value):
+        """Set a field of the current record, non-numeric values are stored as NaN."""
+        if self._row is None:
+            return
+        if value is None:
+            value = math.nan
+        try:
+            self._data[self._row + field] = value
+        except TypeError:
+            self._data[self._row + field] = math.nan
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+        self._row = None
+
+    def records(self, limit=None):
+        """Return the records oldest first as dicts keyed by TRACE_FIELDS.
+
+        Only meant for diagnostics, this is where the per-record objects are
+        created.
+        """
+        count = self._count if limit is None else max(0, min(int(limit), self._count))
+        records = []
+        for i in range(self._count - count, self._count):
+            index = (self._next - self._count + i) % self.capacity
+            row = index * TRACE_FIELD_COUNT
+            values = self._data[row:row + TRACE_FIELD_COUNT]
+            record = {}
+            for name, value in zip(TRACE_FIELDS, values):
+                record[name] = None if math.isnan(value) else value
+            if record["time"] is not None:
+                record["time"] = datetime.datetime.fromtimestamp(record["time"], tz=datetime.timezone.utc).isoformat()
+            mode = record["charging_mode"]
+            if mode is not None and 0 <= mode < len(TRACE_CHARGING_MODES):
+                record["charging_mode"] = TRACE_CHARGING_MODES[int(mode)]
+            if record["ramp_limited"] is not None:
+                record["ramp_limited"] = bool(record["ramp_limited"])
+            records.append(record)
+        return records
+
+    def as_dict(self, limit=None):
+        """Return the trace for diagnostics downloads and service responses."""
+        return {
+            "capacity": self.capacity,
+            "count": self._count,
+            "fields": list(TRACE_FIELDS),
+            "records": self.records(limit),
+        }
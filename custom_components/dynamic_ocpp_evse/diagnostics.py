@@ -0,0 +1,19 @@
+"""Diagnostics support for Dynamic OCPP EVSE."""
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from .const import *
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry):
+    """Return the config, the current targets of all modes and the recent charge current decisions."""
+    entry_data = hass.data.get(DOMAIN, {}).get(entry.entry_id) or {}
+    coordinator = entry_data.get("coordinator")
+    diagnostics = {
+        "config": dict(entry.data),
+    }
+    if coordinator is not None:
+        diagnostics["data"] = coordinator.data
+        diagnostics["metrics"] = coordinator.controller.metrics.summary()
+        diagnostics["mode_targets"] = coordinator.controller.request_mode_targets()
+        diagnostics["decision_trace"] = coordinator.controller.trace.as_dict()
+    return diagnostics
@@ -0,0 +1,204 @@
+"""Entity auto-discovery for the config flow.
+
+The patterns are compiled once at import. EntityIndex walks the entity
+registry a single time: it groups the entities by domain and device class,
+and keeps the first entity that matches each discovery pattern. All
+defaults of the form are then resolved from the index. A combined pattern
+screens out the entities that match none of the patterns with one regex
+call, so the walk does not get slower with more pattern sets.
+
+Selectors with many candidates (battery SOC and power sensors) are ranked by
+name hints, the likely ones come first and the list is cut off so it stays
+small.
+"""
+import re
+
+# Pattern sets for different inverter types, a set is used when all three phases are found
+PHASE_PATTERNS = [
+    {
+        "name": "SolarEdge",
+        "patterns": {
+            "phase_a": re.compile(r'sensor\..*m.*ac_current_a.*'),
+            "phase_b": re.compile(r'sensor\..*m.*ac_current_b.*'),
+            "phase_c": re.compile(r'sensor\..*m.*ac_current_c.*'),
+        },
+        "unit": "A",
+    },
+    {
+        "name": "Solarman/Deye - external CTs",
+        "patterns": {
+            "phase_a": re.compile(r'sensor\..*_external_ct1_current.*'),
+            "phase_b": re.compile(r'sensor\..*_external_ct2_current.*'),
+            "phase_c": re.compile(r'sensor\..*_external_ct3_current.*'),
+        },
+        "unit": "A",
+    },
+    {
+        "name": "Solarman/Deye - internal CTs",
+        "patterns": {
+            "phase_a": re.compile(r'sensor\..*_internal_ct1_current.*'),
+            "phase_b": re.compile(r'sensor\..*_internal_ct2_current.*'),
+            "phase_c": re.compile(r'sensor\..*_internal_ct3_current.*'),
+        },
+        "unit": "A",
+    },
+    {
+        "name": "Solarman - grid power (individual phases)",
+        "patterns": {
+            "phase_a": re.compile(r'sensor\..*grid_(?:1|l1|power_1|power_l1).*'),
+            "phase_b": re.compile(r'sensor\..*grid_(?:2|l2|power_2|power_l2).*'),
+            "phase_c": re.compile(r'sensor\..*grid_(?:3|l3|power_3|power_l3).*'),
+        },
+        "unit": "W",
+    },
+    {
+        "name": "Generic - phase currents",
+        "patterns": {
+            "phase_a": re.compile(r'sensor\..*_current_r.*'),
+            "phase_b": re.compile(r'sensor\..*_current_s.*'),
+            "phase_c": re.compile(r'sensor\..*_current_t.*'),
+        },
+        "unit": "A",
+    },
+]
+
+PHASES = ("phase_a", "phase_b", "phase_c")
+
+# Defaults of the other entity fields
+EVSE_CURRENT_IMPORT_PATTERN = re.compile(r'sensor\..*current_import.*')
+EVSE_CURRENT_OFFERED_PATTERN = re.compile(r'sensor\..*current_offered.*')
+MAX_IMPORT_POWER_PATTERN = re.compile(r'sensor\..*power_limit.*')
+EVSE_STATUS_PATTERN = re.compile(r'sensor\..*status_connector.*')
+
+DISCOVERY_PATTERNS = tuple(
+    pattern_set["patterns"][phase] for pattern_set in PHASE_PATTERNS for phase in PHASES
+) + (EVSE_CURRENT_IMPORT_PATTERN, EVSE_CURRENT_OFFERED_PATTERN, MAX_IMPORT_POWER_PATTERN, EVSE_STATUS_PATTERN)
+
+# Matches every entity that matches at least one of the discovery patterns
+_SCREEN_PATTERN = re.compile("|".join(f"(?:{pattern.pattern})" for pattern in DISCOVERY_PATTERNS))
+
+
+def _words(*words):
+    """Return a pattern matching any of the words as a whole part of an entity ID."""
+    return re.compile(r'(?:^|[._])(?:' + "|".join(words) + r')(?:[._]|$)')
+
+
+# (pattern, score) name hints for ranking the battery step candidates
+BATTERY_SOC_HINTS = (
+    (_words("battery", "batt", "bat"), 2),
+    (_words("soc", "state_of_charge"), 3),
+    (_words("inverter", "solaredge", "deye", "solarman", "growatt", "huawei", "goodwe", "victron", "sungrow", "fronius", "sma", "byd", "powerwall", "solax"), 1),
+    # Batteries of phones, cars and battery powered devices
+    (_words("phone", "mobile", "tablet", "watch", "remote", "button", "motion", "door", "window", "contact", "leak", "thermostat", "car", "vehicle", "ev"), -3),
+)
+BATTERY_POWER_HINTS = (
+    (_words("battery", "batt", "bat"), 3),
+    (_words("power"), 1),
+    (_words("charge", "discharge", "charging", "discharging"), 1),
+    (_words("pv", "solar", "grid", "load", "house", "consumption", "charger", "evse", "wallbox", "ocpp"), -2),
+)
+
+# A candidate scoring at least this is preselected for new entries
+STRONG_MATCH_SCORE = 4
+MAX_SELECTOR_OPTIONS = 50
+
+
+def rank_entities(entity_ids, hints):
+    """Return (score, entity_id) pairs, the best candidates first."""
+    ranked = [
+        (sum(score for pattern, score in hints if pattern.search(entity_id)), entity_id)
+        for entity_id in entity_ids
+    ]
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    return ranked
+
+
+def selector_options(ranked, selected=None, limit=MAX_SELECTOR_OPTIONS):
+    """Return the options of a select selector for ranked candidates.
+
+    'None' first, then the best candidates up to limit. The selected entity is
+    always kept, also when it ranks below the limit.
+    """
+    options = [entity_id for _, entity_id in ranked[:limit]]
+    if selected and selected != 'None' and selected not in options:
+        options.append(selected)
+    return ['None'] + options
+
+def entity_select_selector(ranked, selected=None, limit=MAX_SELECTOR_OPTIONS):
+    """Return the select selector config for ranked candidates.
+
+    Only the best candidates are listed, any other entity ID can still be
+    entered as a custom value, see unknown_entities.
+    """
+    return {"select": {"options": selector_options(ranked, selected, limit), "custom_value": True, "mode": "dropdown"}}
+
+def unknown_entities(values, states):
+    """Return the keys of values naming an entity that states does not have, 'None' is allowed."""
+    return [key for key, entity_id in values.items() if entity_id and entity_id != 'None' and states.get(entity_id) is None]
+
+
+def best_match(ranked):
+    """Return the top candidate if it is a strong match, None otherwise."""
+    if ranked and ranked[0][0] >= STRONG_MATCH_SCORE:
+        return ranked[0][1]
+    return None
+
+
+class EntityIndex:
+    """Entities grouped by domain and device class, with the first match of every discovery pattern.
+
+    Built from (entity_id, device_class) pairs in registry order.
+    """
+
+    def __init__(self, entities):
+        self._by_domain = {}
+        self._matches = {}
+        for entity_id, device_class in entities:
+            domain = entity_id.partition(".")[0]
+            self._by_domain.setdefault(domain, {}).setdefault(device_class, []).append(entity_id)
+            if _SCREEN_PATTERN.match(entity_id) is None:
+                continue
+            for pattern in DISCOVERY_PATTERNS:
+                if pattern not in self._matches and pattern.match(entity_id):
+                    self._matches[pattern] = entity_id
+
+    @classmethod
+    def from_registry(cls, entity_registry):
+        return cls(
+            (entry.entity_id, entry.device_class or entry.original_device_class)
+            for entry in entity_registry.entities.values()
+        )
+
+    @classmethod
+    def from_states(cls, states):
+        """Build the index from states, which also covers entities that are not in the registry."""
+        return cls((state.entity_id, state.attributes.get("device_class")) for state in states)
+
+    def entity_ids(self, domain, device_class=None):
+        """Return the entities of a domain, only those of device_class if given."""
+        by_device_class = self._by_domain.get(domain, {})
+        if device_class is not None:
+            return list(by_device_class.get(device_class, ()))
+        return [entity_id for entity_ids in by_device_class.values() for entity_id in entity_ids]
+
+    def first_match(self, pattern):
+        """Return the first entity matching a discovery pattern, None if there is none."""
+        return self._matches.get(pattern)
+
+    def discover_phases(self):
+        """Return the default phase A, B and C entities.
+
+        The first pattern set with all three phases wins. Otherwise every phase
+        falls back to the first pattern set that matches it.
+        """
+        for pattern_set in PHASE_PATTERNS:
+            matches = [self.first_match(pattern_set["patterns"][phase]) for phase in PHASES]
+            if all(matches):
+                return tuple(matches)
+        return tuple(
+            next(
+                (match for match in (self.first_match(pattern_set["patterns"][phase]) for pattern_set in PHASE_PATTERNS) if match),
+                None,
+            )
+            for phase in PHASES
+        )
@@ -0,0 +1,168 @@
+"""Background delivery of charging profiles to one charger.
+
+The coordinator only submits the latest limit, a worker task sends it. The
+queue holds a single value, so a limit submitted while an older one is still
+waiting replaces it. Every call is bounded by a timeout, failures are retried
+with exponential backoff, and after repeated failures a circuit breaker stops
+calling the charger until a probe call succeeds again. The calculation never
+waits for the charger.
+"""
+import asyncio
+import logging
+import time
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class ChargeRateDispatcher:
+    """Latest-value dispatch worker for one charger.
+
+    send is a coroutine function taking the limit. on_sent is called with the
+    limit after a successful send. The duration of every successful send is
+    recorded in latency, a LatencyWindow, if given. on_attempt is called with
+    the duration in seconds and the success of every call to the charger.
+    """
+
+    def __init__(
+        self,
+        send,
+        on_sent=None,
+        timeout=DEFAULT_DISPATCH_TIMEOUT,
+        retry_base=DEFAULT_DISPATCH_RETRY_BASE,
+        retry_max=DEFAULT_DISPATCH_RETRY_MAX,
+        failure_threshold=DEFAULT_DISPATCH_FAILURE_THRESHOLD,
+        breaker_cooldown=DEFAULT_DISPATCH_BREAKER_COOLDOWN,
+        latency=None,
+        on_attempt=None,
+    ):
+        self._send = send
+        self._on_sent = on_sent
+        self._timeout = timeout
+        self._retry_base = retry_base
+        self._retry_max = retry_max
+        self._failure_threshold = failure_threshold
+        self._breaker_cooldown = breaker_cooldown
+        self._latency = latency
+        self._on_attempt = on_attempt
+        self._pending = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._consecutive_failures = 0
+        self._breaker = BREAKER_CLOSED
+        self.sent = 0
+        self.failed = 0
+        self.replaced = 0
+
+    @property
+    def breaker(self):
+        return self._breaker
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, limit):
+        """Queue a limit for sending, replacing one that has not been sent yet."""
+        if self._pending is not None:
+            self.replaced += 1
+        self._pending = limit
+        self._wakeup.set()
+
+    def start(self, create_task=None):
+        """Start the worker, create_task defaults to asyncio.create_task."""
+        if self._task is None:
+            self._task = (create_task or asyncio.create_task)(self._run())
+        return self._task
+
+    async def stop(self):
+        """Cancel the worker, a pending limit is dropped."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def as_dict(self):
+        return {
+            "dispatch_breaker": self._breaker,
+            "dispatch_failures": self._consecutive_failures,
+            "dispatch_sent": self.sent,
+            "dispatch_failed": self.failed,
+        }
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending is not None:
+                limit = self._pending
+                self._pending = None
+                if await self._attempt(limit):
+                    continue
+                # Keep the newest limit, a failed one is only retried if nothing replaced it
+                if self._pending is None:
+                    self._pending = limit
+                await asyncio.sleep(self._retry_delay())
+                self._wakeup.clear()
+                if self._breaker == BREAKER_OPEN:
+                    # Probe with a single call after the cooldown
+                    self._breaker = BREAKER_HALF_OPEN
+
+    async def _attempt(self, limit):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._send(limit), self._timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._attempt_done(started, False)
+            self._record_failure(limit, f"no response within {self._timeout}s")
+            return False
+        except Exception as e:
+            self._attempt_done(started, False)
+            self._record_failure(limit, e)
+            return False
+        elapsed = self._attempt_done(started, True)
+        if self._latency is not None:
+            self._latency.record(elapsed)
+        if self._breaker != BREAKER_CLOSED:
+            _LOGGER.info("Charger is reachable again, resuming charging profile dispatch")
+        self._breaker = BREAKER_CLOSED
+        self._consecutive_failures = 0
+        self.sent += 1
+        if self._on_sent is not None:
+            self._on_sent(limit)
+        return True
+
+    def _attempt_done(self, started, ok):
+        """Return the seconds since started and report them to on_attempt."""
+        elapsed = time.perf_counter() - started
+        if self._on_attempt is not None:
+            self._on_attempt(elapsed, ok)
+        return elapsed
+
+    def _record_failure(self, limit, error):
+        self.failed += 1
+        self._consecutive_failures += 1
+        if self._breaker == BREAKER_HALF_OPEN or self._consecutive_failures >= self._failure_threshold:
+            if self._breaker == BREAKER_CLOSED:
+                _LOGGER.warning(
+                    "Failed to send charge limit %sA %d times (%s), pausing dispatch for %ss",
+                    limit, self._consecutive_failures, error, self._breaker_cooldown,
+                )
+            self._breaker = BREAKER_OPEN
+        else:
+            _LOGGER.debug("Failed to send charge limit %sA (%s), retrying", limit, error)
+
+    def _retry_delay(self):
+        """Return the seconds to wait before the next attempt."""
+        if self._breaker == BREAKER_OPEN:
+            return self._breaker_cooldown
+        return min(self._retry_base * 2 ** (self._consecutive_failures - 1), self._retry_max)
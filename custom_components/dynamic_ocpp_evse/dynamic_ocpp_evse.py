@@ -1,608 +1,782 @@
+"""Home Assistant side of the charge current calculation.
+
+Reads the input snapshot from the state machine for the pure calculation in
+calculation.py and keeps the control loop state of a config entry between
+ticks: the loop state of the calculation, the site share, the decision
+trace, the update interval and the dispatch decisions.
+"""
 import datetime
 import logging
+import time
 from .const import *  # Make sure DOMAIN is defined in const.py
+from .calculation import *
+from .decision_trace import *
+from .allocator import ChargerDemand, SiteCapacity
+from .grid_snapshot import GridSnapshotCache
+from .metrics import TickMetrics
 from dataclasses import dataclass
-import inspect
+from typing import NamedTuple
 
 _LOGGER = logging.getLogger(__name__)
 
-@dataclass
-class ChargeContext:
-    state: dict
-    phases: int
-    voltage: float
-    total_import_current: float
-    phase_e_import_current: float
-    grid_phase_a_current: float
-    grid_phase_b_current: float
-    grid_phase_c_current: float
-    grid_phase_e_current: float
-    evse_current_per_phase: float
-    max_evse_available: float
-    min_current: float
-    max_current: float
-    total_export_current: float
-    total_export_power: float
-    # Battery-related fields
-    battery_soc: float = None
-    battery_power: float = None
-    battery_soc_target: float = None
-    battery_max_charge_power: float = None
-    battery_max_discharge_power: float = None
-    allow_grid_charging: bool = True
-    allow_grid_charging_entity_id: str = None
-
-
-def is_number(value):
-    try:
-        float(value)
-        return True
-    except ValueError:
+# Seconds between repeated warnings about the same missing entity
+MISSING_ENTITY_WARNING_INTERVAL = 300
+
+
+class RateLimitedWarning:
+    """Log a warning at most once per interval for each key.
+
+    Used for inputs that stay unavailable for a while, which would otherwise
+    log the same warning on every tick. Warnings dropped in between are counted
+    and reported with the next one.
+    """
+
+    def __init__(self, logger, interval, clock=time.monotonic):
+        self._logger = logger
+        self._interval = interval
+        self._clock = clock
+        self._last_logged = {}
+        self._suppressed = {}
+
+    def __call__(self, key, msg, *args):
+        now = self._clock()
+        last_logged = self._last_logged.get(key)
+        if last_logged is not None and now - last_logged < self._interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        self._last_logged[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            self._logger.warning(msg + " (%d similar warnings suppressed)", *args, suppressed)
+        else:
+            self._logger.warning(msg, *args)
+
+
+_warn_missing_entity = RateLimitedWarning(_LOGGER, MISSING_ENTITY_WARNING_INTERVAL)
+_warn_stale_input = RateLimitedWarning(_LOGGER, MISSING_ENTITY_WARNING_INTERVAL)
+
+# Status of an input Reading
+READING_VALID = "valid"
+READING_STALE = "stale"  # last value of an entity that stopped reporting
+READING_UNAVAILABLE = "unavailable"  # entity missing, unknown, unavailable or not a number
+
+
+class Reading(NamedTuple):
+    """Typed value of one input with its status, see read_input."""
+    value: object  # a number for numeric inputs, None when unavailable
+    status: str
+    age: float = None  # seconds since the entity last reported, only for inputs with a max age
+
+@dataclass(frozen=True)
+class InputBinding:
+    """One input read on every tick, resolved from the config entry."""
+    key: str  # InputSnapshot field the value is stored in
+    entity_id: str = None  # resolved entity ID, None when not configured
+    default: object = None  # value used when the entity is not configured
+    attribute: str = None  # read this attribute instead of the entity state
+    convert: object = None  # optional callable(value, state) applied to the read value
+    trigger: bool = True  # whether a change of this entity should trigger a recalculation
+    grid: bool = False  # grid input, read once per tick for all entries through the GridSnapshotCache
+    numeric: bool = True  # parse the value as a number, None when it is not one
+    max_age: float = None  # seconds without a report after which the reading is stale
+
+
+@dataclass(frozen=True)
+class InputPlan:
+    """Inputs compiled once from the config entry data.
+
+    Holds the static configuration values and a flat list of entity bindings,
+    so a tick does not have to parse the config entry again.
+    """
+    config: ChargerConfig
+    bindings: tuple
+    entity_ids: dict  # config key -> resolved entity ID (None when not configured)
+    local_bindings: tuple = ()  # bindings read by this entry on every tick
+    grid_bindings: tuple = ()  # bindings read through the shared grid snapshot
+    grid_key: tuple = ()  # identifies the grid inputs, entries with the same key share snapshots
+
+    @property
+    def input_entity_ids(self):
+        """Entity IDs whose state changes should trigger a recalculation."""
+        entity_ids = []
+        for binding in self.bindings:
+            if binding.trigger and binding.entity_id is not None and binding.entity_id not in entity_ids:
+                entity_ids.append(binding.entity_id)
+        return entity_ids
+
+
+class EvseController:
+    """Long-lived control loop for one config entry.
+
+    Owns all state that has to survive between ticks: the ramp, the excess mode
+    hold, the charge pause timer and the last limit sent to the charger.
+    """
+
+    def __init__(self, hass, config_entry, clock=None, trace_capacity=DEFAULT_TRACE_CAPACITY):
+        self.hass = hass
+        self.config_entry = config_entry
+        # Clock used by the time dependent parts of the control loop (ramping, excess hold)
+        self.now = clock or datetime.datetime.now
+        self.input_plan = build_input_plan(config_entry.data)
+        # Parsed inputs, binding key -> (State, Reading), see read_input
+        self._readings = {}
+        # Ramp and excess mode hold, see calculation.LoopState
+        self.loop = LoopState()
+        # Diagnostic targets of the modes that are not selected
+        self._mode_targets = {}
+        self._mode_targets_time = None
+        self._mode_targets_force = False
+        # Selected mode and inputs of the last tick the targets were taken from
+        self._mode_targets_mode = None
+        self._mode_targets_context = None
+        # Charge pause timer and dispatch state
+        self._pause_timer_running = False
+        self._last_set_current = 0
+        self._last_update = datetime.datetime.min
+        self._last_dispatch_time = None
+        self._pending_limit = None
+        self._max_evse_available = None
+        self._commands_sent = 0
+        self._commands_suppressed = 0
+        self._load_dispatch_config(config_entry.data)
+        # Adaptive update interval state
+        self._update_interval = DEFAULT_FAST_UPDATE_INTERVAL
+        self._last_signals = None
+        # Idle fast path, the data of the last full tick and when it was calculated
+        self._idle_data = None
+        self._idle_prepared_at = None
+        # Recent decisions, downloadable through diagnostics
+        self.trace = DecisionTrace(trace_capacity)
+        # Tick, state read and dispatch latencies for the diagnostic sensors
+        self.metrics = TickMetrics()
+        # Grid snapshots, replaced by the cache shared by all entries when running in Home Assistant
+        self.grid = GridSnapshotCache()
+        # SiteAllocator shared with the other chargers on the same grid connection
+        self.site = None
+        self.site_member_key = getattr(config_entry, "entry_id", None)
+
+    @property
+    def last_set_current(self):
+        return self._last_set_current
+
+    @property
+    def last_update(self):
+        return self._last_update
+
+    @property
+    def pause_timer_running(self):
+        return self._pause_timer_running
+
+    @property
+    def commands_sent(self):
+        return self._commands_sent
+
+    @property
+    def commands_suppressed(self):
+        return self._commands_suppressed
+
+    @property
+    def update_interval(self):
+        """Seconds until the next tick chosen by the last tick, see adapt_update_interval."""
+        return self._update_interval
+
+    def _load_dispatch_config(self, config_data):
+        self._dispatch_deadband = config_data.get(CONF_DISPATCH_DEADBAND, DEFAULT_DISPATCH_DEADBAND)
+        self._dispatch_min_interval = config_data.get(CONF_DISPATCH_MIN_INTERVAL, DEFAULT_DISPATCH_MIN_INTERVAL)
+        self._priority = config_data.get(CONF_EVSE_PRIORITY, 0)
+        self._evse_phase_index = _evse_phase_index(config_data)
+
+    def update_config(self, config_entry):
+        """Rebuild the input plan after the config entry changed."""
+        self.config_entry = config_entry
+        self.input_plan = build_input_plan(config_entry.data)
+        self._readings = {}
+        self._load_dispatch_config(config_entry.data)
+
+    def calculate(self):
+        """Run one tick of the charge current calculation.
+
+        While the charger reports that no vehicle is connected only the status
+        is read, see idle_tick.
+        """
+        started = time.perf_counter()
+        try:
+            if self.is_idle():
+                return idle_tick(self)
+            if self._idle_prepared_at is not None:
+                # First tick after a plug-in, ramp up from the minimum current
+                self.loop = restart_ramp(self.loop, self.now())
+                self._idle_prepared_at = None
+            self._idle_data = None
+            return calculate_available_current(self)
+        except Exception:
+            self.metrics.errors += 1
+            raise
+        finally:
+            self.metrics.calculation.record(time.perf_counter() - started)
+
+    def is_idle(self):
+        """Return True if the charger status says that no vehicle is connected."""
+        entity_id = self.input_plan.entity_ids.get(CONF_EVSE_STATUS_ENTITY_ID)
+        if entity_id is None:
+            return False
+        state = self.hass.states.get(entity_id)
+        return state is not None and state.state in EVSE_IDLE_STATUSES
+
+    def take_prepared_limit(self):
+        """Return the limit calculated while idle once, None if there is none."""
+        data = self._idle_data
+        self._idle_data = None
+        if data is None:
+            return None
+        return round(data[CONF_AVAILABLE_CURRENT], 1)
+
+    def read_grid_inputs(self):
+        """Read the grid inputs for a new GridSnapshot."""
+        return read_grid_inputs(self)
+
+    def request_mode_targets(self):
+        """Recalculate the targets of all modes from the inputs of the last tick and return them.
+
+        Used by the diagnostics and the decision trace service, which should
+        not show the targets of the modes that are not selected up to
+        DEFAULT_MODE_DIAGNOSTICS_INTERVAL late.
+        """
+        if self._mode_targets_context is None:
+            return {}
+        self._mode_targets_force = True
+        charging_mode = self._mode_targets_mode
+        return dict(get_mode_targets(self, self._mode_targets_context, charging_mode, self._mode_targets[charging_mode]))
+
+    def should_start_pause_timer(self, available_current):
+        """Return True if the charge pause timer has to be started for this result."""
+        if available_current < 6 and not self._pause_timer_running:
+            self._pause_timer_running = True
+            return True
         return False
 
-def get_sensor_data(self, sensor):
-    _LOGGER.debug(f"Getting state for sensor: {sensor}")
-    state = self.hass.states.get(sensor)
-    if state is None:
-        _LOGGER.warning(f"Failed to get state for sensor: {sensor}: {inspect.stack()}")
-        return None
-    _LOGGER.debug(f"Got state for sensor: {sensor}  -  {state} ({type(state.state)})")
-    value = state.state
-    if type(value) == str:
-        if is_number(value):
-            value = float(value)
-            _LOGGER.debug(f"Sensor: {sensor}  -  {state} is ({type(value)})")
-    return value
+    def resolve_limit(self, available_current, pause_timer_active):
+        """Return the limit to apply, 0 while the charge pause timer is active."""
+        if pause_timer_active:
+            limit = 0
+        else:
+            self._pause_timer_running = False
+            limit = round(available_current, 1)
+        self.trace.set(TRACE_LIMIT, limit)
+        return limit
+
+    def needs_dispatch(self, limit):
+        """Return True and record the limit if it has to be sent to the charger now.
+
+        Changes smaller than the deadband are dropped. Other changes within the
+        minimum interval after the last profile are held back and only the
+        latest one is sent once the interval has passed. Stopping, and reducing
+        a limit the grid can no longer supply, bypass both.
+        """
+        last_set_current = self._last_set_current
+        self._pending_limit = None
+        if last_set_current == limit:
+            return False
+        now = self.now()
+        safety_reduction = limit < last_set_current and (
+            limit == 0
+            or (self._max_evse_available is not None and last_set_current > self._max_evse_available)
+        )
+        if not safety_reduction:
+            if limit != 0 and last_set_current != 0 and abs(limit - last_set_current) < self._dispatch_deadband:
+                self._commands_suppressed += 1
+                return False
+            if (
+                self._last_dispatch_time is not None
+                and (now - self._last_dispatch_time).total_seconds() < self._dispatch_min_interval
+            ):
+                # Latest wins, the limit is re-evaluated on every tick until it is sent
+                self._pending_limit = limit
+                self._commands_suppressed += 1
+                return False
+        self._last_set_current = limit
+        self._last_dispatch_time = now
+        self._commands_sent += 1
+        self.trace.set(TRACE_LIMIT_SENT, limit)
+        return True
+
+    def pending_dispatch_delay(self):
+        """Return the seconds until a held back limit may be sent, None if nothing is pending."""
+        if self._pending_limit is None or self._last_dispatch_time is None:
+            return None
+        elapsed = (self.now() - self._last_dispatch_time).total_seconds()
+        return max(0, self._dispatch_min_interval - elapsed)
+
+    def mark_dispatched(self):
+        """Record the time the last limit was sent to the charger."""
+        self._last_update = datetime.datetime.utcnow()
+        self.metrics.commands.record()
+
+    def read_evse_draw(self):
+        """Return the current per phase the charger draws right now, 0 if unknown."""
+        entity_id = self.input_plan.entity_ids.get(CONF_EVSE_CURRENT_IMPORT_ENTITY_ID)
+        value = get_sensor_data(self, entity_id, CONF_EVSE_CURRENT_IMPORT) if entity_id else None
+        return value if value is not None else 0
 
-def get_sensor_attribute(self, sensor, attribute):
+
+def get_sensor_data(self, sensor, key=None):
+    """Return the state of sensor as a number, None if it is missing or not a number."""
     state = self.hass.states.get(sensor)
-    _LOGGER.debug(f"Getting attribute '{attribute}' for sensor: {sensor}  -  {state}")
     if state is None:
-        _LOGGER.warning(f"Failed to get state for sensor: {sensor} when getting attribute '{attribute}'")
+        _warn_missing_entity(sensor, "Failed to get state for sensor: %s (input: %s)", sensor, key)
         return None
-    value = state.attributes.get(attribute)
-    if value is None:
-        _LOGGER.warning(f"Failed to get attribute '{attribute}' for sensor: {sensor}")
+    return parse_number(state.state)
+
+def get_mode_targets(self, context: ChargeContext, charging_mode, target_evse):
+    """Return the targets of all charging modes for diagnostics.
+
+    The active mode target is always current. The other modes are only
+    recalculated every DEFAULT_MODE_DIAGNOSTICS_INTERVAL seconds, after a
+    mode switch, or when EvseController.request_mode_targets() is called.
+    """
+    now = self.now()
+    self._mode_targets_context = context
+    if (
+        self._mode_targets_force
+        or charging_mode != self._mode_targets_mode
+        or self._mode_targets_time is None
+        or (now - self._mode_targets_time).total_seconds() >= DEFAULT_MODE_DIAGNOSTICS_INTERVAL
+    ):
+        excess_charge_start_time = self.loop.excess_charge_start_time
+        self._mode_targets = {
+            mode: calculate_mode(context, now, excess_charge_start_time, False)[0]
+            for mode, calculate_mode in MODE_CALCULATORS.items()
+            if mode != charging_mode
+        }
+        self._mode_targets_time = now
+        self._mode_targets_force = False
+        self._mode_targets_mode = charging_mode
+    self._mode_targets[charging_mode] = target_evse
+    return self._mode_targets
+
+def _configured_entity(config_data, key):
+    """Return the configured entity ID, or None when the option is unset or 'None'."""
+    entity_id = config_data.get(key)
+    if not entity_id or entity_id == 'None':
         return None
-    if type(value) == str:
-        if is_number(value):
-            value = float(value)
-    return value
-
-def apply_ramping(self, state, target_evse, min_current):
-        # Store last available current and time
-        if not hasattr(self, '_last_ramp_value'):
-            self._last_ramp_value = None
-        if not hasattr(self, '_last_ramp_time'):
-            self._last_ramp_time = None
-
-        ramp_limit_up = 0.3   # Amps per second (ramp up)
-        ramp_limit_down = 0.6 # Amps per second (ramp down, faster)
-        now = datetime.datetime.now()
-        
-        ramp_enabled = True
-        if ramp_enabled:
-            # Use last ramped value as base for ramping, fallback to EVSE current if None
-            if self._last_ramp_value is None or not is_number(self._last_ramp_value):
-                ramped_value = state[CONF_EVSE_CURRENT_OFFERED] or state[CONF_AVAILABLE_CURRENT]
-                self._last_ramp_value = ramped_value
-            else:
-                ramped_value = self._last_ramp_value if is_number(self._last_ramp_value) else 0
-                if ramped_value < min_current and target_evse > min_current:
-                    ramped_value = min_current
-                    self._last_ramp_value = ramped_value
-
-            if self._last_ramp_value is not None and self._last_ramp_time is not None:
-                dt = (now - self._last_ramp_time).total_seconds()
-                delta = state[CONF_AVAILABLE_CURRENT] - self._last_ramp_value
-                if delta > 0:
-                    max_delta = ramp_limit_up * max(dt, 0.1)
-                else:
-                    max_delta = ramp_limit_down * max(dt, 0.1)
-                if abs(delta) > max_delta:
-                    ramped_value = self._last_ramp_value + max_delta * (1 if delta > 0 else -1)
-                    _LOGGER.debug(f"Ramping limited: {self._last_ramp_value} -> {ramped_value} (requested {state[CONF_AVAILABLE_CURRENT]})")
-                else:
-                    ramped_value = state[CONF_AVAILABLE_CURRENT]
-            self._last_ramp_value = ramped_value
-            self._last_ramp_time = now
-            state[CONF_AVAILABLE_CURRENT] = ramped_value
-
-def calculate_max_evse_available(context: ChargeContext):
-    state = context.state
-    max_import_power = state[CONF_MAX_IMPORT_POWER]
-    max_import_current = max_import_power / context.voltage
-    
-    if state[CONF_EVSE_SINGLE_PHASE]:
-        # Only check the phase the EVSE is on
-        remaining_available_import_current = max_import_current - context.phase_e_import_current
-    else:
-        # Total import current includes EVSE import current across all 3 phases
-        # max import current is total for all phases, so we can directly compare
-        remaining_available_import_current = max_import_current - context.total_import_current
-
-    remaining_available_current_phase_a = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_a_current
-    remaining_available_current_phase_b = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_b_current
-    remaining_available_current_phase_c = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_c_current
-    remaining_available_current_phase_e = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_e_current
-    
-    _LOGGER.debug(f"Calculating max EVSE available current with context: {context}")
-    _LOGGER.debug(f"Max import current: {max_import_current}A, Total import current: {context.total_import_current}A, Remaining available import current: {remaining_available_import_current}A")
-    _LOGGER.debug(f"Remaining available current - Phase A: {remaining_available_current_phase_a}A, Phase B: {remaining_available_current_phase_b}A, Phase C: {remaining_available_current_phase_c}A")
-
-    # Battery discharge logic
-    battery_power = context.battery_power if context.battery_power is not None else 0
-    battery_max_discharge_power = context.battery_max_discharge_power if context.battery_max_discharge_power is not None else 0
-    battery_soc = context.battery_soc if context.battery_soc is not None else 0
-    battery_soc_target = context.battery_soc_target if context.battery_soc_target is not None else 0
-
-    # Only allow battery discharge if SOC > SOC target
-    if battery_soc > battery_soc_target:
-        available_battery_power = max(0, battery_max_discharge_power - battery_power)
-    else:
-        # Only allow battery to stop charging (i.e., don't discharge below target)
-        available_battery_power = max(0, -battery_power)  # Only offset if battery is charging
-    available_battery_current = (available_battery_power / context.voltage) if context.voltage else 0
-    
-    if state[CONF_EVSE_SINGLE_PHASE]:
-        max_evse_available = context.evse_current_per_phase + min(
-            remaining_available_current_phase_e,
-            remaining_available_import_current + context.total_export_current + available_battery_current
-        )
-        _LOGGER.debug(f"Max EVSE available (single phase evse): {max_evse_available}A")
-        return max_evse_available
-    elif context.phases == 1:
-        max_evse_available = context.evse_current_per_phase + min(
-            remaining_available_current_phase_a,
-            remaining_available_import_current + context.total_export_current + available_battery_current
-        )
-        _LOGGER.debug(f"Max EVSE available (1 phase): {max_evse_available}A")
-        return max_evse_available
-    elif context.phases == 2:
-        max_evse_available =  context.evse_current_per_phase + min(
-            remaining_available_current_phase_a,
-            remaining_available_current_phase_b,
-            (remaining_available_import_current + context.total_export_current + available_battery_current) / 2
-        )
-        _LOGGER.debug(f"Max EVSE available (2 phases): {max_evse_available}A")
-        return max_evse_available
-    elif context.phases == 3:
-        max_evse_available =  context.evse_current_per_phase + min(
-            remaining_available_current_phase_a,
-            remaining_available_current_phase_b,
-            remaining_available_current_phase_c,
-            (remaining_available_import_current + context.total_export_current + available_battery_current) / 3
-        )
-        _LOGGER.debug(f"Max EVSE available (3 phases): {max_evse_available}A")
-        return max_evse_available
-    else:
-        return state.get(CONF_EVSE_MINIMUM_CHARGE_CURRENT)
-
-def determine_phases(self, state):
-    phases = 0
-    calc_used = ""
-    
-    if state[CONF_EVSE_CURRENT_OFFERED] is not None:
-        evse_attributes = self.hass.states.get(self.config_entry.data.get(CONF_EVSE_CURRENT_IMPORT_ENTITY_ID)).attributes
-        for attr, value in evse_attributes.items():
-            if attr.startswith('L') and is_number(value) and float(value) > 1:
-                phases += 1
-        if phases > 0:
-            calc_used = f"1-{phases}"
-
-    # Fallback to the existing method if individual phase currents are not provided
-    if phases == 0 and state[CONF_PHASES] is not None and is_number(state[CONF_PHASES]):
-        phases = state[CONF_PHASES]
-        calc_used = f"2-{phases}"
-
-    # Finally just assume the safest case of 3 phases
-    if phases == 0:
-        phases = 3
-        calc_used = f"3-{phases}"
-    return phases, calc_used
-
-
-# functions for calculating current for different charge modes
-
-def calculate_standard_mode(context: ChargeContext):
-    state = context.state
-    max_import_power = state[CONF_MAX_IMPORT_POWER]
-    max_import_current = max_import_power / context.voltage
-    target_import_current = max_import_current
-    # If grid charging is not allowed, set available import current to 0
-    if not context.allow_grid_charging:
-        remaining_available_import_current = 0
-    elif state[CONF_EVSE_SINGLE_PHASE]:
-        # Only check the phase the EVSE is on
-        remaining_available_import_current = target_import_current - context.phase_e_import_current
-    else:
-        remaining_available_import_current = target_import_current - context.total_import_current
-
-    remaining_available_current_phase_a = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_a_current
-    remaining_available_current_phase_b = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_b_current
-    remaining_available_current_phase_c = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_c_current
-    remaining_available_current_phase_e = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_e_current
-
-    # Battery discharge logic for standard mode
-    battery_power = context.battery_power if context.battery_power is not None else 0
-    battery_max_discharge_power = context.battery_max_discharge_power if context.battery_max_discharge_power is not None else 0
-    battery_soc = context.battery_soc if context.battery_soc is not None else 100
-    battery_soc_target = context.battery_soc_target if context.battery_soc_target is not None else 0
-
-    if battery_soc > battery_soc_target:
-        # Allow battery to discharge at max power
-        available_battery_power = max(0, battery_max_discharge_power)
-    else:
-        # Only allow battery to stop charging (no discharge below target)
-        available_battery_power = max(0, -battery_power)  # Only offset if battery is charging
-    available_battery_current = available_battery_power / context.voltage if context.voltage else 0
-
-    if state[CONF_EVSE_SINGLE_PHASE]:
-        target_evse = context.evse_current_per_phase + min(
-            remaining_available_current_phase_e,
-            remaining_available_import_current + context.total_export_current + available_battery_current
-        )
-    elif context.phases == 1:
-        target_evse = context.evse_current_per_phase + min(
-            remaining_available_current_phase_a,
-            remaining_available_import_current + context.total_export_current + available_battery_current
-        )
-    elif context.phases == 2:
-        target_evse = context.evse_current_per_phase + min(
-            remaining_available_current_phase_a,
-            remaining_available_current_phase_b,
-            (remaining_available_import_current + context.total_export_current + available_battery_current) / 2
-        )
-    elif context.phases == 3:
-        target_evse = context.evse_current_per_phase + min(
-            remaining_available_current_phase_a,
-            remaining_available_current_phase_b,
-            remaining_available_current_phase_c,
-            (remaining_available_import_current + context.total_export_current + available_battery_current) / 3
-        )
-    else:
-        target_evse = state.get(CONF_EVSE_MINIMUM_CHARGE_CURRENT)
-
-    # Apply power buffer logic
-    # Buffer reduces target to prevent frequent charging stops
-    # If buffered target is below minimum, allow up to full target (but never exceed max_evse_available)
-    power_buffer = state.get(CONF_POWER_BUFFER, 0)
-    if power_buffer is None or not is_number(power_buffer):
-        power_buffer = 0
-    buffer_current = power_buffer / context.voltage if context.voltage else 0
-    
-    target_evse_buffered = target_evse - buffer_current
-    
-    # If buffered target is below minimum charge current, allow charging up to full target
-    # This prevents the buffer from causing unnecessary charging stops
-    if target_evse_buffered < context.min_current:
-        # Use full target (no buffer) if it allows charging at minimum rate
-        # This will be clamped by max_evse_available in calculate_available_current
-        _LOGGER.debug(f"Standard mode: buffered target {target_evse_buffered}A < min {context.min_current}A, using full target {target_evse}A")
-        return target_evse
-    else:
-        _LOGGER.debug(f"Standard mode: using buffered target {target_evse_buffered}A (buffer: {power_buffer}W = {buffer_current}A)")
-        return target_evse_buffered
-
-def calculate_solar_mode(context: ChargeContext, target_import_current=0):
-    state = context.state
-    # If grid charging is not allowed, set available import current to 0
-    if not context.allow_grid_charging:
-        remaining_available_import_current = 0
-    else:
-        remaining_available_import_current = target_import_current - context.total_import_current
-
-    remaining_available_current_phase_a = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_a_current
-    remaining_available_current_phase_b = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_b_current
-    remaining_available_current_phase_c = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_c_current
-    remaining_available_current_phase_e = state[CONF_MAIN_BREAKER_RATING] - context.grid_phase_e_current
-
-    # Battery discharge logic for solar mode
-    battery_power = context.battery_power if context.battery_power is not None else 0
-    battery_max_discharge_power = context.battery_max_discharge_power if context.battery_max_discharge_power is not None else 0
-    battery_soc = context.battery_soc if context.battery_soc is not None else 0
-    battery_soc_target = context.battery_soc_target if context.battery_soc_target is not None else 0
-
-    if battery_soc > battery_soc_target:
-        # Allow battery to discharge at max power
-        available_battery_power = max(0, battery_max_discharge_power)
-    else:
-        # Only allow battery to stop charging (no discharge below target)
-        available_battery_power = max(0, -battery_power)  # Only offset if battery is charging
-    available_battery_current = available_battery_power / context.voltage if context.voltage else 0
-
-    if state[CONF_EVSE_SINGLE_PHASE]:
-        target_evse = context.evse_current_per_phase + min(
-            remaining_available_current_phase_e,
-            remaining_available_import_current + context.total_export_current + available_battery_current
-        )
-    elif context.phases == 1:
-        target_evse = context.evse_current_per_phase + min(
-            remaining_available_current_phase_a,
-            remaining_available_import_current + context.total_export_current + available_battery_current
-        )
-    elif context.phases == 2:
-        target_evse = context.evse_current_per_phase + min(
-            remaining_available_current_phase_a,
-            remaining_available_current_phase_b,
-            (remaining_available_import_current + context.total_export_current + available_battery_current) / 2
-        )
-    elif context.phases == 3:
-        target_evse = context.evse_current_per_phase + min(
-            remaining_available_current_phase_a,
-            remaining_available_current_phase_b,
-            remaining_available_current_phase_c,
-            (remaining_available_import_current + context.total_export_current + available_battery_current) / 3
-        )
-    else:
-        target_evse = state.get(CONF_EVSE_MINIMUM_CHARGE_CURRENT)
-    return max(target_evse, 0) # Ensure non-negative current
-
-def calculate_eco_mode(context: ChargeContext):
-    target_evse = calculate_solar_mode(context)
-    target_evse = max(context.min_current, target_evse)
-    return target_evse
-
-def calculate_excess_mode(self, context: ChargeContext):
-    state = context.state
-    voltage = context.voltage
-    total_export_power = context.total_export_power
-    base_threshold = state.get(CONF_EXCESS_EXPORT_THRESHOLD, 13600)
-    if context.battery_soc is not None and context.battery_soc < 100:
-        battery_max_charge_power = state.get(CONF_BATTERY_MAX_CHARGE_POWER, 5000)
-    else:
-        battery_max_charge_power = 0
-    # Add battery max charge power to the threshold
-    threshold = base_threshold + (battery_max_charge_power if battery_max_charge_power else 0)
-    now = datetime.datetime.now()
-    if total_export_power > threshold:
-        _LOGGER.info(f"Excess mode: total_export_power {total_export_power}W > threshold {threshold}W, starting charge")
-        self._excess_charge_start_time = now
-    keep_charging = False
-    if getattr(self, '_excess_charge_start_time', None) is not None and \
-       (now - self._excess_charge_start_time).total_seconds() < 15 * 60:
-        if total_export_power + context.min_current * voltage > threshold:
-            self._excess_charge_start_time = now
-        keep_charging = True
-    if keep_charging:
-        export_available_current = (total_export_power - threshold) / voltage + context.evse_current_per_phase
-        target_evse = max(context.min_current, export_available_current)
-    else:
-        target_evse = 0
-    target_evse = min(target_evse, context.max_current, context.max_evse_available)
-    return target_evse
+    return entity_id
 
-def get_state_config(self):
-    state = {}
-    try:
-        state[CONF_PHASES] = get_sensor_attribute(self, "sensor." + self.config_entry.data.get(CONF_ENTITY_ID), CONF_PHASES)
-    except:
-        state[CONF_PHASES] = None
-    state[CONF_MAIN_BREAKER_RATING] = self.config_entry.data.get(CONF_MAIN_BREAKER_RATING)
-    state[CONF_INVERT_PHASES] = self.config_entry.data.get(CONF_INVERT_PHASES)
-    state[CONF_CHARGING_MODE] = get_sensor_data(self, self.config_entry.data.get(CONF_CHARGING_MODE_ENTITY_ID))
-    state[CONF_EVSE_SINGLE_PHASE] = self.config_entry.data.get(CONF_EVSE_SINGLE_PHASE)
-    
-    # Get phase voltage for power-to-current conversion
-    voltage = self.config_entry.data.get(CONF_PHASE_VOLTAGE, 230)
-    
-    # Helper function to convert power to current if needed
-    def get_phase_current(entity_id):
-        if not entity_id:
-            return None
-        value = get_sensor_data(self, entity_id)
-        if value is None:
-            return None
-        
+def _power_to_current(voltage):
+    """Return a converter that turns W readings into A using the phase voltage."""
+    def convert(value, state):
         # Check if this is a power sensor by looking at the entity's unit_of_measurement
-        entity_state = self.hass.states.get(entity_id)
-        if entity_state and entity_state.attributes.get('unit_of_measurement') == 'W':
+        if state is not None and value is not None and state.attributes.get('unit_of_measurement') == 'W':
             # Convert power to current: I = P / V
             return value / voltage if voltage > 0 else 0
-        else:
-            # Assume it's already current
-            return value
-    
-    state[CONF_PHASE_A_CURRENT] = get_phase_current(self.config_entry.data.get(CONF_PHASE_A_CURRENT_ENTITY_ID))
-    
-    # Phase B and C are optional for single-phase setups
-    phase_b_entity = self.config_entry.data.get(CONF_PHASE_B_CURRENT_ENTITY_ID)
-    if phase_b_entity and phase_b_entity != 'None':
-        state[CONF_PHASE_B_CURRENT] = get_phase_current(phase_b_entity)
-    else:
-        state[CONF_PHASE_B_CURRENT] = 0  # Default to 0 for single-phase setups
-    
-    phase_c_entity = self.config_entry.data.get(CONF_PHASE_C_CURRENT_ENTITY_ID)
-    if phase_c_entity and phase_c_entity != 'None':
-        state[CONF_PHASE_C_CURRENT] = get_phase_current(phase_c_entity)
-    else:
-        state[CONF_PHASE_C_CURRENT] = 0  # Default to 0 for single-phase setups
-    
-    # Single phase current for EVSE
-    phase_e_entity = self.config_entry.data.get(CONF_EVSE_SINGLE_PHASE_CURRENT_ENTITY_ID)
-    if phase_e_entity and phase_e_entity != 'None':
-        state[CONF_PHASE_E_CURRENT] = get_phase_current(phase_e_entity)
-    else:
-        state[CONF_PHASE_E_CURRENT] = 0  # Default to 0 for single-phase setups
-
-    state[CONF_EVSE_CURRENT_IMPORT] = get_sensor_data(self, self.config_entry.data.get(CONF_EVSE_CURRENT_IMPORT_ENTITY_ID))
-    state[CONF_EVSE_CURRENT_OFFERED] = get_sensor_data(self, self.config_entry.data.get(CONF_EVSE_CURRENT_OFFERED_ENTITY_ID))
-    state[CONF_MAX_IMPORT_POWER] = get_sensor_data(self, self.config_entry.data.get(CONF_MAX_IMPORT_POWER_ENTITY_ID))
-    state[CONF_PHASE_VOLTAGE] = voltage
-    state[CONF_EVSE_MINIMUM_CHARGE_CURRENT] = self.config_entry.data.get(CONF_EVSE_MINIMUM_CHARGE_CURRENT, 6)
-    state[CONF_EVSE_MAXIMUM_CHARGE_CURRENT] = self.config_entry.data.get(CONF_EVSE_MAXIMUM_CHARGE_CURRENT, 16)
-    state[CONF_MIN_CURRENT] = get_sensor_data(self, self.config_entry.data.get(CONF_MIN_CURRENT_ENTITY_ID))
-    state[CONF_MAX_CURRENT] = get_sensor_data(self, self.config_entry.data.get(CONF_MAX_CURRENT_ENTITY_ID))
-    state[CONF_EXCESS_EXPORT_THRESHOLD] = self.config_entry.data.get(CONF_EXCESS_EXPORT_THRESHOLD, 13600)
-    
-    # Read battery values if entities are set
-    battery_soc_entity_id = self.config_entry.data.get(CONF_BATTERY_SOC_ENTITY_ID)
-    if battery_soc_entity_id != 'None':
-        state["battery_soc"] = get_sensor_data(self, battery_soc_entity_id)
-    else:
-        state["battery_soc"] = None
+        # Assume it's already current
+        return value
+    return convert
+
+def _switch_is_on(value, state):
+    return value == "on" if value else True  # Default to True
+
+class PhaseAttributeCurrents:
+    """Converter returning the numeric L1/L2/L3 currents the charger reports as attributes.
+
+    The attributes are only parsed again when the state carries a new
+    attributes object. Home Assistant keeps the object while only the state
+    changes, so the phase detection sees the same readings until the
+    charger reports new phase currents.
+    """
+
+    def __init__(self):
+        self._attributes = None
+        self._currents = ()
+
+    def __call__(self, value, state):
+        if state is None:
+            return ()
+        attributes = state.attributes
+        if attributes is not self._attributes:
+            self._attributes = attributes
+            currents = (parse_number(value) for attr, value in attributes.items() if attr.startswith('L'))
+            self._currents = tuple(current for current in currents if current is not None)
+        return self._currents
+
+def build_input_plan(config_data):
+    """Compile the config entry data into an InputPlan.
+
+    Called when the config entry is loaded or changed, never on the hot path.
+    """
+    # Get phase voltage for power-to-current conversion
+    voltage = config_data.get(CONF_PHASE_VOLTAGE, 230)
+    config = ChargerConfig(
+        main_breaker_rating=config_data.get(CONF_MAIN_BREAKER_RATING),
+        invert_phases=config_data.get(CONF_INVERT_PHASES),
+        evse_single_phase=config_data.get(CONF_EVSE_SINGLE_PHASE),
+        phase_voltage=voltage,
+        evse_minimum_charge_current=config_data.get(CONF_EVSE_MINIMUM_CHARGE_CURRENT, 6),
+        evse_maximum_charge_current=config_data.get(CONF_EVSE_MAXIMUM_CHARGE_CURRENT, 16),
+        excess_export_threshold=config_data.get(CONF_EXCESS_EXPORT_THRESHOLD, 13600),
+        battery_max_charge_power=config_data.get(CONF_BATTERY_MAX_CHARGE_POWER, 5000),
+        battery_max_discharge_power=config_data.get(CONF_BATTERY_MAX_DISCHARGE_POWER, 5000),
+    )
 
-    battery_power_entity_id = self.config_entry.data.get(CONF_BATTERY_POWER_ENTITY_ID)
-    if battery_power_entity_id != 'None':
-        state["battery_power"] = get_sensor_data(self, battery_power_entity_id)
-    else:
-        state["battery_power"] = None
+    power_to_current = _power_to_current(voltage)
+    own_entity_id = config_data.get(CONF_ENTITY_ID)
+    # In InputSnapshot field order, the grid inputs first
+    bindings = (
+        # Meter readings are stale when the meter stopped reporting
+        InputBinding(CONF_PHASE_A_CURRENT, _configured_entity(config_data, CONF_PHASE_A_CURRENT_ENTITY_ID), convert=power_to_current, grid=True, max_age=DEFAULT_STALE_INPUT_AGE),
+        # Phase B, C and the EVSE phase are optional, default to 0 for single-phase setups
+        InputBinding(CONF_PHASE_B_CURRENT, _configured_entity(config_data, CONF_PHASE_B_CURRENT_ENTITY_ID), default=0, convert=power_to_current, grid=True, max_age=DEFAULT_STALE_INPUT_AGE),
+        InputBinding(CONF_PHASE_C_CURRENT, _configured_entity(config_data, CONF_PHASE_C_CURRENT_ENTITY_ID), default=0, convert=power_to_current, grid=True, max_age=DEFAULT_STALE_INPUT_AGE),
+        InputBinding(CONF_MAX_IMPORT_POWER, _configured_entity(config_data, CONF_MAX_IMPORT_POWER_ENTITY_ID), grid=True),
+        # Phase count published by our own sensor, never a trigger to avoid a feedback loop
+        InputBinding(CONF_PHASES, f"sensor.{own_entity_id}" if own_entity_id else None, attribute=CONF_PHASES, trigger=False),
+        InputBinding(CONF_CHARGING_MODE, _configured_entity(config_data, CONF_CHARGING_MODE_ENTITY_ID), numeric=False),
+        InputBinding(CONF_PHASE_E_CURRENT, _configured_entity(config_data, CONF_EVSE_SINGLE_PHASE_CURRENT_ENTITY_ID), default=0, convert=power_to_current, max_age=DEFAULT_STALE_INPUT_AGE),
+        InputBinding(CONF_EVSE_CURRENT_IMPORT, _configured_entity(config_data, CONF_EVSE_CURRENT_IMPORT_ENTITY_ID)),
+        # Per phase currents of the charger, used to detect the number of charging phases
+        InputBinding("evse_phase_currents", _configured_entity(config_data, CONF_EVSE_CURRENT_IMPORT_ENTITY_ID), default=(), convert=PhaseAttributeCurrents(), numeric=False),
+        InputBinding(CONF_EVSE_CURRENT_OFFERED, _configured_entity(config_data, CONF_EVSE_CURRENT_OFFERED_ENTITY_ID)),
+        InputBinding(CONF_MIN_CURRENT, _configured_entity(config_data, CONF_MIN_CURRENT_ENTITY_ID)),
+        InputBinding(CONF_MAX_CURRENT, _configured_entity(config_data, CONF_MAX_CURRENT_ENTITY_ID)),
+        # Battery values are only read if the entities are set
+        InputBinding("battery_soc", _configured_entity(config_data, CONF_BATTERY_SOC_ENTITY_ID)),
+        InputBinding("battery_power", _configured_entity(config_data, CONF_BATTERY_POWER_ENTITY_ID)),
+        InputBinding("battery_soc_target", _configured_entity(config_data, CONF_BATTERY_SOC_TARGET_ENTITY_ID)),
+        InputBinding(CONF_POWER_BUFFER, _configured_entity(config_data, CONF_POWER_BUFFER_ENTITY_ID), default=0),
+        InputBinding("allow_grid_charging", _configured_entity(config_data, CONF_ALLOW_GRID_CHARGING_ENTITY_ID), default=True, convert=_switch_is_on, numeric=False),
+    )
+    entity_ids = {
+        key: _configured_entity(config_data, key)
+        for key in (
+            CONF_PHASE_A_CURRENT_ENTITY_ID,
+            CONF_PHASE_B_CURRENT_ENTITY_ID,
+            CONF_PHASE_C_CURRENT_ENTITY_ID,
+            CONF_EVSE_SINGLE_PHASE_CURRENT_ENTITY_ID,
+            CONF_EVSE_CURRENT_IMPORT_ENTITY_ID,
+            CONF_EVSE_CURRENT_OFFERED_ENTITY_ID,
+            CONF_MAX_IMPORT_POWER_ENTITY_ID,
+            CONF_EVSE_STATUS_ENTITY_ID,
+        )
+    }
+    grid_bindings = tuple(binding for binding in bindings if binding.grid)
+    return InputPlan(
+        config=config,
+        bindings=bindings,
+        entity_ids=entity_ids,
+        local_bindings=tuple(binding for binding in bindings if not binding.grid),
+        grid_bindings=grid_bindings,
+        # The voltage is part of the key because it changes the W to A conversion
+        grid_key=(voltage,) + tuple((binding.key, binding.entity_id, binding.default) for binding in grid_bindings),
+    )
 
-    battery_soc_target_entity_id = self.config_entry.data.get(CONF_BATTERY_SOC_TARGET_ENTITY_ID)
-    if battery_soc_target_entity_id != 'None':
-        state["battery_soc_target"] = get_sensor_data(self, battery_soc_target_entity_id)
+def parse_input(binding, state):
+    """Parse and convert the value of a bound input from its State."""
+    if binding.attribute is None:
+        value = state.state
     else:
-        state["battery_soc_target"] = None
+        value = state.attributes.get(binding.attribute)
+        if value is None:
+            _warn_missing_entity((binding.entity_id, binding.attribute), "Failed to get attribute '%s' for sensor: %s", binding.attribute, binding.entity_id)
+    if binding.numeric:
+        value = parse_number(value)
+    if binding.convert is not None:
+        value = binding.convert(value, state)
+    _LOGGER.debug("Parsed input %s from %s: %s", binding.key, binding.entity_id, value)
+    return value
+
+def read_input(self, binding, now):
+    """Read one bound input from the state machine as a Reading.
+
+    The value is parsed once per State object and cached. Home Assistant
+    replaces the State whenever last_updated changes, so an unchanged entity
+    costs an identity check. now is the POSIX timestamp of the tick, inputs
+    with a max age are stale when the entity did not report for longer. That
+    is only known from last_reported, Home Assistant 2024.3 and later.
+    """
+    if binding.entity_id is None:
+        return Reading(binding.default, READING_VALID)
+    state = self.hass.states.get(binding.entity_id)
+    if state is None:
+        _warn_missing_entity(binding.entity_id, "Failed to get state for sensor: %s (input: %s)", binding.entity_id, binding.key)
+        return Reading(binding.convert(None, None) if binding.convert is not None else None, READING_UNAVAILABLE)
+    cached = self._readings.get(binding.key)
+    if cached is None or cached[0] is not state:
+        value = parse_input(binding, state)
+        cached = self._readings[binding.key] = (state, Reading(value, READING_VALID if value is not None else READING_UNAVAILABLE))
+    reading = cached[1]
+    if binding.max_age is None or reading.value is None:
+        return reading
+    value = reading.value
+    # last_reported also moves when the entity reports an unchanged value. Before
+    # Home Assistant 2024.3 there is only last_updated, which stays put while a
+    # steady meter keeps reporting the same value, so the age is not known.
+    reported = getattr(state, "last_reported", None)
+    if reported is None:
+        return Reading(value, READING_VALID)
+    age = now - reported.timestamp()
+    if age > binding.max_age:
+        _warn_stale_input(binding.entity_id, "Input %s (%s) did not report for %.0f s, holding the current", binding.key, binding.entity_id, age)
+        return Reading(value, READING_STALE, age)
+    return Reading(value, READING_VALID, age)
+
+def read_inputs(self, bindings):
+    """Return the values of the bound inputs and the keys of the stale ones.
+
+    A meter that is unavailable counts as stale as well, its load is not known.
+    """
+    now = self.now().timestamp()
+    values = []
+    stale = ()
+    for binding in bindings:
+        if binding.entity_id is None:
+            values.append(binding.default)
+            continue
+        reading = read_input(self, binding, now)
+        values.append(reading.value)
+        if reading.status is READING_STALE or (binding.max_age is not None and reading.status is READING_UNAVAILABLE):
+            stale += (binding.key,)
+    return values, stale
+
+def read_grid_inputs(self):
+    """Read and normalize the grid inputs for a new GridSnapshot."""
+    values, stale = read_inputs(self, self.input_plan.grid_bindings)
+    return tuple(values), stale
 
-    state[CONF_BATTERY_MAX_CHARGE_POWER] = self.config_entry.data.get(CONF_BATTERY_MAX_CHARGE_POWER, 5000)
-    state[CONF_BATTERY_MAX_DISCHARGE_POWER] = self.config_entry.data.get(CONF_BATTERY_MAX_DISCHARGE_POWER, 5000)
+def get_state_config(self):
+    """Return the InputSnapshot of this tick."""
+    plan = self.input_plan
+    grid = self.grid.get(plan, self.now(), self.read_grid_inputs)
+    values, stale = read_inputs(self, plan.local_bindings)
+    return InputSnapshot(plan.config, *grid.values, *values, grid.stale + stale)
+
+def _evse_phase_index(config_data):
+    """Return the grid phase (0 = A, 1 = B, 2 = C) a single phase EVSE is wired to.
+
+    Matched by the grid sensor configured for the EVSE phase, phase A otherwise.
+    """
+    evse_phase_entity_id = _configured_entity(config_data, CONF_EVSE_SINGLE_PHASE_CURRENT_ENTITY_ID)
+    for index, key in enumerate((CONF_PHASE_A_CURRENT_ENTITY_ID, CONF_PHASE_B_CURRENT_ENTITY_ID, CONF_PHASE_C_CURRENT_ENTITY_ID)):
+        if evse_phase_entity_id is not None and evse_phase_entity_id == _configured_entity(config_data, key):
+            return index
+    return 0
+
+def _without_draw(value, draw):
+    return value - draw if draw and isinstance(value, (int, float)) else value
+
+def exclude_site_chargers(self, snapshot: InputSnapshot):
+    """Return the snapshot without the current drawn by the other chargers of the site.
+
+    The targets are then calculated as if this were the only charger, the site
+    allocator shares the grid between the chargers afterwards.
+    """
+    other_draw = self.site.other_draw(self.site_member_key)
+    # Grid readings are import positive unless inverted
+    sign = -1 if snapshot.config.invert_phases else 1
+    return snapshot._replace(
+        phase_a_current=_without_draw(snapshot.phase_a_current, sign * other_draw[0]),
+        phase_b_current=_without_draw(snapshot.phase_b_current, sign * other_draw[1]),
+        phase_c_current=_without_draw(snapshot.phase_c_current, sign * other_draw[2]),
+        phase_e_current=_without_draw(snapshot.phase_e_current, sign * other_draw[self._evse_phase_index]),
+    )
 
-    # Read power buffer value
-    power_buffer_entity_id = self.config_entry.data.get(CONF_POWER_BUFFER_ENTITY_ID)
-    if power_buffer_entity_id and power_buffer_entity_id != 'None':
-        state[CONF_POWER_BUFFER] = get_sensor_data(self, power_buffer_entity_id)
+def build_charger_demand(self, context: ChargeContext, target_evse):
+    """Return the demand of this charger for the site allocator."""
+    if context.headroom.single_phase:
+        phases = (self._evse_phase_index,)
     else:
-        state[CONF_POWER_BUFFER] = 0
-
-    # Retrieve the allow grid charging switch state using the constant
-    switch_state = get_sensor_data(self, self.config_entry.data.get(CONF_ALLOW_GRID_CHARGING_ENTITY_ID))
-    state["allow_grid_charging"] = switch_state == "on" if switch_state else True  # Default to True
-    return state
-
-def get_charge_context_values(self, state):
-    min_current = state[CONF_MIN_CURRENT] if state[CONF_MIN_CURRENT] is not None else state[CONF_EVSE_MINIMUM_CHARGE_CURRENT]
-    max_current = state[CONF_MAX_CURRENT] if state[CONF_MAX_CURRENT] is not None else state[CONF_EVSE_MAXIMUM_CHARGE_CURRENT]
-    phases, calc_used = determine_phases(self, state)
-    voltage = state[CONF_PHASE_VOLTAGE] if state[CONF_PHASE_VOLTAGE] is not None and is_number(state[CONF_PHASE_VOLTAGE]) else 230
-    
-    # Ensure phase current values are numeric (default to 0 if None)
-    phase_a_current = state[CONF_PHASE_A_CURRENT] if state[CONF_PHASE_A_CURRENT] is not None and is_number(state[CONF_PHASE_A_CURRENT]) else 0
-    phase_b_current = state[CONF_PHASE_B_CURRENT] if state[CONF_PHASE_B_CURRENT] is not None and is_number(state[CONF_PHASE_B_CURRENT]) else 0
-    phase_c_current = state[CONF_PHASE_C_CURRENT] if state[CONF_PHASE_C_CURRENT] is not None and is_number(state[CONF_PHASE_C_CURRENT]) else 0
-    # EVSE single phase current
-    phase_e_current = state[CONF_PHASE_E_CURRENT] if state[CONF_PHASE_E_CURRENT] is not None and is_number(state[CONF_PHASE_E_CURRENT]) else 0
-    
-    # Invert phase currents if configured
-    if state[CONF_INVERT_PHASES]:
-        phase_a_current, phase_b_current, phase_c_current, phase_e_current = -phase_a_current, -phase_b_current, -phase_c_current, -phase_e_current
-
-    grid_phase_a_current = phase_a_current
-    grid_phase_b_current = phase_b_current
-    grid_phase_c_current = phase_c_current
-    grid_phase_e_current = phase_e_current
-    phase_a_import_current = max(grid_phase_a_current, 0)
-    phase_b_import_current = max(grid_phase_b_current, 0)
-    phase_c_import_current = max(grid_phase_c_current, 0)
-    phase_e_import_current = max(grid_phase_e_current, 0)
-    total_import_current = phase_a_import_current + phase_b_import_current + phase_c_import_current
-    evse_current = state[CONF_EVSE_CURRENT_IMPORT]
-
-    # Calculate total export current (sum of negative phase currents)
-    total_export_current = (
-        max(-phase_a_current, 0) +
-        max(-phase_b_current, 0) +
-        max(-phase_c_current, 0)
-    )
-    total_export_power = total_export_current * voltage
-
-    if evse_current is None or not is_number(evse_current):
-        evse_current = 0
-    # phases is always 1-3 at this point, so no need for additional checks
-    evse_current_per_phase = evse_current
-    # Battery values
-    battery_soc = state["battery_soc"]
-    battery_power = state["battery_power"]
-    battery_soc_target = state.get("battery_soc_target")
-    battery_max_charge_power = state.get(CONF_BATTERY_MAX_CHARGE_POWER)
-    battery_max_discharge_power = state.get(CONF_BATTERY_MAX_DISCHARGE_POWER)
-    allow_grid_charging = state.get("allow_grid_charging", True)
-    allow_grid_charging_entity_id = state.get(CONF_ALLOW_GRID_CHARGING_ENTITY_ID)
-    return ChargeContext(
-        state=state,
+        phases = tuple(range(context.phases))
+    return ChargerDemand(
+        key=self.site_member_key,
         phases=phases,
-        voltage=voltage,
-        total_import_current=total_import_current,
-        phase_e_import_current=phase_e_import_current,
-        grid_phase_a_current=grid_phase_a_current,
-        grid_phase_b_current=grid_phase_b_current,
-        grid_phase_c_current=grid_phase_c_current,
-        grid_phase_e_current=grid_phase_e_current,
-        evse_current_per_phase=evse_current_per_phase,
-        max_evse_available=0,  # will be set after calculation
-        min_current=min_current,
-        max_current=max_current,
-        total_export_current=total_export_current,
-        total_export_power=total_export_power,
-        battery_soc=battery_soc,
-        battery_power=battery_power,
-        battery_soc_target=battery_soc_target,
-        battery_max_charge_power=battery_max_charge_power,
-        battery_max_discharge_power=battery_max_discharge_power,
-        allow_grid_charging=allow_grid_charging,
-        allow_grid_charging_entity_id=allow_grid_charging_entity_id,
+        draw=context.evse_current_per_phase,
+        min_current=context.min_current,
+        target=target_evse,
+        mode_pool=calculate_mode_pool(context, target_evse, len(phases)),
+        priority=self._priority,
     )
 
+def calculate_mode_pool(context: ChargeContext, target_evse, phase_count):
+    """Return the surplus current (A, summed over phases) the site may use in this charger's mode.
+
+    Solar and Excess charge from the surplus, which all chargers of the site
+    share. The readings exclude the other chargers, so the surplus is the
+    same for each of them once this charger's own draw is added back.
+    Standard and Eco are only limited by the grid and return None.
+    """
+    charging_mode = context.snapshot.charging_mode
+    own_draw = context.evse_current_per_phase * phase_count
+    if charging_mode == 'Solar':
+        return max(0, solar_pool_current(context, context.headroom) + own_draw)
+    if charging_mode == 'Excess':
+        # Excess mode offers the surplus above the threshold per phase
+        surplus = (context.total_export_power - excess_threshold(context)) / context.voltage + context.evse_current_per_phase
+        pool = max(0, surplus) * phase_count
+        # A charger in the excess hold keeps its minimum current
+        if target_evse >= context.min_current:
+            pool = max(pool, context.min_current * phase_count)
+        return pool
+    return None
+
+def calculate_site_capacity(context: ChargeContext, demand: ChargerDemand):
+    """Return the capacity the grid leaves for all chargers of the site.
+
+    The readings already exclude the other chargers, only this charger's own
+    draw has to be added back.
+    """
+    headroom = context.headroom
+    phase_headroom = [headroom.phase_a, headroom.phase_b, headroom.phase_c]
+    if headroom.single_phase:
+        phase_headroom[demand.phases[0]] = headroom.phase_e
+    for phase in demand.phases:
+        phase_headroom[phase] += demand.draw
+    pool = max_available_pool_current(context, headroom) + demand.draw * len(demand.phases)
+    return SiteCapacity(phase_headroom=tuple(phase_headroom), pool=pool)
+
+def restart_ramp(loop: LoopState, now):
+    """Return the loop state with the ramp starting over from the minimum current at now."""
+    return loop._replace(last_ramp_value=0, last_ramp_time=now)
+
+def idle_tick(self):
+    """Tick while no vehicle is connected.
+
+    The full calculation only runs every DEFAULT_IDLE_PREPARE_INTERVAL to keep
+    a limit ready for the moment a vehicle is plugged in. All other idle ticks
+    return that result without reading any other input. Idle results are
+    never dispatched. An idle charger takes no share of a site, the prepared
+    limit is the share it would get next to the chargers that charge. The ramp
+    is not moved while idle, the prepared limit and the first tick after a
+    plug-in start it over from the minimum current.
+    """
+    if self.site is not None:
+        self.site.release(self.site_member_key)
+    now = self.now()
+    if self._idle_data is None or (now - self._idle_prepared_at).total_seconds() >= DEFAULT_IDLE_PREPARE_INTERVAL:
+        self._idle_data = calculate_available_current(self, prepare=True)
+        self._idle_prepared_at = now
+    else:
+        self.metrics.ticks_skipped += 1
+    data = dict(self._idle_data)
+    data['idle'] = True
+    data['update_interval'] = self._update_interval = DEFAULT_IDLE_UPDATE_INTERVAL
+    return data
+
+def adapt_update_interval(self, context: ChargeContext, ramp_limited):
+    """Return the seconds until the next tick.
+
+    Ticks fast while the grid or charger currents move, the ramp is still
+    converging or a phase the charger uses is close to the breaker limit.
+    Otherwise the interval doubles on every quiet tick, up to the stable
+    interval while charging and the idle interval while the charger draws
+    nothing.
+    """
+    headroom = context.headroom
+    signals = (
+        context.grid_phase_a_current,
+        context.grid_phase_b_current,
+        context.grid_phase_c_current,
+        context.evse_current_per_phase,
+        context.max_evse_available,
+    )
+    previous = self._last_signals
+    self._last_signals = signals
+    charging = context.evse_current_per_phase > 0
+
+    if headroom.single_phase:
+        phase_headroom = headroom.phase_e
+    else:
+        phase_headroom = min((headroom.phase_a, headroom.phase_b, headroom.phase_c)[:max(context.phases, 1)])
+    active = previous is None or any(
+        abs(value - last) >= DEFAULT_ACTIVITY_THRESHOLD for value, last in zip(signals, previous)
+    )
+    near_limit = charging and phase_headroom < DEFAULT_BREAKER_MARGIN
+
+    if ramp_limited or active or near_limit:
+        interval = DEFAULT_FAST_UPDATE_INTERVAL
+    else:
+        ceiling = DEFAULT_STABLE_UPDATE_INTERVAL if charging else DEFAULT_IDLE_UPDATE_INTERVAL
+        interval = min(self._update_interval * 2, ceiling)
+    self._update_interval = interval
+    return interval
+
+def record_trace(self, decision: Decision, mode_targets):
+    """Store the decision of this tick in the controller trace."""
+    context = decision.context
+    trace = self.trace
+    trace.new_record()
+    trace.set(TRACE_TIME, self.now().timestamp())
+    charging_mode = context.snapshot.charging_mode
+    trace.set(TRACE_CHARGING_MODE, TRACE_CHARGING_MODES.index(charging_mode) if charging_mode in TRACE_CHARGING_MODES else None)
+    trace.set(TRACE_PHASES, context.phases)
+    trace.set(TRACE_PHASE_A_CURRENT, context.grid_phase_a_current)
+    trace.set(TRACE_PHASE_B_CURRENT, context.grid_phase_b_current)
+    trace.set(TRACE_PHASE_C_CURRENT, context.grid_phase_c_current)
+    trace.set(TRACE_PHASE_E_CURRENT, context.grid_phase_e_current)
+    trace.set(TRACE_EVSE_CURRENT, context.evse_current_per_phase)
+    trace.set(TRACE_TOTAL_EXPORT_POWER, context.total_export_power)
+    trace.set(TRACE_MAX_IMPORT_CURRENT, context.headroom.max_import_current)
+    trace.set(TRACE_BATTERY_SOC, context.battery_soc)
+    trace.set(TRACE_BATTERY_POWER, context.battery_power)
+    trace.set(TRACE_MIN_CURRENT, context.min_current)
+    trace.set(TRACE_MAX_CURRENT, context.max_current)
+    trace.set(TRACE_MAX_EVSE_AVAILABLE, context.max_evse_available)
+    trace.set(TRACE_TARGET_EVSE_STANDARD, mode_targets.get('Standard'))
+    trace.set(TRACE_TARGET_EVSE_ECO, mode_targets.get('Eco'))
+    trace.set(TRACE_TARGET_EVSE_SOLAR, mode_targets.get('Solar'))
+    trace.set(TRACE_TARGET_EVSE_EXCESS, mode_targets.get('Excess'))
+    trace.set(TRACE_TARGET_EVSE, decision.target_evse)
+    trace.set(TRACE_AVAILABLE_CURRENT, decision.available_current)
+    trace.set(TRACE_RAMP_LIMITED, decision.ramp_limited)
+
+def allocate_site_share(self, context: ChargeContext, target_evse, prepare=False):
+    """Return the share of the grid connection the site allocator gives this charger.
+
+    With prepare the share is only previewed, the other chargers keep theirs.
+    """
+    demand = build_charger_demand(self, context, target_evse)
+    capacity = calculate_site_capacity(context, demand)
+    if prepare:
+        return self.site.preview(capacity, demand)
+    return self.site.update(capacity, demand)
+
 # Calculate the available current based on the configuration and sensor data - this is the main function called by the integration
-# It gathers all necessary data, determines the number of phases, and calculates the available current based on the selected charging mode.
-# It also applies ramping logic to smooth out changes in available current
-# and ensures that the current is within the defined limits.
-def calculate_available_current(self):
-    _LOGGER.debug(" Logging in 10")
-    _LOGGER.debug(" Logging in 9")
-    _LOGGER.debug(" Logging in 8")
-    _LOGGER.debug(" Logging in 7")
-    _LOGGER.debug(" Logging in 6")
-    _LOGGER.debug(" Logging in 5")
-    _LOGGER.debug(" Logging in 4")
-    _LOGGER.debug(" Logging in 3")
-    _LOGGER.debug(" Logging in 2")
-    _LOGGER.debug(" Logging in 1")
-
-    state = get_state_config(self)
-    charge_context = get_charge_context_values(self, state)
-
-    # Calculate max_evse_available using context
-    max_evse_available = calculate_max_evse_available(charge_context)
-    charge_context.max_evse_available = max_evse_available
-
-    target_evse_standard = calculate_standard_mode(charge_context)
-    target_evse_eco = calculate_eco_mode(charge_context)
-    target_evse_solar = calculate_solar_mode(charge_context)
-    target_evse_excess = calculate_excess_mode(self, charge_context)
-
-    if state[CONF_CHARGING_MODE] == 'Standard':
-        target_evse = target_evse_standard
-    elif state[CONF_CHARGING_MODE] == 'Eco':
-        target_evse = target_evse_eco
-    elif state[CONF_CHARGING_MODE] == 'Solar':
-        target_evse = target_evse_solar
-    elif state[CONF_CHARGING_MODE] == 'Excess':
-        target_evse = target_evse_excess
-
-    # Clamp target_evse to CONF_MAX_CURRENT
-    target_evse = min(target_evse, charge_context.max_current, max_evse_available)
-
-    # Clamp to available
-    state[CONF_AVAILABLE_CURRENT] = min(max_evse_available, target_evse)
-
-    # --- Ramping logic ---
-    apply_ramping(self, state, target_evse, charge_context.min_current)
-    
-    if state[CONF_AVAILABLE_CURRENT] < state[CONF_EVSE_MINIMUM_CHARGE_CURRENT]:
-        state[CONF_AVAILABLE_CURRENT] = 0
-    if state[CONF_AVAILABLE_CURRENT] > state[CONF_EVSE_MAXIMUM_CHARGE_CURRENT]:
-        state[CONF_AVAILABLE_CURRENT] = state[CONF_EVSE_MAXIMUM_CHARGE_CURRENT]
+# It reads the input snapshot, lets calculation.decide work out the limit and keeps the control loop state.
+def calculate_available_current(self, prepare=False):
+    started = time.perf_counter()
+    snapshot = get_state_config(self)
+    self.metrics.state_read.record(time.perf_counter() - started)
+    # Several chargers share the grid connection
+    site_share = None
+    if self.site is not None and len(self.site) > 1:
+        snapshot = exclude_site_chargers(self, snapshot)
+        site_share = lambda context, target_evse: allocate_site_share(self, context, target_evse, prepare)
+
+    if prepare:
+        # The ramp stays where it is while idle, the prepared limit is where it restarts
+        decision = decide(snapshot, restart_ramp(self.loop, self.now()), self.now(), site_share)
+        self.loop = decision.loop._replace(last_ramp_value=self.loop.last_ramp_value, last_ramp_time=self.loop.last_ramp_time)
+    else:
+        decision = decide(snapshot, self.loop, self.now(), site_share)
+        self.loop = decision.loop
+    self._max_evse_available = decision.max_evse_available
+    charge_context = decision.context
+    mode_targets = get_mode_targets(self, charge_context, snapshot.charging_mode, decision.mode_target)
+
+    record_trace(self, decision, mode_targets)
+    update_interval = adapt_update_interval(self, charge_context, decision.ramp_limited)
 
     return {
-        CONF_AVAILABLE_CURRENT: round(state[CONF_AVAILABLE_CURRENT], 1),
-        CONF_PHASES: charge_context.phases,
-        CONF_CHARGING_MODE: state[CONF_CHARGING_MODE],
-        'calc_used': getattr(charge_context, 'calc_used', None),
-        'max_evse_available': max_evse_available,
-        'target_evse': target_evse,
-        'target_evse_standard': target_evse_standard,
-        'target_evse_eco': target_evse_eco,
-        'target_evse_solar': target_evse_solar,
-        'target_evse_excess': target_evse_excess,
-        'excess_charge_start_time': getattr(self, '_excess_charge_start_time', None),
+        CONF_AVAILABLE_CURRENT: round(decision.available_current, 1),
+        CONF_PHASES: decision.phases,
+        CONF_CHARGING_MODE: snapshot.charging_mode,
+        'calc_used': decision.calc_used,
+        'max_evse_available': decision.max_evse_available,
+        'target_evse': decision.target_evse,
+        'ramp_limited': decision.ramp_limited,
+        'update_interval': update_interval,
+        'idle': False,
+        'target_evse_standard': mode_targets.get('Standard'),
+        'target_evse_eco': mode_targets.get('Eco'),
+        'target_evse_solar': mode_targets.get('Solar'),
+        'target_evse_excess': mode_targets.get('Excess'),
+        'excess_charge_start_time': self.loop.excess_charge_start_time,
+        'stale_inputs': list(snapshot.stale_inputs),
     }
@@ -0,0 +1,69 @@
+"""Grid readings shared by all config entries.
+
+Entries that read the same grid inputs (phase currents and the import power
+limit, with the same phase voltage) share one snapshot per tick. The first
+entry that ticks reads and normalizes the inputs, the others reuse the
+snapshot until it is older than the tick window or one of its entities
+changes. All chargers on a grid connection then work from the same view of
+the grid, and the reads do not grow with the number of chargers.
+"""
+import datetime
+from dataclasses import dataclass
+from .const import *
+
+
+@dataclass(frozen=True)
+class GridSnapshot:
+    """Normalized grid readings taken at one point in time."""
+    taken_at: datetime.datetime
+    values: tuple  # normalized values in the order of the plan's grid bindings
+    stale: tuple  # keys of the inputs whose meter stopped reporting
+    entity_ids: frozenset  # entities the values were read from
+
+
+class GridSnapshotCache:
+    """Latest GridSnapshot per set of grid inputs, kept in hass.data[DOMAIN]."""
+
+    def __init__(self, max_age=DEFAULT_GRID_SNAPSHOT_MAX_AGE):
+        self.max_age = datetime.timedelta(seconds=max_age)
+        self._snapshots = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def get(self, plan, now, read):
+        """Return the snapshot of the plan's grid inputs.
+
+        read is called to get new values and stale keys when there is no snapshot for
+        the inputs yet, or the one there is was taken outside the tick window.
+        """
+        snapshot = self._snapshots.get(plan.grid_key)
+        if snapshot is not None and snapshot.taken_at <= now < snapshot.taken_at + self.max_age:
+            self.hits += 1
+            return snapshot
+        self.misses += 1
+        self._prune(now)
+        values, stale = read()
+        snapshot = GridSnapshot(
+            taken_at=now,
+            values=values,
+            stale=stale,
+            entity_ids=frozenset(binding.entity_id for binding in plan.grid_bindings if binding.entity_id is not None),
+        )
+        self._snapshots[plan.grid_key] = snapshot
+        return snapshot
+
+    def invalidate(self, entity_id=None):
+        """Drop the snapshots that read entity_id, or all snapshots."""
+        if entity_id is None:
+            self._snapshots.clear()
+            return
+        for key in [key for key, snapshot in self._snapshots.items() if entity_id in snapshot.entity_ids]:
+            del self._snapshots[key]
+
+    def _prune(self, now):
+        # Inputs of removed or reconfigured entries are not read again
+        for key in [key for key, snapshot in self._snapshots.items() if now - snapshot.taken_at >= self.max_age]:
+            del self._snapshots[key]
@@ -0,0 +1,99 @@
+"""In-process instrumentation of the control loop.
+
+Durations are kept in fixed-size rolling windows and sent commands as a
+list of timestamps within the last hour, so recording a sample is a single
+store without allocation. The percentiles are only worked out when the
+diagnostic sensors read the summary, and then at most once per summary
+interval.
+"""
+import math
+import time
+from array import array
+from collections import deque
+from .const import *
+
+PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+
+
+class LatencyWindow:
+    """Rolling window of the most recent durations in seconds."""
+
+    def __init__(self, size=DEFAULT_METRICS_WINDOW):
+        self._samples = array("d", bytes(8 * size))
+        self._size = size
+        self._next = 0
+        self.count = 0
+
+    def record(self, seconds):
+        self._samples[self._next] = seconds
+        self._next = (self._next + 1) % self._size
+        self.count += 1
+
+    def percentiles(self):
+        """Return {p50, p95, p99} of the window in milliseconds, None values while empty."""
+        n = min(self.count, self._size)
+        if not n:
+            return {name: None for name, _ in PERCENTILES}
+        samples = sorted(self._samples[:n])
+        # Nearest rank
+        return {name: round(samples[max(math.ceil(q * n) - 1, 0)] * 1000, 3) for name, q in PERCENTILES}
+
+
+class EventRate:
+    """Events within the last hour."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._times = deque()
+        self.count = 0
+
+    def record(self):
+        self._times.append(self._clock())
+        self.count += 1
+
+    def per_hour(self):
+        cutoff = self._clock() - 3600
+        times = self._times
+        while times and times[0] <= cutoff:
+            times.popleft()
+        return len(times)
+
+
+class TickMetrics:
+    """Counters and latency windows of one controller.
+
+    calculation times whole ticks, state_read the reading of the inputs and
+    dispatch the set_charge_rate calls until the charger acknowledged them.
+    """
+
+    def __init__(self, window=DEFAULT_METRICS_WINDOW, clock=time.monotonic):
+        self._clock = clock
+        self.calculation = LatencyWindow(window)
+        self.state_read = LatencyWindow(window)
+        self.dispatch = LatencyWindow(window)
+        self.commands = EventRate(clock)
+        self.ticks_skipped = 0
+        self.errors = 0
+        self._summary = None
+        self._summary_time = None
+
+    def summary(self):
+        """Return the metrics as a flat dict, recalculated at most once per summary interval."""
+        now = self._clock()
+        if self._summary is None or now - self._summary_time >= DEFAULT_METRICS_SUMMARY_INTERVAL:
+            summary = {
+                "ticks": self.calculation.count,
+                "ticks_skipped": self.ticks_skipped,
+                "errors": self.errors,
+                "commands_per_hour": self.commands.per_hour(),
+            }
+            for name, window in (
+                ("calculation", self.calculation),
+                ("state_read", self.state_read),
+                ("dispatch", self.dispatch),
+            ):
+                for percentile, value in window.percentiles().items():
+                    summary[f"{name}_{percentile}_ms"] = value
+            self._summary = summary
+            self._summary_time = now
+        return self._summary
@@ -0,0 +1,108 @@
+"""On-demand profiling of the calculation tick.
+
+The profile service arms a TickProfiler for a number of ticks. cProfile is
+only enabled while the calculation of one of those ticks runs, and the
+profiler disarms itself once they ran or the profiling timeout passed, so it
+cannot stay on. The calculation is synchronous, so no other task runs while
+cProfile is enabled. Sending the charging profile awaits the charger and is
+only timed.
+"""
+import cProfile
+import os
+import pstats
+import time
+from .const import *
+
+
+class TickProfiler:
+    """cProfile around the next ticks of one coordinator."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._profile = None
+        self._deadline = None
+        self.remaining = 0
+        self.ticks = 0
+        # Duration in seconds and success of the dispatches while armed
+        self.dispatches = []
+
+    @property
+    def active(self):
+        return self._profile is not None
+
+    @property
+    def finished(self):
+        """Return True if the armed ticks ran or the timeout passed."""
+        return self.active and (self.remaining <= 0 or self._clock() >= self._deadline)
+
+    def arm(self, ticks, timeout=DEFAULT_PROFILE_TIMEOUT):
+        """Profile the next ticks, for at most timeout seconds."""
+        self._profile = cProfile.Profile()
+        self._deadline = self._clock() + timeout
+        self.remaining = ticks
+        self.ticks = 0
+        self.dispatches = []
+
+    def begin(self):
+        """Enable the profiler for a tick, return False if it is not armed."""
+        if not self.active or self.finished:
+            return False
+        self._profile.enable()
+        return True
+
+    def end(self):
+        """Disable the profiler after a tick started with begin."""
+        self._profile.disable()
+        self.remaining -= 1
+        self.ticks += 1
+
+    def call(self, func, *args):
+        """Return func(*args), profiled as a tick if the profiler is armed.
+
+        func must not be a coroutine, cProfile would count every task that
+        runs while it awaits.
+        """
+        if not self.begin():
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            self.end()
+
+    def record_dispatch(self, seconds, ok):
+        """Record the duration of a charging profile dispatch while armed."""
+        if self.active:
+            self.dispatches.append((seconds, ok))
+
+    def dispatch_summary(self):
+        """Return the number, failures and mean and max duration of the recorded dispatches."""
+        durations = [seconds for seconds, _ in self.dispatches]
+        return {
+            "attempts": len(durations),
+            "failed": sum(1 for _, ok in self.dispatches if not ok),
+            "mean_ms": round(sum(durations) / len(durations) * 1000, 3) if durations else None,
+            "max_ms": round(max(durations) * 1000, 3) if durations else None,
+        }
+
+    def take_stats(self):
+        """Disarm the profiler and return the pstats.Stats of the profiled ticks, None if none ran."""
+        profile = self._profile
+        self._profile = None
+        self.remaining = 0
+        if profile is None or not self.ticks:
+            return None
+        return pstats.Stats(profile)
+
+
+def top_functions(stats, limit=DEFAULT_PROFILE_TOP):
+    """Return the functions with the most time spent in themselves, the hottest first."""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "tottime_ms": round(tottime * 1000, 3),
+            "cumtime_ms": round(cumtime * 1000, 3),
+        }
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in rows
+    ]
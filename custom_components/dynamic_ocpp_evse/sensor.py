@@ -2,130 +2,101 @@ import logging
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
-from datetime import timedelta, datetime
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
-from .dynamic_ocpp_evse import calculate_available_current
+from homeassistant.helpers.entity import EntityCategory
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from .coordinator import DynamicOcppEvseCoordinator
 from .const import *
 
 _LOGGER = logging.getLogger(__name__)
-SCAN_INTERVAL = timedelta(seconds=10)
 
 async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry, async_add_entities):
     """Set up the Dynamic OCPP EVSE Sensor from a config entry."""
     name = config_entry.data[CONF_NAME]
     entity_id = config_entry.data[CONF_ENTITY_ID]
 
-    # Fetch the initial update frequency from the configuration
-    update_frequency = config_entry.data.get(CONF_UPDATE_FREQUENCY, 5)  # Default to 5 seconds if not set
-    _LOGGER.info(f"Initial update frequency: {update_frequency} seconds")
-
-    async def async_update_data():
-        """Fetch data for the coordinator."""
-        # Create a temporary sensor instance to calculate the data
-        temp_sensor = DynamicOcppEvseSensor(hass, config_entry, name, entity_id, None)
-        await temp_sensor.async_update()
-        return {
-            CONF_AVAILABLE_CURRENT: temp_sensor._state,
-            CONF_PHASES: temp_sensor._phases,
-            CONF_CHARGING_MODE: temp_sensor._charging_mode,
-            "calc_used": temp_sensor._calc_used,
-            "max_evse_available": temp_sensor._max_evse_available,
-        }
-
-    # Create a DataUpdateCoordinator to manage the update interval dynamically
-    coordinator = DataUpdateCoordinator(
-        hass,
-        _LOGGER,
-        name="Dynamic OCPP EVSE Coordinator",
-        update_method=async_update_data,
-        update_interval=timedelta(seconds=update_frequency),
-    )
+    # The coordinator is the single owner of the calculation and the OCPP dispatch
+    coordinator = DynamicOcppEvseCoordinator(hass, config_entry)
+    hass.data[DOMAIN][config_entry.entry_id]["coordinator"] = coordinator
 
     # Create the sensor entity
-    sensor = DynamicOcppEvseSensor(hass, config_entry, name, entity_id, coordinator)
-    async_add_entities([sensor])
+    sensor = DynamicOcppEvseSensor(coordinator, config_entry, name, entity_id)
+    # Diagnostic sensors with the tick and dispatch metrics
+    metric_sensors = [
+        DynamicOcppEvseMetricSensor(coordinator, config_entry, name, key, description)
+        for key, description in METRIC_SENSORS.items()
+    ]
+    async_add_entities([sensor] + metric_sensors)
+
+    # Profiles are sent by a background worker, start it before the first limit is calculated
+    coordinator.async_start_dispatcher()
+
+    # Chargers on the same grid connection share its capacity
+    coordinator.async_join_site()
+    config_entry.async_on_unload(coordinator.async_leave_site)
+    config_entry.async_on_unload(coordinator.async_cancel_profile)
 
     # Start the first update
-    await coordinator.async_config_entry_first_refresh()
+    await coordinator.async_refresh()
+
+    coordinator.async_subscribe_inputs()
+    config_entry.async_on_unload(coordinator.async_unsubscribe_inputs)
 
-    # Listen for updates to the config entry and recreate the coordinator if necessary
+    # Listen for updates to the config entry and retune the coordinator if necessary
     async def async_update_listener(hass: HomeAssistant, entry: ConfigEntry):
         """Handle options update."""
-        nonlocal update_frequency  # Declare nonlocal before using the variable
         _LOGGER.debug("async_update_listener triggered")
-        new_update_frequency = entry.data.get(CONF_UPDATE_FREQUENCY, 5)
-        _LOGGER.info(f"Detected update frequency change: {new_update_frequency} seconds")
-        if new_update_frequency != update_frequency:
-            _LOGGER.info(f"Updating update_frequency to {new_update_frequency} seconds")
-            # Recreate the coordinator with the new update frequency
-            nonlocal coordinator  # Update the outer coordinator variable
-            coordinator = DataUpdateCoordinator(
-                hass,
-                _LOGGER,
-                name="Dynamic OCPP EVSE Coordinator",
-                update_method=async_update_data,
-                update_interval=timedelta(seconds=new_update_frequency),
-            )
-            update_frequency = new_update_frequency  # Update the variable
-            _LOGGER.debug(f"Recreated DataUpdateCoordinator with update_interval: {new_update_frequency} seconds")
-            await coordinator.async_config_entry_first_refresh()
-            sensor.coordinator = coordinator
+        await coordinator.async_update_config(entry)
 
     # Register the listener for config entry updates
     _LOGGER.debug("Registering async_on_update listener")
     config_entry.async_on_unload(config_entry.add_update_listener(async_update_listener))
 
 
-class DynamicOcppEvseSensor(SensorEntity):
+class DynamicOcppEvseSensor(CoordinatorEntity, SensorEntity):
     """Representation of a Dynamic OCPP EVSE Sensor."""
 
-    def __init__(self, hass, config_entry, name, entity_id, coordinator):
+    def __init__(self, coordinator, config_entry, name, entity_id):
         """Initialize the sensor."""
-        self.hass = hass
+        super().__init__(coordinator)
         self.config_entry = config_entry
         self._attr_name = name
         self._attr_unique_id = entity_id  # Set a unique ID for the entity
-        self._state = None
-        self._phases = None
-        self._charging_mode = None
-        self._calc_used = None
-        self._max_evse_available = None
-        self._last_update = datetime.min  # Initialize the last update timestamp
-        self._pause_timer_running = False  # Track if the pause timer is running
-        self._last_set_current = 0
-        self._target_evse = None  # Initialize target_evse
-        self._target_evse_standard = None
-        self._target_evse_eco = None
-        self._target_evse_solar = None
-        self._target_evse_excess = None
-        self.coordinator = coordinator
 
     @property
     def state(self):
         """Return the state of the sensor."""
-        return self._state
+        if not self.coordinator.data:
+            return None
+        return self.coordinator.data[CONF_AVAILABLE_CURRENT]
 
     @property
     def extra_state_attributes(self):
         """Return the state attributes."""
+        data = self.coordinator.data or {}
         attrs = {
             "state_class": "measurement",
-            CONF_PHASES: self._phases,
-            CONF_CHARGING_MODE: self._charging_mode,
-            "calc_used": self._calc_used,
-            "max_evse_available": self._max_evse_available,
-            "last_update": self._last_update,
-            "pause_timer_running": self._pause_timer_running,
-            "last_set_current": self._last_set_current,
-            "target_evse": self._target_evse,  # Always include target_evse
-            "target_evse_standard": self._target_evse_standard,
-            "target_evse_eco": self._target_evse_eco,
-            "target_evse_solar": self._target_evse_solar,
-            "target_evse_excess": self._target_evse_excess,
+            CONF_PHASES: data.get(CONF_PHASES),
+            CONF_CHARGING_MODE: data.get(CONF_CHARGING_MODE),
+            "calc_used": data.get("calc_used"),
+            "max_evse_available": data.get("max_evse_available"),
+            "last_update": data.get("last_update"),
+            "pause_timer_running": data.get("pause_timer_running"),
+            "last_set_current": data.get("last_set_current"),
+            "commands_sent": data.get("commands_sent"),
+            "commands_suppressed": data.get("commands_suppressed"),
+            "dispatch_breaker": data.get("dispatch_breaker"),
+            "dispatch_failures": data.get("dispatch_failures"),
+            "update_interval": data.get("update_interval"),
+            "target_evse": data.get("target_evse"),  # Always include target_evse
+            "target_evse_standard": data.get("target_evse_standard"),
+            "target_evse_eco": data.get("target_evse_eco"),
+            "target_evse_solar": data.get("target_evse_solar"),
+            "target_evse_excess": data.get("target_evse_excess"),
+            "stale_inputs": data.get("stale_inputs"),
         }
         # Add excess_charge_start_time if available
-        if hasattr(self, '_excess_charge_start_time') and self._excess_charge_start_time is not None:
-            attrs["excess_charge_start_time"] = self._excess_charge_start_time
+        if data.get("excess_charge_start_time") is not None:
+            attrs["excess_charge_start_time"] = data["excess_charge_start_time"]
         return attrs
 
     @property
@@ -133,91 +104,66 @@ class DynamicOcppEvseSensor(SensorEntity):
         """Return the icon to use in the frontend."""
         return "mdi:transmission-tower"
 
-    async def async_update(self):
-        """Fetch new state data for the sensor asynchronously."""
-        try:
-            # Fetch all attributes from the calculate_available_current function
-            data = calculate_available_current(self)
-            self._state = data[CONF_AVAILABLE_CURRENT]
-            self._phases = data[CONF_PHASES]
-            self._charging_mode = data[CONF_CHARGING_MODE]
-            self._calc_used = data["calc_used"]
-            self._max_evse_available = data["max_evse_available"]
-            self._target_evse = data["target_evse"]
-            self._target_evse_standard =  data["target_evse_standard"]
-            self._target_evse_eco = data["target_evse_eco"]
-            self._target_evse_solar = data["target_evse_solar"]
-            self._target_evse_excess = data["target_evse_excess"]
-            # Store excess_charge_start_time if present
-            if "excess_charge_start_time" in data:
-                self._excess_charge_start_time = data["excess_charge_start_time"]
-            else:
-                self._excess_charge_start_time = None
-
-            # Check if the state drops below 6
-            if self._state < 6 and not self._pause_timer_running:
-                # Start the Charge Pause Timer
-                await self.hass.services.async_call(
-                    "timer",
-                    "start",
-                    {
-                        "entity_id": f"timer.{self._attr_unique_id}_charge_pause_timer",
-                        "duration": self.config_entry.data[CONF_CHARGE_PAUSE_DURATION]
-                    }
-                )
-                self._pause_timer_running = True
-
-            # Check if the timer is running
-            timer_state = self.hass.states.get(f"timer.{self._attr_unique_id}_charge_pause_timer")
-            if timer_state and timer_state.state == "active":
-                limit = 0
-            else:
-                limit = round(self._state, 1)
-                self._pause_timer_running = False
-
-            # Only send an update if there is a change in limit
-            if self._last_set_current != limit:
-
-                self._last_set_current = limit
-
-                # Prepare the data for the OCPP set_charge_rate service
-                profile_timeout = self.config_entry.data.get(CONF_OCPP_PROFILE_TIMEOUT, 15)  # Default to 15 seconds if not set
-                valid_from = datetime.utcnow().isoformat(timespec='seconds') + 'Z'
-                valid_to = (datetime.utcnow() + timedelta(seconds=profile_timeout)).isoformat(timespec='seconds') + 'Z'
-                # Get stackLevel from config, default to 2 if not set
-                stack_level = self.config_entry.data.get(CONF_STACK_LEVEL, 2)
-                
-                charging_profile = {
-                    "chargingProfileId": 11,
-                    "stackLevel": stack_level,
-                    "chargingProfileKind": "Relative",
-                    "chargingProfilePurpose": "TxDefaultProfile",
-                    #"validFrom": valid_from,
-                    #"validTo": valid_to,
-                    "chargingSchedule": {
-                        "chargingRateUnit": "A",
-                        "chargingSchedulePeriod": [
-                            {
-                                "startPeriod": 0,
-                                "limit": limit
-                            }
-                        ]
-                    }
-                }
-
-                # Log the data being sent
-                _LOGGER.debug(f"Sending set_charge_rate with data: {charging_profile}")
-
-                # Call the OCPP set_charge_rate service
-                await self.hass.services.async_call(
-                    "ocpp",
-                    "set_charge_rate",
-                    {
-                        "custom_profile": charging_profile
-                    }
-                )
-                # Update the last update timestamp
-                self._last_update = datetime.utcnow()
-
-        except Exception as e:
-            _LOGGER.error(f"Error updating Dynamic OCPP EVSE Sensor: {e}", exc_info=True)
+
+# key: (name suffix, unit, icon, metric of the state, metrics and coordinator data keys added as attributes)
+METRIC_SENSORS = {
+    "calculation_time": (
+        "Calculation Time",
+        "ms",
+        "mdi:timer-outline",
+        "calculation_p50_ms",
+        (
+            "calculation_p95_ms", "calculation_p99_ms",
+            "state_read_p50_ms", "state_read_p95_ms", "state_read_p99_ms",
+            "ticks", "ticks_skipped", "errors",
+        ),
+        (),
+    ),
+    "dispatch_latency": (
+        "Dispatch Latency",
+        "ms",
+        "mdi:timer-outline",
+        "dispatch_p50_ms",
+        ("dispatch_p95_ms", "dispatch_p99_ms"),
+        ("dispatch_sent", "dispatch_failed"),
+    ),
+    "commands_per_hour": (
+        "Commands Per Hour",
+        "commands/h",
+        "mdi:counter",
+        "commands_per_hour",
+        (),
+        ("commands_sent", "commands_suppressed"),
+    ),
+}
+
+
+class DynamicOcppEvseMetricSensor(CoordinatorEntity, SensorEntity):
+    """Diagnostic sensor with one of the controller metrics, see metrics.TickMetrics."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = "measurement"
+
+    def __init__(self, coordinator, config_entry, name, key, description):
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        self.config_entry = config_entry
+        suffix, unit, icon, self._metric, self._metric_attributes, self._data_attributes = description
+        self._attr_name = f"{name} {suffix}"
+        self._attr_unique_id = f"{config_entry.entry_id}_{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_icon = icon
+
+    @property
+    def native_value(self):
+        """Return the metric, the percentiles are refreshed at most every DEFAULT_METRICS_SUMMARY_INTERVAL."""
+        return self.coordinator.controller.metrics.summary()[self._metric]
+
+    @property
+    def extra_state_attributes(self):
+        """Return the related metrics and counters."""
+        summary = self.coordinator.controller.metrics.summary()
+        data = self.coordinator.data or {}
+        attrs = {key: summary[key] for key in self._metric_attributes}
+        attrs.update((key, data.get(key)) for key in self._data_attributes)
+        return attrs
@@ -0,0 +1,146 @@
+"""
+Shared setup of the controller tests.
+
+Holds the config entry used by the tests, the virtual clock start, a factory
+for a controller on a virtual state machine and the seeding of its input
+entities, so the test scripts only set what they are about.
+"""
+
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from component import load_module
+from fake_hass import FakeConfigEntry, FakeHass, VirtualClock
+
+const = load_module("const")
+calc = load_module("dynamic_ocpp_evse")
+allocator = load_module("allocator")
+
+START = datetime.datetime(2025, 6, 1, 12, tzinfo=datetime.timezone.utc)
+
+ENTITY_ID = "dynamic_ocpp_evse"
+CONFIG = {
+    "entity_id": ENTITY_ID,
+    "phase_a_current_entity_id": "sensor.grid_l1",
+    "phase_b_current_entity_id": "sensor.grid_l2",
+    "phase_c_current_entity_id": "sensor.grid_l3",
+    "main_breaker_rating": 25,
+    "max_import_power_entity_id": "sensor.power_limit",
+    "phase_voltage": 230,
+    "evse_current_import_entity_id": "sensor.charger_current_import",
+    "evse_current_offered_entity_id": "sensor.charger_current_offered",
+    "charging_mode_entity_id": f"select.{ENTITY_ID}_charging_mode",
+    "min_current_entity_id": f"number.{ENTITY_ID}_min_current",
+    "max_current_entity_id": f"number.{ENTITY_ID}_max_current",
+}
+GRID_ENTITY_IDS = ("sensor.grid_l1", "sensor.grid_l2", "sensor.grid_l3")
+
+
+class CountingStates:
+    """State machine wrapper that counts reads, of entity_ids only if given."""
+
+    def __init__(self, states, entity_ids=None):
+        self._states = states
+        self._entity_ids = entity_ids
+        self.reads = 0
+
+    def get(self, entity_id):
+        if self._entity_ids is None or entity_id in self._entity_ids:
+            self.reads += 1
+        return self._states.get(entity_id)
+
+    def set(self, *args, **kwargs):
+        self._states.set(*args, **kwargs)
+
+
+class FakeMonotonic:
+    """Monotonic clock the tests move by hand."""
+
+    def __init__(self):
+        self.value = 1000.0
+
+    def __call__(self):
+        return self.value
+
+
+def set_grid(hass, current, last_updated=None, last_reported=None):
+    """Set all grid phase sensors to the same reading."""
+    value = current if isinstance(current, str) else str(current)
+    for entity_id in GRID_ENTITY_IDS:
+        hass.states.set(entity_id, value, last_updated=last_updated, last_reported=last_reported)
+
+
+def set_states(
+    hass,
+    config=CONFIG,
+    charging_mode="Standard",
+    min_current=6,
+    max_current=16,
+    power_limit=20000,
+    phases=None,
+    grid=None,
+    evse_import=None,
+    evse_offered=None,
+):
+    """Set the input entities of config, inputs left at None are not set."""
+    hass.states.set(config["charging_mode_entity_id"], charging_mode)
+    hass.states.set(config["min_current_entity_id"], str(min_current))
+    hass.states.set(config["max_current_entity_id"], str(max_current))
+    hass.states.set(config["max_import_power_entity_id"], str(power_limit))
+    if phases is not None:
+        hass.states.set(f"sensor.{config['entity_id']}", "0", {const.CONF_PHASES: phases})
+    if grid is not None:
+        set_grid(hass, grid)
+    if evse_import is not None:
+        hass.states.set(config["evse_current_import_entity_id"], str(evse_import))
+    if evse_offered is not None:
+        hass.states.set(config["evse_current_offered_entity_id"], str(evse_offered))
+
+
+def make_controller(config=CONFIG, hass=None, clock=None, trace_capacity=None, seed=True, entry_id=None, **states):
+    """Return hass, clock and a controller for config.
+
+    Unless seed is False, the input entities are set by set_states with states.
+    """
+    hass = hass if hass is not None else FakeHass()
+    clock = clock if clock is not None else VirtualClock(START)
+    options = {} if trace_capacity is None else {"trace_capacity": trace_capacity}
+    entry = FakeConfigEntry(config) if entry_id is None else FakeConfigEntry(config, entry_id)
+    controller = calc.EvseController(hass, entry, clock=clock, **options)
+    if seed:
+        set_states(hass, config, **states)
+    return hass, clock, controller
+
+
+def charger_config(name, **overrides):
+    """Return the config of a charger that shares the grid connection of CONFIG."""
+    config = dict(
+        CONFIG,
+        entity_id=name,
+        evse_current_import_entity_id=f"sensor.{name}_current_import",
+        evse_current_offered_entity_id=f"sensor.{name}_current_offered",
+        charging_mode_entity_id=f"select.{name}_charging_mode",
+        min_current_entity_id=f"number.{name}_min_current",
+        max_current_entity_id=f"number.{name}_max_current",
+        evse_status_entity_id=f"sensor.{name}_status_connector",
+    )
+    config.update(overrides)
+    return config
+
+
+def make_site(names, hass=None, clock=None, config=None, **states):
+    """Return hass, clock, the site allocator and a controller per name on one grid connection.
+
+    The controllers join the site like the coordinator does, config overrides
+    the config of every charger and states are passed to set_states.
+    """
+    site = allocator.SiteAllocator()
+    controllers = {}
+    for name in names:
+        hass, clock, controller = make_controller(charger_config(name, **(config or {})), hass, clock, entry_id=name, **states)
+        controller.site = site
+        site.add_member(name, read_draw=controller.read_evse_draw)
+        controllers[name] = controller
+    return hass, clock, site, controllers
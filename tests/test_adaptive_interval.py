@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the adaptive update interval of the controller.
+Runs ticks with moving, stable and near limit grid currents and checks that
+the controller ticks fast while something happens and backs off otherwise.
+"""
+
+import datetime
+
+from helpers import const, make_controller, set_grid
+
+
+def tick(hass, clock, controller, grid_current, charger_current):
+    set_grid(hass, grid_current)
+    hass.states.set("sensor.charger_current_import", str(charger_current))
+    data = controller.calculate()
+    clock.current += datetime.timedelta(seconds=data["update_interval"])
+    return data["update_interval"]
+
+
+def test_interval_follows_activity():
+    print("Testing adaptive update interval")
+    print("=" * 50)
+    hass, clock, controller = make_controller(phases=3, evse_offered=16)
+
+    # Stable charging backs off to the stable interval
+    intervals = [tick(hass, clock, controller, 14, 10) for _ in range(10)]
+    assert intervals[0] == const.DEFAULT_FAST_UPDATE_INTERVAL
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == const.DEFAULT_STABLE_UPDATE_INTERVAL
+    assert controller.update_interval == const.DEFAULT_STABLE_UPDATE_INTERVAL
+
+    # A moving grid current brings it straight back to the fast interval
+    assert tick(hass, clock, controller, 18, 10) == const.DEFAULT_FAST_UPDATE_INTERVAL
+    assert tick(hass, clock, controller, 18, 10) == 2 * const.DEFAULT_FAST_UPDATE_INTERVAL
+
+    # Close to the breaker limit it keeps ticking fast even when nothing moves
+    for _ in range(5):
+        assert tick(hass, clock, controller, 24, 16) == const.DEFAULT_FAST_UPDATE_INTERVAL
+        assert not controller.trace.records(1)[0]["ramp_limited"]
+    print(f"✅ Stable after {len(intervals)} ticks, fast on changes and near the breaker limit")
+
+
+def test_idle_charger_backs_off_further():
+    print("Testing idle charger interval")
+    print("=" * 50)
+    hass, clock, controller = make_controller(phases=3, evse_offered=16)
+    intervals = [tick(hass, clock, controller, 3, 0) for _ in range(10)]
+    assert intervals[-1] == const.DEFAULT_IDLE_UPDATE_INTERVAL
+    # Near the limit does not matter while the charger draws nothing
+    assert tick(hass, clock, controller, 3, 0) == const.DEFAULT_IDLE_UPDATE_INTERVAL
+    print(f"✅ Idle charger ticks every {intervals[-1]}s")
+
+
+if __name__ == "__main__":
+    test_interval_follows_activity()
+    test_idle_charger_backs_off_further()
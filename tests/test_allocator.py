@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the site allocator that shares one grid connection
+between several chargers. Checks fair sharing, priorities, admission at the
+minimum current, single phase chargers, mode pools and reductions of the
+other chargers' shares.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from component import load_module
+from helpers import const, make_site, set_grid
+
+allocator = load_module("allocator")
+ChargerDemand = allocator.ChargerDemand
+SiteCapacity = allocator.SiteCapacity
+
+THREE_PHASES = (0, 1, 2)
+
+
+def demand(key, target, phases=THREE_PHASES, draw=0, min_current=6, mode_pool=None, priority=0):
+    return ChargerDemand(
+        key=key, phases=phases, draw=draw, min_current=min_current,
+        target=target, mode_pool=mode_pool, priority=priority,
+    )
+
+
+def capacity(phase_headroom, pool=1000):
+    return SiteCapacity(phase_headroom=tuple(phase_headroom), pool=pool)
+
+
+def rounded(allocation):
+    return {key: round(current, 3) for key, current in allocation.items()}
+
+
+def test_fair_share_and_priority():
+    print("Testing fair share and priority")
+    print("=" * 50)
+    # Equal priority chargers split the breaker headroom
+    result = allocator.allocate(capacity([20, 20, 20]), [demand("a", 16), demand("b", 16)])
+    assert rounded(result) == {"a": 10, "b": 10}, result
+
+    # A charger with a lower target leaves the rest to the other one
+    result = allocator.allocate(capacity([20, 20, 20]), [demand("a", 7), demand("b", 16)])
+    assert rounded(result) == {"a": 7, "b": 13}, result
+
+    # The higher priority charger is filled first, the other one still gets its minimum
+    result = allocator.allocate(capacity([24, 24, 24]), [demand("a", 16, priority=1), demand("b", 16)])
+    assert rounded(result) == {"a": 16, "b": 8}, result
+
+    # The pooled import limit counts every phase a charger uses
+    result = allocator.allocate(capacity([32, 32, 32], pool=48), [demand("a", 16), demand("b", 16)])
+    assert rounded(result) == {"a": 8, "b": 8}, result
+    print("✅ Equal chargers share fairly and priorities are served first")
+
+
+def test_admission_at_minimum_current():
+    print("Testing admission at minimum current")
+    print("=" * 50)
+    # Only one charger fits at 6A, the one that is charging already keeps it
+    result = allocator.allocate(capacity([10, 10, 10]), [demand("a", 16), demand("b", 16, draw=6)])
+    assert rounded(result) == {"a": 0, "b": 10}, result
+
+    # A target below the minimum current does not charge and takes nothing
+    result = allocator.allocate(capacity([20, 20, 20]), [demand("a", 4), demand("b", 16)])
+    assert rounded(result) == {"a": 0, "b": 16}, result
+    print("✅ Chargers that cannot get their minimum current get 0")
+
+
+def test_single_phase_chargers():
+    print("Testing single phase chargers")
+    print("=" * 50)
+    # Single phase chargers on different phases do not compete
+    result = allocator.allocate(
+        capacity([16, 10, 16]),
+        [demand("a", 16, phases=(0,)), demand("b", 16, phases=(1,)), demand("c", 16, phases=(0,))],
+    )
+    assert rounded(result) == {"a": 8, "b": 10, "c": 8}, result
+
+    # A three phase charger is limited by the phase it shares with a single phase charger
+    result = allocator.allocate(capacity([16, 20, 20]), [demand("a", 16, phases=(0,)), demand("b", 16)])
+    assert rounded(result) == {"a": 8, "b": 8}, result
+    print("✅ Breaker headroom is shared per phase")
+
+
+def test_mode_pools():
+    print("Testing mode pools")
+    print("=" * 50)
+    # Chargers without a mode pool (Standard, Eco) each get their own target
+    result = allocator.allocate(capacity([100, 100, 100], pool=300), [demand("a", 16), demand("b", 16)])
+    assert rounded(result) == {"a": 16, "b": 16}, result
+
+    # Two solar chargers share the site surplus of 36A (summed over phases)
+    result = allocator.allocate(
+        capacity([32, 32, 32]),
+        [demand("a", 16, mode_pool=36), demand("b", 16, mode_pool=36)],
+    )
+    assert rounded(result) == {"a": 6, "b": 6}, result
+
+    # A surplus of 18A is only enough for one of them
+    result = allocator.allocate(
+        capacity([32, 32, 32]),
+        [demand("a", 16, mode_pool=18), demand("b", 16, mode_pool=18)],
+    )
+    assert rounded(result) == {"a": 6, "b": 0}, result
+
+    # The Excess surplus above the threshold is part of the Solar surplus
+    result = allocator.allocate(
+        capacity([32, 32, 32]),
+        [demand("a", 16, mode_pool=18), demand("b", 16, mode_pool=48)],
+    )
+    assert rounded(result) == {"a": 6, "b": 10}, result
+    print("✅ Only the surplus modes share a pool, pools nest from the smallest to the largest")
+
+
+def tick_site(hass, controllers, base_current):
+    """Tick every charger of the site once, the grid meters include the chargers' draw."""
+    draws = {}
+    for name, controller in controllers.items():
+        draws[name] = controller.calculate()[const.CONF_AVAILABLE_CURRENT]
+        hass.states.set(f"sensor.{name}_current_import", str(draws[name]))
+        set_grid(hass, base_current + sum(draws.values()))
+    return draws
+
+
+def test_site_mode_pools():
+    print("Testing mode pools of a site")
+    print("=" * 50)
+    # Two Standard chargers on a big connection both get their maximum
+    hass, clock, site, controllers = make_site(
+        ("a", "b"), config={"main_breaker_rating": 100},
+        power_limit=60000, grid=5, evse_import=0, evse_offered=16,
+    )
+    tick_site(hass, controllers, 5)
+    assert tick_site(hass, controllers, 5) == {"a": 16, "b": 16}
+    assert all(demand.mode_pool is None for demand in site._demands.values())
+
+    # Two Solar chargers share the 60A export (summed over phases) of the site
+    hass, clock, site, controllers = make_site(
+        ("a", "b"), charging_mode="Solar", grid=-20, evse_import=0, evse_offered=16,
+    )
+    tick_site(hass, controllers, -20)
+    assert rounded(site.allocation) == {"a": 10, "b": 10}, site.allocation
+    pools = {round(demand.mode_pool, 3) for demand in site._demands.values()}
+    assert pools == {60}, pools
+    print("✅ Standard chargers are not pooled, Solar chargers share the site surplus")
+
+
+def test_site_updates():
+    print("Testing site updates")
+    print("=" * 50)
+    site = allocator.SiteAllocator()
+    reduced = []
+    site.add_member("a", on_reduced=lambda: reduced.append("a"))
+    site.add_member("b", on_reduced=lambda: reduced.append("b"))
+    assert len(site) == 2
+
+    grid = capacity([20, 20, 20])
+    assert round(site.update(grid, demand("a", 16, draw=0)), 3) == 16
+    assert site.other_draw("b") == [0, 0, 0]
+
+    # a is charging now, b joins and takes part of a's share
+    assert round(site.update(grid, demand("a", 16, draw=16)), 3) == 16
+    assert site.other_draw("b") == [16, 16, 16]
+    assert round(site.update(grid, demand("b", 16)), 3) == 10
+    assert reduced == ["a"], reduced
+    assert round(site.allocation["a"], 3) == 10
+
+    # The live draw of the other chargers is used when they provide it
+    site.add_member("a", on_reduced=lambda: reduced.append("a"), read_draw=lambda: 12)
+    assert site.other_draw("b") == [12, 12, 12]
+
+    # A preview does not change the stored shares, a released charger gives its share back
+    assert round(site.preview(grid, demand("c", 16)), 3) == 6.667
+    assert "c" not in site.allocation and round(site.allocation["a"], 3) == 10
+    site.release("b")
+    assert "b" not in site.allocation and site.other_draw("a") == [0, 0, 0]
+    assert round(site.update(grid, demand("a", 16, draw=10)), 3) == 16
+    assert round(site.update(grid, demand("b", 16)), 3) == 10
+    assert reduced == ["a", "a"], reduced
+
+    # Once b leaves a gets the whole grid again
+    site.remove_member("b")
+    assert len(site) == 1
+    assert round(site.update(grid, demand("a", 16, draw=10)), 3) == 16
+    assert reduced == ["a", "a"]
+
+    key = allocator.site_key({
+        "main_breaker_rating": 25,
+        "phase_a_current_entity_id": "sensor.grid_l1",
+        "phase_b_current_entity_id": "sensor.grid_l2",
+        "phase_c_current_entity_id": "sensor.grid_l3",
+        "entity_id": "charger_1",
+    })
+    assert key == (25, "sensor.grid_l1", "sensor.grid_l2", "sensor.grid_l3")
+    print("✅ Reductions of other chargers' shares are reported right away")
+
+
+if __name__ == "__main__":
+    test_fair_share_and_priority()
+    test_admission_at_minimum_current()
+    test_single_phase_chargers()
+    test_mode_pools()
+    test_site_mode_pools()
+    test_site_updates()
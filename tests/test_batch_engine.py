@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that the vectorized batch engine matches the scalar calculation.
+Random samples are evaluated with both paths and every result must be identical.
+"""
+
+import datetime
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from component import load_module
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+const = load_module("const")
+calc = load_module("dynamic_ocpp_evse")
+calculation = load_module("calculation")
+
+START = datetime.datetime(2025, 6, 1, 12, 0, 0)
+
+
+def random_samples(rng, count, with_battery):
+    """Generate a column set of random but plausible meter readings."""
+    t = 0.0
+    columns = {key: [] for key in ("timestamp", "phase_a_current", "phase_b_current", "phase_c_current",
+                                   "phase_e_current", "evse_current_import", "max_import_power", "phases",
+                                   "min_current", "max_current", "power_buffer", "battery_soc",
+                                   "battery_power", "battery_soc_target", "allow_grid_charging")}
+    for _ in range(count):
+        t += rng.choice([1, 1, 1, 5, 60, 600, 1200])
+        columns["timestamp"].append(t)
+        columns["phase_a_current"].append(round(rng.uniform(-40, 30), 2))
+        columns["phase_b_current"].append(round(rng.uniform(-40, 30), 2))
+        columns["phase_c_current"].append(rng.choice([round(rng.uniform(-40, 30), 2), float("nan")]))
+        columns["phase_e_current"].append(round(rng.uniform(-20, 20), 2))
+        columns["evse_current_import"].append(rng.choice([round(rng.uniform(0, 16), 2), float("nan")]))
+        columns["max_import_power"].append(rng.choice([4000, 7000, 11000]))
+        columns["phases"].append(rng.choice([1, 2, 3, 3]))
+        columns["min_current"].append(rng.choice([6, 8, float("nan")]))
+        columns["max_current"].append(rng.choice([16, 10, float("nan")]))
+        columns["power_buffer"].append(rng.choice([0, 500, 2000]))
+        columns["battery_soc"].append(round(rng.uniform(0, 100), 1) if with_battery else float("nan"))
+        columns["battery_power"].append(round(rng.uniform(-5000, 5000), 1) if with_battery else float("nan"))
+        columns["battery_soc_target"].append(80)
+        columns["allow_grid_charging"].append(rng.random() < 0.8)
+    return columns
+
+
+def scalar_results(columns, config):
+    """Run the scalar path sample by sample with the Excess hold carried over."""
+    excess_charge_start_time = None
+    results = {key: [] for key in ("max_evse_available", "target_evse_standard", "target_evse_eco",
+                                   "target_evse_solar", "target_evse_excess")}
+
+    def value(key, i):
+        v = columns[key][i]
+        return None if isinstance(v, float) and v != v else v
+
+    for i, t in enumerate(columns["timestamp"]):
+        now = START + datetime.timedelta(seconds=t)
+        snapshot = calculation.InputSnapshot(
+            config,
+            phases=columns["phases"][i],
+            phase_a_current=value("phase_a_current", i),
+            phase_b_current=value("phase_b_current", i),
+            phase_c_current=value("phase_c_current", i),
+            phase_e_current=value("phase_e_current", i),
+            evse_current_import=value("evse_current_import", i),
+            max_import_power=value("max_import_power", i),
+            min_current=value("min_current", i),
+            max_current=value("max_current", i),
+            power_buffer=value("power_buffer", i),
+            battery_soc=value("battery_soc", i),
+            battery_power=value("battery_power", i),
+            battery_soc_target=value("battery_soc_target", i),
+            allow_grid_charging=columns["allow_grid_charging"][i],
+        )
+        context = calculation.get_charge_context_values(snapshot)
+        headroom = calculation.calculate_headroom(context)
+        context = context._replace(
+            headroom=headroom,
+            max_evse_available=calculation.calculate_max_evse_available(context, headroom),
+        )
+        results["max_evse_available"].append(context.max_evse_available)
+        results["target_evse_standard"].append(calculation.calculate_standard_mode(context))
+        results["target_evse_eco"].append(calculation.calculate_eco_mode(context))
+        results["target_evse_solar"].append(calculation.calculate_solar_mode(context))
+        target_evse, excess_charge_start_time = calculation.calculate_excess_mode(context, now, excess_charge_start_time)
+        results["target_evse_excess"].append(target_evse)
+    return results
+
+
+def test_batch_matches_scalar():
+    """The batch engine must reproduce the scalar results exactly."""
+    if np is None:
+        raise unittest.SkipTest("numpy is not installed")
+    batch = load_module("batch")
+    print("Testing batch engine against the scalar calculation")
+    print("=" * 50)
+    for seed in range(20):
+        rng = random.Random(seed)
+        data = {
+            const.CONF_ENTITY_ID: "dynamic_ocpp_evse",
+            const.CONF_MAIN_BREAKER_RATING: rng.choice([16, 25, 35]),
+            const.CONF_INVERT_PHASES: rng.random() < 0.3,
+            const.CONF_EVSE_SINGLE_PHASE: rng.random() < 0.3,
+            const.CONF_PHASE_VOLTAGE: rng.choice([230, 240]),
+            const.CONF_EXCESS_EXPORT_THRESHOLD: rng.choice([1000, 4000, 13000]),
+        }
+        config = calc.build_input_plan(data).config
+        columns = random_samples(rng, 500, with_battery=seed % 2 == 0)
+        expected = scalar_results(columns, config)
+        actual = batch.evaluate_batch({k: np.asarray(v, dtype=float) for k, v in columns.items()}, config)
+        for key, values in expected.items():
+            mismatches = np.flatnonzero(np.asarray(values, dtype=float) != actual[key])
+            assert mismatches.size == 0, f"seed {seed}: {key} differs at samples {mismatches[:5]}"
+    print("✅ Batch results are identical to the scalar path")
+
+
+if __name__ == "__main__":
+    try:
+        test_batch_matches_scalar()
+    except unittest.SkipTest as e:
+        print(f"Skipped: {e}")
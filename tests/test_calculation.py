@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the pure calculation core (calculation.py).
+The core must import without Home Assistant and without the state machine
+side of the integration, give the same decision as the controller for the
+same snapshot, and its immutable snapshot and decision types must survive a
+trip to a worker process.
+"""
+
+import datetime
+import os
+import pickle
+import subprocess
+import sys
+
+from helpers import CONFIG, START, calc, const, make_controller
+from component import load_module
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools")
+calculation = load_module("calculation")
+
+
+def snapshot(**inputs):
+    """Return an input snapshot with the static config of CONFIG."""
+    return calculation.InputSnapshot(
+        calc.build_input_plan(CONFIG).config,
+        phase_a_current=5.0,
+        phase_b_current=5.0,
+        phase_c_current=5.0,
+        max_import_power=20000.0,
+        phases=3,
+        charging_mode="Standard",
+        phase_e_current=0,
+        evse_current_import=0.0,
+        evse_current_offered=6.0,
+        min_current=6.0,
+        max_current=16.0,
+    )._replace(**inputs)
+
+
+def test_core_imports_without_home_assistant():
+    print("Testing cold import of the calculation core")
+    print("=" * 50)
+    code = (
+        "import sys, time; sys.path.insert(0, sys.argv[1]); from component import load_module; "
+        "started = time.perf_counter(); load_module('calculation'); elapsed = time.perf_counter() - started; "
+        "print(elapsed); print(' '.join(sorted(m for m in sys.modules if m.startswith(('dynamic_ocpp_evse', 'homeassistant')))))"
+    )
+    output = subprocess.run([sys.executable, "-c", code, TOOLS_DIR], capture_output=True, text=True, check=True).stdout.split("\n")
+    modules = output[1].split()
+    assert modules == ["dynamic_ocpp_evse", "dynamic_ocpp_evse.calculation"], modules
+    print(f"✅ Imported in {float(output[0]) * 1000:.1f}ms, loads only {', '.join(modules[1:])}")
+
+
+def test_decide_is_pure():
+    print("Testing decide")
+    print("=" * 50)
+    state = snapshot()
+    loop = calculation.LoopState()
+    first = calculation.decide(state, loop, START)
+    assert loop == calculation.LoopState()
+    assert calculation.decide(state, loop, START) == first
+    assert first.context.snapshot is state
+
+    # The ramp starts from the offered current and moves at most 0.3 A/s up
+    assert first.available_current == 6 and first.target_evse == 16
+    later = START + datetime.timedelta(seconds=10)
+    second = calculation.decide(state, first.loop, later)
+    assert second.ramp_limited and second.available_current == 9
+    assert second.loop.last_ramp_time == later
+
+    # Phase detection from the charger's phase currents
+    single = calculation.decide(snapshot(evse_phase_currents=(10.0, 0.2, 0.1)), loop, START)
+    assert (single.phases, single.calc_used) == (1, "1-1")
+    assert calculation.decide(state, loop, START).calc_used == "2-3"
+
+    # The excess hold is carried in the loop state
+    excess = calculation.decide(snapshot(
+        charging_mode="Excess", phase_a_current=-30.0, phase_b_current=-30.0, phase_c_current=-30.0,
+    ), loop, START)
+    assert excess.loop.excess_charge_start_time == START
+    try:
+        calculation.decide(snapshot(charging_mode="Turbo"), loop, START)
+        raise AssertionError("unknown charging mode must fail")
+    except ValueError:
+        pass
+    print(f"✅ Ramp {first.available_current}A -> {second.available_current}A, same decision for the same inputs")
+
+
+def test_controller_matches_core():
+    print("Testing controller against the core")
+    print("=" * 50)
+    hass, clock, controller = make_controller(charging_mode="Solar", power_limit=11000, evse_offered=8)
+    loop = calculation.LoopState()
+    for tick in range(30):
+        clock.current = START + datetime.timedelta(seconds=5 * tick)
+        for index, entity_id in enumerate(("sensor.grid_l1", "sensor.grid_l2", "sensor.grid_l3")):
+            hass.states.set(entity_id, str((tick * (index + 3)) % 17 - 12))
+        hass.states.set("sensor.charger_current_import", str(tick % 9), {"L1": str(tick % 9), "L2": "0", "L3": "0"})
+        decision = calculation.decide(calc.get_state_config(controller), loop, clock.current)
+        loop = decision.loop
+        data = controller.calculate()
+        assert data[const.CONF_AVAILABLE_CURRENT] == round(decision.available_current, 1)
+        assert data["target_evse"] == decision.target_evse
+        assert data["calc_used"] == decision.calc_used
+    assert controller.loop == loop
+    print("✅ Same decisions for 30 ticks")
+
+
+def test_snapshot_types():
+    print("Testing snapshot and context types")
+    print("=" * 50)
+    # The snapshot is built positionally from the bindings, grid inputs first
+    plan = calc.build_input_plan(CONFIG)
+    keys = tuple(binding.key for binding in plan.grid_bindings + plan.local_bindings)
+    assert keys == calculation.InputSnapshot._fields[1:-1], keys
+
+    state = snapshot()
+    decision = calculation.decide(state, calculation.LoopState(), START)
+    for value in (plan.config, state, decision, decision.context, decision.context.headroom, decision.loop):
+        assert not hasattr(value, "__dict__"), type(value).__name__
+        try:
+            value.phases = 1
+            raise AssertionError(f"{type(value).__name__} must be immutable")
+        except AttributeError:
+            pass
+    assert pickle.loads(pickle.dumps(state)) == state
+    assert pickle.loads(pickle.dumps(decision)) == decision
+    print(f"✅ Snapshot {len(pickle.dumps(state))} bytes, decision {len(pickle.dumps(decision))} bytes")
+
+
+if __name__ == "__main__":
+    test_core_imports_without_home_assistant()
+    test_decide_is_pure()
+    test_controller_matches_core()
+    test_snapshot_types()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that the control loop state survives between ticks.
+The coordinator keeps one EvseController per config entry, so the ramp goes
+on from the last ramped value instead of the offered current, and the 15
+minute excess hold started on one tick still holds many ticks later.
+"""
+
+import datetime
+
+from helpers import START, make_controller, set_grid
+from component import load_module
+
+calculation = load_module("calculation")
+
+
+def test_ramp_survives_ticks():
+    print("Testing ramp across ticks")
+    print("=" * 50)
+    # The charger keeps reporting the 6A it was offered before the first tick
+    hass, clock, controller = make_controller(grid=2, evse_import=0, evse_offered=6)
+    data = controller.calculate()
+    assert data["available_current"] == 6 and controller.loop.last_ramp_time == START
+
+    step = calculation.RAMP_LIMIT_UP * 5
+    expected = 6
+    for tick in range(1, 7):
+        clock.current = START + datetime.timedelta(seconds=5 * tick)
+        data = controller.calculate()
+        expected += step
+        assert abs(controller.loop.last_ramp_value - expected) < 1e-9, (tick, controller.loop.last_ramp_value)
+        assert data["available_current"] == controller.loop.last_ramp_value
+        assert controller.loop.last_ramp_time == clock.current
+    assert data["target_evse"] == 16 and data["available_current"] < 16
+
+    # A controller created for the tick would restart from the offered current
+    _, _, fresh = make_controller(hass=hass, clock=clock, seed=False)
+    assert fresh.calculate()["available_current"] == 6
+    print(f"✅ Ramped from 6A to {expected}A in {step}A steps")
+
+
+def test_excess_hold_survives_ticks():
+    print("Testing excess hold across ticks")
+    print("=" * 50)
+    # 90A of export is far above the excess threshold
+    hass, clock, controller = make_controller(charging_mode="Excess", grid=-30, evse_import=0, evse_offered=6)
+    data = controller.calculate()
+    assert data["target_evse"] > 6
+    assert controller.loop.excess_charge_start_time == START
+
+    # The export stops, the charger keeps the minimum current for 15 minutes
+    set_grid(hass, 0)
+    for minute in range(1, 15):
+        clock.current = START + datetime.timedelta(minutes=minute)
+        data = controller.calculate()
+        assert data["target_evse"] == 6, (minute, data["target_evse"])
+        assert controller.loop.excess_charge_start_time == START
+
+    clock.current = START + datetime.timedelta(seconds=calculation.EXCESS_HOLD_SECONDS)
+    assert controller.calculate()["target_evse"] == 0
+    print("✅ Held at 6A for 15 minutes after the export stopped")
+
+
+if __name__ == "__main__":
+    test_ramp_survives_ticks()
+    test_excess_hold_survives_ticks()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the event driven refresh of the coordinator.
+Runs the coordinator on a bare Home Assistant core with its real debouncer:
+a burst of input changes gives one refresh, state writes that change nothing
+are ignored, and after a config change only the new input entities trigger.
+Needs Home Assistant (pip install homeassistant), skipped without it.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+pytest.importorskip("homeassistant")
+from homeassistant.core import HomeAssistant
+
+from helpers import CONFIG
+from fake_hass import FakeConfigEntry
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from custom_components.dynamic_ocpp_evse.const import DEFAULT_EVENT_DEBOUNCE
+from custom_components.dynamic_ocpp_evse.coordinator import DynamicOcppEvseCoordinator
+
+# Long enough for the debouncer cooldown to run out
+SETTLE = DEFAULT_EVENT_DEBOUNCE + 0.3
+
+
+async def seed(hass, config=CONFIG, grid="5"):
+    hass.states.async_set(config["charging_mode_entity_id"], "Standard")
+    hass.states.async_set(config["min_current_entity_id"], "6")
+    hass.states.async_set(config["max_current_entity_id"], "16")
+    hass.states.async_set(config["max_import_power_entity_id"], "20000")
+    hass.states.async_set(config["evse_current_import_entity_id"], "8")
+    hass.states.async_set(config["evse_current_offered_entity_id"], "8")
+    for key in ("phase_a_current_entity_id", "phase_b_current_entity_id", "phase_c_current_entity_id"):
+        hass.states.async_set(config[key], grid)
+
+
+async def start_coordinator(config=CONFIG):
+    """Return hass and a subscribed coordinator that counts its ticks."""
+    hass = HomeAssistant(tempfile.mkdtemp())
+    await seed(hass, config)
+    coordinator = DynamicOcppEvseCoordinator(hass, FakeConfigEntry(config))
+    calculate = coordinator.controller.calculate
+    coordinator.ticks = 0
+
+    def counting_calculate():
+        coordinator.ticks += 1
+        return calculate()
+
+    coordinator.controller.calculate = counting_calculate
+    coordinator.async_subscribe_inputs()
+    return hass, coordinator
+
+
+async def stop(hass, coordinator):
+    coordinator.async_unsubscribe_inputs()
+    await coordinator.dispatcher.stop()
+    await hass.async_stop(force=True)
+
+
+def run(test):
+    asyncio.run(test())
+
+
+def test_input_burst_gives_one_refresh():
+    print("Testing debounced input changes")
+    print("=" * 50)
+
+    async def scenario():
+        hass, coordinator = await start_coordinator()
+        for current in ("6", "7", "8", "9"):
+            hass.states.async_set("sensor.grid_l1", current)
+            hass.states.async_set("sensor.charger_current_import", current)
+        await hass.async_block_till_done()
+        assert coordinator.ticks == 0
+        await asyncio.sleep(SETTLE)
+        await hass.async_block_till_done()
+        assert coordinator.ticks == 1, coordinator.ticks
+        assert coordinator.last_update_success
+        await stop(hass, coordinator)
+
+    run(scenario)
+    print("✅ 8 input changes, one refresh")
+
+
+def test_unchanged_state_is_ignored():
+    print("Testing unchanged input states")
+    print("=" * 50)
+
+    async def scenario():
+        hass, coordinator = await start_coordinator()
+        # A sensor with force_update writes the same reading again
+        for _ in range(3):
+            hass.states.async_set("sensor.grid_l1", "5", force_update=True)
+            hass.states.async_set("sensor.charger_current_import", "8", force_update=True)
+        await hass.async_block_till_done()
+        await asyncio.sleep(SETTLE)
+        await hass.async_block_till_done()
+        assert coordinator.ticks == 0, coordinator.ticks
+
+        # A changed attribute is a change
+        hass.states.async_set("sensor.charger_current_import", "8", {"L1": 8.0})
+        await asyncio.sleep(SETTLE)
+        await hass.async_block_till_done()
+        assert coordinator.ticks == 1, coordinator.ticks
+        await stop(hass, coordinator)
+
+    run(scenario)
+    print("✅ Rewrites of the same state do not refresh")
+
+
+def test_resubscribe_after_config_change():
+    print("Testing resubscription after a config change")
+    print("=" * 50)
+
+    async def scenario():
+        hass, coordinator = await start_coordinator()
+        config = dict(CONFIG, phase_a_current_entity_id="sensor.meter_l1")
+        hass.states.async_set("sensor.meter_l1", "5")
+        await coordinator.async_update_config(FakeConfigEntry(config))
+        await asyncio.sleep(SETTLE)
+        await hass.async_block_till_done()
+        assert "sensor.meter_l1" in coordinator.controller.input_plan.input_entity_ids
+        ticks = coordinator.ticks
+
+        # The replaced meter no longer triggers
+        hass.states.async_set("sensor.grid_l1", "12")
+        await asyncio.sleep(SETTLE)
+        await hass.async_block_till_done()
+        assert coordinator.ticks == ticks, coordinator.ticks
+
+        # The new one does
+        hass.states.async_set("sensor.meter_l1", "12")
+        await asyncio.sleep(SETTLE)
+        await hass.async_block_till_done()
+        assert coordinator.ticks == ticks + 1, coordinator.ticks
+        await stop(hass, coordinator)
+
+    run(scenario)
+    print("✅ Only the configured input entities trigger after a config change")
+
+
+if __name__ == "__main__":
+    test_input_burst_gives_one_refresh()
+    test_unchanged_state_is_ignored()
+    test_resubscribe_after_config_change()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the decision trace ring buffer.
+Runs ticks through the controller with a small trace and checks that the
+oldest records are overwritten and the recorded values match the tick results.
+"""
+
+import datetime
+
+from helpers import START, const, make_controller
+from component import load_module
+
+decision_trace = load_module("decision_trace")
+
+
+def test_trace_wraps_and_records_ticks():
+    print("Testing decision trace")
+    print("=" * 50)
+    hass, clock, controller = make_controller(trace_capacity=8, power_limit=11000, evse_import=0, evse_offered=0)
+
+    results = []
+    for tick in range(20):
+        clock.current = START + datetime.timedelta(seconds=5 * tick)
+        hass.states.set("sensor.grid_l1", str(tick % 7))
+        hass.states.set("sensor.grid_l2", "unavailable")
+        hass.states.set("sensor.grid_l3", "-2")
+        data = controller.calculate()
+        limit = controller.resolve_limit(data[const.CONF_AVAILABLE_CURRENT], False)
+        sent = controller.needs_dispatch(limit)
+        results.append((clock.current, tick % 7, data, limit, sent))
+
+    trace = controller.trace
+    assert len(trace) == 8
+    records = trace.records()
+    assert len(records) == 8
+    for record, (when, phase_a_current, data, limit, sent) in zip(records, results[-8:]):
+        assert record["time"] == when.isoformat()
+        assert record["charging_mode"] == "Standard"
+        assert record["phase_a_current"] == phase_a_current
+        assert record["phase_b_current"] == 0  # unavailable counts as 0
+        assert record["battery_soc"] is None  # not configured, stored as NaN
+        assert round(record["available_current"], 1) == data[const.CONF_AVAILABLE_CURRENT]
+        assert record["max_evse_available"] == data["max_evse_available"]
+        assert record["limit"] == limit
+        assert record["limit_sent"] == (limit if sent else None)
+        assert isinstance(record["ramp_limited"], bool)
+    assert len(trace.records(3)) == 3
+    assert trace.records(3) == records[-3:]
+    assert trace.as_dict()["fields"] == list(decision_trace.TRACE_FIELDS)
+    print(f"✅ Kept the last {len(records)} of {len(results)} ticks in order")
+
+
+if __name__ == "__main__":
+    test_trace_wraps_and_records_ticks()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the indexed entity auto-discovery of the config flow.
+Compares the defaults resolved from the EntityIndex with the previous
+re.match scans over the whole registry, for several inverter setups hidden
+in a large registry, and checks the ranking of the battery step selectors.
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from component import load_module
+
+discovery = load_module("discovery")
+
+FILLER_COUNT = 20000
+
+
+def scan_defaults(entity_ids):
+    """Defaults as resolved by scanning the registry once per pattern."""
+    def first(pattern):
+        return next((entity_id for entity_id in entity_ids if re.match(pattern.pattern, entity_id)), None)
+
+    phases = (None, None, None)
+    for pattern_set in discovery.PHASE_PATTERNS:
+        matches = tuple(first(pattern_set["patterns"][phase]) for phase in discovery.PHASES)
+        if all(matches):
+            phases = matches
+            break
+    else:
+        phases = list(phases)
+        for pattern_set in discovery.PHASE_PATTERNS:
+            for index, phase in enumerate(discovery.PHASES):
+                if not phases[index]:
+                    phases[index] = first(pattern_set["patterns"][phase])
+        phases = tuple(phases)
+    return phases + (
+        first(discovery.EVSE_CURRENT_IMPORT_PATTERN),
+        first(discovery.EVSE_CURRENT_OFFERED_PATTERN),
+        first(discovery.MAX_IMPORT_POWER_PATTERN),
+    )
+
+
+def index_defaults(index):
+    return index.discover_phases() + (
+        index.first_match(discovery.EVSE_CURRENT_IMPORT_PATTERN),
+        index.first_match(discovery.EVSE_CURRENT_OFFERED_PATTERN),
+        index.first_match(discovery.MAX_IMPORT_POWER_PATTERN),
+    )
+
+
+def registry(setup):
+    entities = [(f"sensor.filler_{i}_temperature", "temperature") for i in range(FILLER_COUNT // 2)]
+    entities += [(f"switch.filler_{i}", None) for i in range(FILLER_COUNT // 2)]
+    entities[FILLER_COUNT // 3:FILLER_COUNT // 3] = setup
+    return entities
+
+
+SETUPS = {
+    "SolarEdge": [
+        ("sensor.solaredge_m1_ac_current_a", "current"),
+        ("sensor.solaredge_m1_ac_current_b", "current"),
+        ("sensor.solaredge_m1_ac_current_c", "current"),
+        ("sensor.charger_current_import", "current"),
+        ("sensor.charger_current_offered", "current"),
+        ("sensor.grid_power_limit", "power"),
+    ],
+    "Deye internal CTs after a partial match": [
+        ("sensor.deye_external_ct1_current", "current"),
+        ("sensor.deye_internal_ct1_current", "current"),
+        ("sensor.deye_internal_ct2_current", "current"),
+        ("sensor.deye_internal_ct3_current", "current"),
+    ],
+    "Partial phases from different sets": [
+        ("sensor.inverter_grid_l1", "power"),
+        ("sensor.meter_current_s", "current"),
+        ("sensor.charger_current_import", "current"),
+    ],
+    "Nothing to find": [],
+}
+
+
+def test_index_matches_registry_scan():
+    print("Testing indexed discovery")
+    print("=" * 50)
+    for name, setup in SETUPS.items():
+        entities = registry(setup)
+        started = time.perf_counter()
+        index = discovery.EntityIndex(entities)
+        defaults = index_defaults(index)
+        index_time = time.perf_counter() - started
+        started = time.perf_counter()
+        expected = scan_defaults([entity_id for entity_id, _ in entities])
+        scan_time = time.perf_counter() - started
+        assert defaults == expected, (name, defaults, expected)
+        print(f"✅ {name}: index {index_time * 1000:.1f}ms, scans {scan_time * 1000:.1f}ms")
+
+    index = discovery.EntityIndex(registry(SETUPS["SolarEdge"]))
+    assert index.entity_ids("sensor", "power") == ["sensor.grid_power_limit"]
+    assert len(index.entity_ids("switch")) == FILLER_COUNT // 2
+
+
+class FakeState:
+    def __init__(self, entity_id, device_class):
+        self.entity_id = entity_id
+        self.attributes = {"device_class": device_class} if device_class else {}
+
+
+def test_battery_candidates_are_ranked():
+    print("Testing battery selector ranking")
+    print("=" * 50)
+    states = [FakeState(f"sensor.phone_{i}_battery_level", "battery") for i in range(200)]
+    states += [FakeState(f"sensor.device_{i}_power", "power") for i in range(500)]
+    states += [
+        FakeState("sensor.car_battery_soc", "battery"),
+        FakeState("sensor.inverter_battery_soc", "battery"),
+        FakeState("sensor.inverter_battery_power", "power"),
+        FakeState("sensor.inverter_pv_power", "power"),
+        FakeState("sensor.untyped_battery_soc", None),
+    ]
+    sensors = discovery.EntityIndex.from_states(states)
+    soc_ranked = discovery.rank_entities(sensors.entity_ids("sensor", "battery"), discovery.BATTERY_SOC_HINTS)
+    power_ranked = discovery.rank_entities(sensors.entity_ids("sensor", "power"), discovery.BATTERY_POWER_HINTS)
+    assert len(soc_ranked) == 202  # the untyped sensor is not a battery candidate
+
+    # The home battery ranks first and is preselected, car and phone batteries rank lower
+    assert discovery.best_match(soc_ranked) == "sensor.inverter_battery_soc"
+    assert discovery.best_match(power_ranked) == "sensor.inverter_battery_power"
+    assert dict((entity_id, score) for score, entity_id in soc_ranked)["sensor.car_battery_soc"] < discovery.STRONG_MATCH_SCORE
+    assert soc_ranked[-1][1].startswith("sensor.phone_")
+    assert power_ranked[-1][1] == "sensor.inverter_pv_power"
+    assert discovery.best_match(discovery.rank_entities(["sensor.phone_battery_level"], discovery.BATTERY_SOC_HINTS)) is None
+
+    # The select options are cut off, a configured entity below the cut is kept
+    options = discovery.selector_options(power_ranked, "sensor.device_499_power", limit=10)
+    assert options[:2] == ["None", "sensor.inverter_battery_power"]
+    assert len(options) == 12 and options[-1] == "sensor.device_499_power"
+    assert discovery.selector_options(power_ranked, "None", limit=10)[-1] != "sensor.device_499_power"
+
+    # Entities below the cut can be typed in, and must exist
+    selector = discovery.entity_select_selector(power_ranked, limit=10)["select"]
+    assert selector["custom_value"] and len(selector["options"]) == 11
+    known = {state.entity_id: state for state in states}
+    values = {"power": "sensor.device_499_power", "soc": "None", "typo": "sensor.device_500_power"}
+    assert discovery.unknown_entities(values, known) == ["typo"]
+    print(f"✅ {len(soc_ranked)} SOC and {len(power_ranked)} power candidates ranked")
+
+
+if __name__ == "__main__":
+    test_index_matches_registry_scan()
+    test_battery_candidates_are_ranked()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the charging profile dispatch rules.
+Checks the deadband, the minimum interval with latest wins coalescing and the
+immediate bypass for stopping and safety reductions.
+"""
+
+import datetime
+
+from helpers import const, make_controller as make_test_controller
+
+
+def make_controller(deadband=0.5, min_interval=10):
+    hass, clock, controller = make_test_controller({
+        const.CONF_ENTITY_ID: "dynamic_ocpp_evse",
+        const.CONF_DISPATCH_DEADBAND: deadband,
+        const.CONF_DISPATCH_MIN_INTERVAL: min_interval,
+    }, seed=False)
+    return controller, clock
+
+
+def advance(clock, seconds):
+    clock.current += datetime.timedelta(seconds=seconds)
+
+
+def test_deadband_and_min_interval():
+    print("Testing dispatch deadband and minimum interval")
+    print("=" * 50)
+    controller, clock = make_controller()
+    assert controller.needs_dispatch(10.0)  # first profile
+    advance(clock, 30)
+    assert not controller.needs_dispatch(10.3)  # within the deadband
+    assert controller.pending_dispatch_delay() is None
+    assert controller.needs_dispatch(10.5)
+    assert controller.last_set_current == 10.5
+
+    # Changes inside the minimum interval are held back, the latest one wins
+    advance(clock, 2)
+    assert not controller.needs_dispatch(12.0)
+    assert controller.pending_dispatch_delay() == 8
+    advance(clock, 3)
+    assert not controller.needs_dispatch(13.0)
+    assert controller.pending_dispatch_delay() == 5
+    advance(clock, 5)
+    assert controller.needs_dispatch(13.0)
+    assert controller.pending_dispatch_delay() is None
+    assert controller.last_set_current == 13.0
+    assert controller.commands_sent == 3
+    assert controller.commands_suppressed == 3
+    print(f"✅ {controller.commands_sent} profiles sent, {controller.commands_suppressed} suppressed")
+
+
+def test_safety_bypass():
+    print("Testing dispatch bypass for stopping and safety reductions")
+    print("=" * 50)
+    controller, clock = make_controller()
+    assert controller.needs_dispatch(16.0)
+
+    # Stopping is always sent immediately
+    advance(clock, 1)
+    assert controller.needs_dispatch(0)
+    advance(clock, 1)
+    assert not controller.needs_dispatch(8.0)  # restart waits for the interval
+
+    controller, clock = make_controller()
+    assert controller.needs_dispatch(16.0)
+    advance(clock, 1)
+    # An ordinary reduction waits for the interval
+    controller._max_evse_available = 20
+    assert not controller.needs_dispatch(12.0)
+    # The last sent limit exceeds what the grid can supply, reduce immediately
+    controller._max_evse_available = 12
+    assert controller.needs_dispatch(12.0)
+    assert controller.last_set_current == 12.0
+    print("✅ Stopping and safety reductions bypass the deadband and the interval")
+
+
+if __name__ == "__main__":
+    test_deadband_and_min_interval()
+    test_safety_bypass()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the background charging profile dispatcher.
+Uses a fake charger that can be slow or offline and checks latest value
+coalescing, timeouts, retries with backoff and the circuit breaker.
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from component import load_module
+
+dispatcher = load_module("dispatcher")
+
+
+class FakeCharger:
+    def __init__(self):
+        self.online = True
+        self.delay = 0
+        self.calls = []
+        self.received = []
+
+    async def set_charge_rate(self, limit):
+        self.calls.append(limit)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if not self.online:
+            raise ConnectionError("charger offline")
+        self.received.append(limit)
+
+
+def make_dispatcher(charger, **kwargs):
+    options = dict(timeout=0.05, retry_base=0.01, retry_max=0.04, failure_threshold=3, breaker_cooldown=0.2)
+    options.update(kwargs)
+    return dispatcher.ChargeRateDispatcher(charger.set_charge_rate, **options)
+
+
+async def wait_for(condition, timeout=2):
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    while not condition():
+        assert loop.time() < end, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+async def check_latest_value_and_timeout():
+    charger = FakeCharger()
+    attempts = []
+    worker = make_dispatcher(charger, on_attempt=lambda seconds, ok: attempts.append((seconds, ok)))
+    worker.start()
+
+    # Submitting never waits for the charger, a slow call is abandoned after the timeout
+    charger.delay = 1
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    worker.submit(10)
+    assert loop.time() - started < 0.01
+    await wait_for(lambda: worker.failed == 1)
+
+    # Limits submitted while the worker is retrying collapse to the latest one
+    charger.delay = 0
+    worker.submit(11)
+    worker.submit(12)
+    worker.submit(13)
+    await wait_for(lambda: worker.pending is None and charger.received)
+    assert charger.received == [13], charger.received
+    assert worker.replaced >= 2
+
+    # Every call is timed, also the ones that failed
+    assert attempts[0][0] >= 0.05 and not attempts[0][1]
+    assert attempts[-1][1] and len(attempts) == worker.sent + worker.failed
+    await worker.stop()
+
+
+async def check_circuit_breaker():
+    charger = FakeCharger()
+    sent = []
+    worker = make_dispatcher(charger, on_sent=sent.append)
+    worker.start()
+    charger.online = False
+    worker.submit(8)
+    await wait_for(lambda: worker.breaker == dispatcher.BREAKER_OPEN)
+    calls_when_opened = len(charger.calls)
+    assert calls_when_opened == 3
+
+    # No calls while the breaker is open, newer limits replace the pending one
+    worker.submit(9)
+    await asyncio.sleep(0.1)
+    assert len(charger.calls) == calls_when_opened
+
+    # The probe after the cooldown succeeds and closes the breaker
+    charger.online = True
+    await wait_for(lambda: worker.breaker == dispatcher.BREAKER_CLOSED and sent)
+    assert sent == [9]
+    assert worker.as_dict()["dispatch_failures"] == 0
+    await worker.stop()
+
+
+def test_latest_value_and_timeout():
+    print("Testing dispatcher coalescing and timeout")
+    print("=" * 50)
+    asyncio.run(check_latest_value_and_timeout())
+    print("✅ Slow calls time out and only the latest limit is sent")
+
+
+def test_circuit_breaker():
+    print("Testing dispatcher circuit breaker")
+    print("=" * 50)
+    asyncio.run(check_circuit_breaker())
+    print("✅ Offline charger is not called until the probe after the cooldown")
+
+
+if __name__ == "__main__":
+    test_latest_value_and_timeout()
+    test_circuit_breaker()
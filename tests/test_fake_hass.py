@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that the fake state machine of the tests and tools
+writes states like the Home Assistant one.
+Runs the same writes on both and compares what the controller reads from a
+state: the value, the attributes, the timestamps and whether the State
+object was replaced.
+Needs Home Assistant (pip install homeassistant), skipped without it.
+"""
+
+import asyncio
+import datetime
+import tempfile
+
+import pytest
+
+pytest.importorskip("homeassistant")
+from homeassistant.core import HomeAssistant
+
+from helpers import START
+from fake_hass import FakeStates
+
+WRITES = (
+    ("5", {}),
+    # Same state and attributes, only reported again
+    ("5", {}),
+    # Changed attributes update the state, the value did not change
+    ("5", {"unit_of_measurement": "A"}),
+    ("6", {"unit_of_measurement": "A"}),
+)
+
+
+def timeline(state, times):
+    """Return the writes the timestamps of state were taken from."""
+    return tuple(
+        times.index(value) if value is not None else None
+        for value in (state.last_changed, state.last_updated, getattr(state, "last_reported", None))
+    )
+
+
+def test_fake_states_write_like_home_assistant():
+    print("Testing fake state machine")
+    print("=" * 50)
+
+    async def scenario():
+        hass = HomeAssistant(tempfile.mkdtemp())
+        real_times = []
+        real = []
+        for value, attributes in WRITES:
+            await asyncio.sleep(0.001)
+            hass.states.async_set("sensor.grid_l1", value, attributes)
+            state = hass.states.get("sensor.grid_l1")
+            real_times.append(getattr(state, "last_reported", state.last_updated))
+            real.append(state)
+        await hass.async_stop(force=True)
+        return real, real_times
+
+    real, real_times = asyncio.run(scenario())
+    # Home Assistant before 2024.3 has no last_reported
+    fake_states = FakeStates(reports=hasattr(real[0], "last_reported"))
+    fake_times = [START + datetime.timedelta(seconds=write) for write in range(len(WRITES))]
+    fake = []
+    for (value, attributes), when in zip(WRITES, fake_times):
+        fake_states.set("sensor.grid_l1", value, attributes, last_updated=when)
+        fake.append(fake_states.get("sensor.grid_l1"))
+
+    for write in range(len(WRITES)):
+        assert (fake[write].state, fake[write].attributes) == (real[write].state, dict(real[write].attributes))
+        assert (fake[write] is fake[write - 1]) == (real[write] is real[write - 1]), write
+        # Compare the end states, the real State objects are mutated in place
+        assert timeline(fake[write], fake_times) == timeline(real[write], real_times), write
+    print("✅ Same values, timestamps and State objects as Home Assistant")
+
+
+if __name__ == "__main__":
+    test_fake_states_write_like_home_assistant()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the grid snapshot shared by config entries.
+Two controllers on the same grid sensors share one cache, the second one in
+a tick must reuse the readings of the first one instead of reading the
+grid sensors again.
+"""
+
+import datetime
+
+from helpers import CONFIG, START, CountingStates, calc, make_controller as make_test_controller
+from component import load_module
+from fake_hass import FakeHass, VirtualClock
+
+grid_snapshot = load_module("grid_snapshot")
+
+GRID_INPUT_ENTITY_IDS = {"sensor.grid_l1", "sensor.grid_l2", "sensor.grid_l3", "sensor.power_limit"}
+
+
+def make_controller(hass, clock, cache, **overrides):
+    controller = make_test_controller(dict(CONFIG, **overrides), hass, clock, seed=False)[2]
+    controller.grid = cache
+    return controller
+
+
+def test_entries_share_grid_snapshot():
+    print("Testing shared grid snapshot")
+    print("=" * 50)
+    hass = FakeHass()
+    hass.states = CountingStates(hass.states, GRID_INPUT_ENTITY_IDS)
+    clock = VirtualClock(START)
+    cache = grid_snapshot.GridSnapshotCache()
+    first = make_controller(hass, clock, cache)
+    second = make_controller(hass, clock, cache, entity_id="second_charger")
+    hass.states.set("sensor.grid_l1", "2000", {"unit_of_measurement": "W"})
+    hass.states.set("sensor.grid_l2", "4")
+    hass.states.set("sensor.grid_l3", "-2")
+    hass.states.set("sensor.power_limit", "11000")
+
+    state = calc.get_state_config(first)
+    assert hass.states.reads == 4
+    assert round(state.phase_a_current, 3) == round(2000 / 230, 3)
+
+    # The second entry of the tick reuses the normalized readings
+    hass.states.set("sensor.grid_l2", "9")
+    assert calc.get_state_config(second).phase_b_current == 4
+    assert hass.states.reads == 4
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # A changed grid sensor invalidates the snapshot for every entry
+    cache.invalidate("sensor.grid_l2")
+    assert calc.get_state_config(second).phase_b_current == 9
+    assert hass.states.reads == 8
+    assert calc.get_state_config(first).phase_b_current == 9
+    assert hass.states.reads == 8
+
+    # The next tick reads the grid again
+    clock.current = START + datetime.timedelta(seconds=1)
+    calc.get_state_config(first)
+    assert hass.states.reads == 12
+
+    # A different phase voltage converts W differently and gets its own snapshot
+    other_voltage = make_controller(hass, clock, cache, phase_voltage=240)
+    state = calc.get_state_config(other_voltage)
+    assert round(state.phase_a_current, 3) == round(2000 / 240, 3)
+    assert len(cache) == 2
+
+    # Snapshots are read only
+    snapshot = cache.get(first.input_plan, clock(), first.read_grid_inputs)
+    try:
+        snapshot.values[0] = 0
+        raise AssertionError("snapshot values must be read only")
+    except TypeError:
+        pass
+    print(f"✅ {cache.hits} snapshot hits, {cache.misses} grid reads")
+
+
+if __name__ == "__main__":
+    test_entries_share_grid_snapshot()
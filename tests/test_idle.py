@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the idle fast path of the controller.
+While the connector status says that no vehicle is connected a tick must
+only read the status, keep a prepared limit up to date at a slow pace and
+hand it over once when a vehicle is plugged in.
+"""
+
+import datetime
+
+from helpers import CONFIG, START, CountingStates, const, make_controller, make_site, set_grid
+
+STATUS_ENTITY_ID = "sensor.charger_status_connector"
+
+
+def test_idle_fast_path():
+    print("Testing idle fast path")
+    print("=" * 50)
+    config = dict(CONFIG, evse_status_entity_id=STATUS_ENTITY_ID)
+    hass, clock, controller = make_controller(config, phases=3, grid=5, evse_import=0, evse_offered=0)
+    hass.states = CountingStates(hass.states)
+    hass.states.set(STATUS_ENTITY_ID, "Available")
+
+    # The first idle tick prepares a limit with a full calculation, the ramp starts from the minimum
+    data = controller.calculate()
+    assert data["idle"]
+    assert data["update_interval"] == const.DEFAULT_IDLE_UPDATE_INTERVAL
+    assert data["target_evse"] == 16 and data[const.CONF_AVAILABLE_CURRENT] == 6
+    records = len(controller.trace)
+
+    # Further idle ticks only read the status
+    for second in range(1, 100):
+        clock.current = START + datetime.timedelta(seconds=second)
+        reads = hass.states.reads
+        data = controller.calculate()
+        assert data["idle"]
+        assert hass.states.reads - reads == 1
+    assert len(controller.trace) == records
+
+    # The prepared limit is refreshed at a slow pace
+    set_grid(hass, 15)
+    clock.current = START + datetime.timedelta(seconds=const.DEFAULT_IDLE_PREPARE_INTERVAL)
+    data = controller.calculate()
+    assert data["target_evse"] == 10 and data[const.CONF_AVAILABLE_CURRENT] == 6
+
+    # Plugging in hands the prepared limit over once and resumes full control
+    hass.states.set(STATUS_ENTITY_ID, "Preparing")
+    assert not controller.is_idle()
+    assert controller.take_prepared_limit() == 6
+    assert controller.take_prepared_limit() is None
+    data = controller.calculate()
+    assert not data["idle"]
+    assert len(controller.trace) == records + 2
+    print(f"✅ Idle ticks read 1 entity, prepared limit {data[const.CONF_AVAILABLE_CURRENT]}A handed over on plug-in")
+
+
+def test_idle_charger_leaves_site_share():
+    print("Testing idle charger on a shared grid connection")
+    print("=" * 50)
+    # 15A per phase left on the 25A breaker, a is unplugged and b is charging
+    hass, clock, site, controllers = make_site(("a", "b"), grid=10, evse_import=0, evse_offered=0)
+    hass.states.set("sensor.a_status_connector", "Available")
+    hass.states.set("sensor.b_status_connector", "Charging")
+    a, b = controllers["a"], controllers["b"]
+    for second in range(0, 2 * const.DEFAULT_IDLE_PREPARE_INTERVAL + 1, 10):
+        clock.current = START + datetime.timedelta(seconds=second)
+        prepared = a.calculate()
+        data = b.calculate()
+        hass.states.set("sensor.b_current_import", str(data[const.CONF_AVAILABLE_CURRENT]))
+        set_grid(hass, 10 + data[const.CONF_AVAILABLE_CURRENT])
+        assert data[const.CONF_AVAILABLE_CURRENT] == 15, data
+        assert "a" not in site.allocation
+
+    # The prepared target is what a would get next to b
+    assert prepared["idle"] and prepared["target_evse"] == 7.5, prepared
+
+    # Plugging in takes a share again
+    hass.states.set("sensor.a_status_connector", "Preparing")
+    clock.current += datetime.timedelta(seconds=10)
+    a.calculate()
+    assert round(site.allocation["a"], 3) == 7.5
+    print(f"✅ Charging neighbour keeps {data[const.CONF_AVAILABLE_CURRENT]}A, prepared target {prepared['target_evse']}A")
+
+
+def test_plug_in_after_long_idle_ramps_up():
+    print("Testing the ramp after a plug-in")
+    print("=" * 50)
+    config = dict(CONFIG, evse_status_entity_id=STATUS_ENTITY_ID)
+    hass, clock, controller = make_controller(config, phases=3, grid=5, evse_import=0, evse_offered=0)
+    # Charging ended at 6A long before the vehicle left
+    hass.states.set(STATUS_ENTITY_ID, "Charging")
+    controller.calculate()
+    ramp_time = controller.loop.last_ramp_time
+    hass.states.set(STATUS_ENTITY_ID, "Available")
+    for minute in range(1, 120):
+        clock.current = START + datetime.timedelta(minutes=minute)
+        controller.calculate()
+    assert controller.loop.last_ramp_time == ramp_time
+
+    # The first limit after the plug-in starts from the minimum instead of jumping to 16A
+    hass.states.set(STATUS_ENTITY_ID, "Preparing")
+    assert controller.take_prepared_limit() == 6
+    clock.current += datetime.timedelta(seconds=1)
+    data = controller.calculate()
+    assert data["ramp_limited"] and data["target_evse"] == 16, data
+    assert data[const.CONF_AVAILABLE_CURRENT] == 6, data
+    clock.current += datetime.timedelta(seconds=5)
+    data = controller.calculate()
+    assert data["ramp_limited"] and data[const.CONF_AVAILABLE_CURRENT] == 7.5, data
+    print(f"✅ Ramped from 6A to {data[const.CONF_AVAILABLE_CURRENT]}A after 2 hours idle")
+
+
+def test_without_status_entity_never_idles():
+    print("Testing controller without status entity")
+    print("=" * 50)
+    hass, clock, controller = make_controller(seed=False)
+    hass.states.set(STATUS_ENTITY_ID, "Available")
+    assert not controller.is_idle()
+    print("✅ Full control on every tick")
+
+
+if __name__ == "__main__":
+    test_idle_fast_path()
+    test_idle_charger_leaves_site_share()
+    test_plug_in_after_long_idle_ramps_up()
+    test_without_status_entity_never_idles()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the input plan compiled from the config entry.
+Options left at 'None' are not read and fall back to their defaults, power
+meters are converted from W to A with the configured phase voltage, and the
+plan is only built when the config entry is loaded or changed, never on a
+tick.
+"""
+
+import datetime
+
+from helpers import CONFIG, START, calc, const, make_controller
+from fake_hass import FakeConfigEntry
+
+
+def binding(plan, key):
+    return next(b for b in plan.bindings if b.key == key)
+
+
+def test_none_options():
+    print("Testing 'None' options")
+    print("=" * 50)
+    config = dict(
+        CONFIG,
+        phase_b_current_entity_id="None",
+        phase_c_current_entity_id="",
+        battery_soc_entity_id="None",
+        power_buffer_entity_id="None",
+    )
+    plan = calc.build_input_plan(config)
+    for key, default in (
+        (const.CONF_PHASE_B_CURRENT, 0),
+        (const.CONF_PHASE_C_CURRENT, 0),
+        ("battery_soc", None),
+        (const.CONF_POWER_BUFFER, 0),
+    ):
+        assert binding(plan, key).entity_id is None and binding(plan, key).default == default, key
+    assert plan.entity_ids[const.CONF_PHASE_B_CURRENT_ENTITY_ID] is None
+    assert "None" not in plan.input_entity_ids and None not in plan.input_entity_ids
+    assert plan.input_entity_ids[0] == "sensor.grid_l1"
+
+    # The unset inputs read as their defaults without touching the state machine
+    hass, clock, controller = make_controller(config, grid=5, evse_import=0, evse_offered=6)
+    snapshot = calc.get_state_config(controller)
+    assert (snapshot.phase_b_current, snapshot.phase_c_current, snapshot.battery_soc, snapshot.power_buffer) == (0, 0, None, 0)
+    print("✅ 'None' options are not read")
+
+
+def test_power_to_current():
+    print("Testing W to A conversion")
+    print("=" * 50)
+    config = dict(CONFIG, phase_voltage=240)
+    plan = calc.build_input_plan(config)
+    assert plan.config.phase_voltage == 240 and plan.grid_key[0] == 240
+    assert plan.grid_key != calc.build_input_plan(CONFIG).grid_key
+
+    hass, clock, controller = make_controller(config, evse_import=0, evse_offered=6)
+    hass.states.set("sensor.grid_l1", "2400", {"unit_of_measurement": "W"}, last_updated=START)
+    hass.states.set("sensor.grid_l2", "-480", {"unit_of_measurement": "W"}, last_updated=START)
+    hass.states.set("sensor.grid_l3", "3", {"unit_of_measurement": "A"}, last_updated=START)
+    snapshot = calc.get_state_config(controller)
+    assert (snapshot.phase_a_current, snapshot.phase_b_current, snapshot.phase_c_current) == (10.0, -2.0, 3.0), snapshot
+    print("✅ 2400W at 240V reads as 10A, readings in A are kept")
+
+
+def test_plan_built_on_config_change_only():
+    print("Testing when the plan is built")
+    print("=" * 50)
+    build_input_plan = calc.build_input_plan
+    builds = []
+
+    def counting_build(config_data):
+        builds.append(config_data)
+        return build_input_plan(config_data)
+
+    calc.build_input_plan = counting_build
+    try:
+        hass, clock, controller = make_controller(grid=5, evse_import=0, evse_offered=6)
+        assert len(builds) == 1
+        plan = controller.input_plan
+        for tick in range(1, 11):
+            clock.current = START + datetime.timedelta(seconds=tick)
+            controller.calculate()
+        assert len(builds) == 1 and controller.input_plan is plan
+
+        controller.update_config(FakeConfigEntry(dict(CONFIG, phase_voltage=240)))
+        assert len(builds) == 2 and controller.input_plan is not plan
+        assert controller.input_plan.config.phase_voltage == 240
+    finally:
+        calc.build_input_plan = build_input_plan
+    print("✅ Built once per config entry, 10 ticks reuse it")
+
+
+if __name__ == "__main__":
+    test_none_options()
+    test_power_to_current()
+    test_plan_built_on_config_change_only()
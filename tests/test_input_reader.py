@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the typed input reader.
+Inputs are parsed once per State object, unknown and unavailable states
+read as None instead of raw strings, and a meter that stopped reporting or
+is unavailable is flagged as stale so the controller holds the current.
+Without last_reported a steady meter is never stale.
+"""
+
+import datetime
+
+from helpers import CONFIG, START, calc, const, make_controller, set_grid
+from fake_hass import FakeHass
+
+
+class CountingValue(str):
+    """State value that counts how often it is parsed."""
+
+    parsed = 0
+
+    def __float__(self):
+        CountingValue.parsed += 1
+        return float(str(self))
+
+
+def binding(controller, key):
+    return next(b for b in controller.input_plan.grid_bindings + controller.input_plan.local_bindings if b.key == key)
+
+
+def test_readings():
+    print("Testing typed readings")
+    print("=" * 50)
+    hass, clock, controller = make_controller(power_limit=11000, evse_import=8, evse_offered=8)
+    now = START.timestamp()
+    set_grid(hass, "5", last_updated=START, last_reported=START)
+    reading = calc.read_input(controller, binding(controller, const.CONF_PHASE_A_CURRENT), now)
+    assert reading == calc.Reading(5.0, calc.READING_VALID, 0.0), reading
+
+    # Unknown, unavailable and missing entities read as None
+    for value in ("unavailable", "unknown", ""):
+        hass.states.set("sensor.charger_current_offered", value)
+        reading = calc.read_input(controller, binding(controller, const.CONF_EVSE_CURRENT_OFFERED), now)
+        assert reading == calc.Reading(None, calc.READING_UNAVAILABLE), reading
+    reading = calc.read_input(controller, binding(controller, const.CONF_POWER_BUFFER), now)
+    assert reading == calc.Reading(0, calc.READING_VALID)
+    hass.states._states.pop("sensor.charger_current_offered")
+    assert calc.read_input(controller, binding(controller, const.CONF_EVSE_CURRENT_OFFERED), now).status == calc.READING_UNAVAILABLE
+
+    # Non numeric inputs keep their value, numbers in attributes keep their type
+    assert calc.read_input(controller, binding(controller, const.CONF_CHARGING_MODE), now).value == "Standard"
+    hass.states.set(f"sensor.{CONFIG['entity_id']}", "0", {const.CONF_PHASES: 3})
+    assert calc.read_input(controller, binding(controller, const.CONF_PHASES), now).value == 3
+    print("✅ Numbers, None for unavailable states")
+
+
+def test_parse_cache():
+    print("Testing per entity parse cache")
+    print("=" * 50)
+    hass, clock, controller = make_controller(power_limit=11000, evse_import=8, evse_offered=8)
+    set_grid(hass, CountingValue("5"), last_updated=START)
+    for tick in range(10):
+        clock.current = START + datetime.timedelta(seconds=tick)
+        controller.calculate()
+    # One parse per meter, the unchanged State objects are only compared
+    assert CountingValue.parsed == 3, CountingValue.parsed
+
+    clock.current += datetime.timedelta(seconds=1)
+    hass.states.set("sensor.grid_l1", CountingValue("7"), last_updated=clock.current)
+    controller.calculate()
+    assert CountingValue.parsed == 4
+    assert calc.get_state_config(controller).phase_a_current == 7.0
+    print("✅ 10 ticks, each meter parsed once")
+
+
+def test_stale_meter_holds_current():
+    print("Testing stale meter")
+    print("=" * 50)
+    hass, clock, controller = make_controller(power_limit=11000, evse_import=8, evse_offered=8)
+    set_grid(hass, "5", last_updated=START, last_reported=START)
+    data = controller.calculate()
+    assert data["stale_inputs"] == []
+    held = data[const.CONF_AVAILABLE_CURRENT]
+
+    # The meters stop reporting while their last reading leaves room to raise
+    clock.current = START + datetime.timedelta(seconds=const.DEFAULT_STALE_INPUT_AGE + 10)
+    reading = calc.read_input(controller, binding(controller, const.CONF_PHASE_A_CURRENT), clock.current.timestamp())
+    assert reading.status == calc.READING_STALE and reading.age == const.DEFAULT_STALE_INPUT_AGE + 10
+    for tick in range(5):
+        clock.current += datetime.timedelta(seconds=10)
+        data = controller.calculate()
+        assert data["stale_inputs"] == [const.CONF_PHASE_A_CURRENT, const.CONF_PHASE_B_CURRENT, const.CONF_PHASE_C_CURRENT]
+        assert data[const.CONF_AVAILABLE_CURRENT] == held, data[const.CONF_AVAILABLE_CURRENT]
+
+    # Ramping goes on once the meters report again, the unchanged value only moves last_reported
+    state = hass.states.get("sensor.grid_l1")
+    set_grid(hass, "5", last_updated=clock.current)
+    assert hass.states.get("sensor.grid_l1") is state
+    assert state.last_updated == START and state.last_reported == clock.current
+    clock.current += datetime.timedelta(seconds=10)
+    data = controller.calculate()
+    assert data["stale_inputs"] == []
+    assert data[const.CONF_AVAILABLE_CURRENT] > held
+    print(f"✅ Held at {held}A while the meters were stale")
+
+
+def steady_meter_controller(reports=True):
+    """Return a controller limited by 20A on phases A and B, phase C stays at 10A."""
+    hass, clock, controller = make_controller(hass=FakeHass(reports), power_limit=20000, evse_import=8, evse_offered=8)
+    for entity_id, current in (("sensor.grid_l1", "20"), ("sensor.grid_l2", "20"), ("sensor.grid_l3", "10")):
+        hass.states.set(entity_id, current, last_updated=START)
+    for tick in range(10):
+        clock.current = START + datetime.timedelta(seconds=10 * tick)
+        data = controller.calculate()
+    assert data[const.CONF_AVAILABLE_CURRENT] == 13, data[const.CONF_AVAILABLE_CURRENT]
+    return hass, clock, controller
+
+
+def test_steady_meter_without_last_reported():
+    print("Testing steady meter before Home Assistant 2024.3")
+    print("=" * 50)
+    # States without last_reported, phase C keeps its value for longer than the max age
+    hass, clock, controller = steady_meter_controller(reports=False)
+    clock.current = START + datetime.timedelta(seconds=const.DEFAULT_STALE_INPUT_AGE + 100)
+    hass.states.set("sensor.grid_l1", "10", last_updated=clock.current)
+    hass.states.set("sensor.grid_l2", "10", last_updated=clock.current)
+    for tick in range(5):
+        clock.current += datetime.timedelta(seconds=10)
+        data = controller.calculate()
+        assert data["stale_inputs"] == []
+    # The headroom opened up on A and B, the limit rises to the max current
+    assert data[const.CONF_AVAILABLE_CURRENT] == 16, data[const.CONF_AVAILABLE_CURRENT]
+    print("✅ Steady phase C is not stale, the limit rose from 13A to 16A")
+
+
+def test_unavailable_meter_holds_current():
+    print("Testing unavailable meter")
+    print("=" * 50)
+    hass, clock, controller = steady_meter_controller()
+    clock.current += datetime.timedelta(seconds=10)
+    hass.states.set("sensor.grid_l1", "10", last_updated=clock.current)
+    hass.states.set("sensor.grid_l2", "10", last_updated=clock.current)
+    hass.states.set("sensor.grid_l3", "unavailable", last_updated=clock.current)
+    for tick in range(5):
+        clock.current += datetime.timedelta(seconds=10)
+        data = controller.calculate()
+        assert data["stale_inputs"] == [const.CONF_PHASE_C_CURRENT]
+        assert data[const.CONF_AVAILABLE_CURRENT] == 13
+    print("✅ Held at 13A while phase C is unavailable")
+
+
+def test_unavailable_offered_current():
+    print("Testing unavailable offered current")
+    print("=" * 50)
+    hass, clock, controller = make_controller(power_limit=11000, evse_import=8, evse_offered=8)
+    set_grid(hass, "5", last_updated=START)
+    hass.states.set("sensor.charger_current_offered", "unavailable")
+    # The first ramp starts from the available current instead of the raw string
+    data = controller.calculate()
+    assert data[const.CONF_AVAILABLE_CURRENT] == data["target_evse"]
+    print(f"✅ First ramp at {data[const.CONF_AVAILABLE_CURRENT]}A")
+
+
+if __name__ == "__main__":
+    test_readings()
+    test_parse_cache()
+    test_stale_meter_holds_current()
+    test_steady_meter_without_last_reported()
+    test_unavailable_meter_holds_current()
+    test_unavailable_offered_current()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the tick and dispatch instrumentation.
+Checks the rolling percentiles, the commands per hour, the counters fed by
+the controller and the dispatcher, and that recording a sample stays cheap.
+"""
+
+import asyncio
+import datetime
+import time
+
+from helpers import CONFIG, FakeMonotonic, START, const, make_controller
+from component import load_module
+
+dispatcher = load_module("dispatcher")
+metrics = load_module("metrics")
+
+
+def test_rolling_percentiles():
+    print("Testing rolling percentiles")
+    print("=" * 50)
+    window = metrics.LatencyWindow(size=100)
+    assert window.percentiles()["p50"] is None
+    for ms in range(1, 101):
+        window.record(ms / 1000)
+    assert window.percentiles() == {"p50": 50.0, "p95": 95.0, "p99": 99.0}
+    # Only the most recent samples count
+    for _ in range(100):
+        window.record(0.002)
+    assert window.percentiles() == {"p50": 2.0, "p95": 2.0, "p99": 2.0}
+    assert window.count == 200
+
+    clock = FakeMonotonic()
+    rate = metrics.EventRate(clock)
+    for _ in range(5):
+        rate.record()
+        clock.value += 900
+    assert rate.per_hour() == 3
+    print("✅ Nearest rank percentiles over the last samples, commands within the last hour")
+
+
+def test_controller_metrics():
+    print("Testing controller metrics")
+    print("=" * 50)
+    config = dict(CONFIG, evse_status_entity_id="sensor.charger_status_connector")
+    hass, clock, controller = make_controller(config, phases=3, grid=5, evse_import=8, evse_offered=8)
+    hass.states.set("sensor.charger_status_connector", "Charging")
+    monotonic = FakeMonotonic()
+    controller.metrics = metrics.TickMetrics(clock=monotonic)
+
+    for second in range(10):
+        clock.current = START + datetime.timedelta(seconds=second)
+        controller.calculate()
+    hass.states.set("sensor.charger_status_connector", "Available")
+    for second in range(10, 20):
+        clock.current = START + datetime.timedelta(seconds=second)
+        controller.calculate()
+    hass.states.set(CONFIG["charging_mode_entity_id"], "Unknown")
+    hass.states.set("sensor.charger_status_connector", "Charging")
+    try:
+        controller.calculate()
+        raise AssertionError("unknown charging mode must fail")
+    except ValueError:
+        pass
+
+    summary = controller.metrics.summary()
+    assert summary["ticks"] == 21
+    assert summary["ticks_skipped"] == 9  # the first idle tick prepares the limit
+    assert summary["errors"] == 1
+    assert controller.metrics.state_read.count == 12
+    assert 0 < summary["state_read_p50_ms"] <= summary["calculation_p99_ms"]
+    assert summary["dispatch_p50_ms"] is None
+
+    # The summary is only recalculated once per summary interval
+    controller.metrics.calculation.record(0.001)
+    assert controller.metrics.summary() is summary
+    monotonic.value += const.DEFAULT_METRICS_SUMMARY_INTERVAL
+    assert controller.metrics.summary()["ticks"] == 22
+    print(f"✅ Tick p50 {summary['calculation_p50_ms']}ms, state read p50 {summary['state_read_p50_ms']}ms")
+
+
+async def check_dispatch_latency():
+    window = metrics.LatencyWindow()
+
+    async def send(limit):
+        await asyncio.sleep(0.02)
+
+    worker = dispatcher.ChargeRateDispatcher(send, latency=window)
+    worker.start()
+    worker.submit(10)
+    while worker.sent < 1:
+        await asyncio.sleep(0.005)
+    await worker.stop()
+    assert window.count == 1
+    assert window.percentiles()["p50"] >= 20
+
+
+def test_dispatch_latency():
+    print("Testing dispatch latency")
+    print("=" * 50)
+    asyncio.run(check_dispatch_latency())
+    print("✅ Acknowledged calls are timed")
+
+
+def test_recording_overhead():
+    print("Testing recording overhead")
+    print("=" * 50)
+    tick_metrics = metrics.TickMetrics()
+    iterations = 100000
+    started = time.perf_counter()
+    for _ in range(iterations):
+        tick_metrics.calculation.record(0.0001)
+    per_record_us = (time.perf_counter() - started) / iterations * 1e6
+    assert per_record_us < 5, per_record_us
+    print(f"✅ {per_record_us:.2f}us per recorded sample")
+
+
+if __name__ == "__main__":
+    test_rolling_percentiles()
+    test_controller_metrics()
+    test_dispatch_latency()
+    test_recording_overhead()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the targets of the charging modes that are not selected.
+Only the selected mode is evaluated on every tick. The other targets are
+previewed without touching the excess hold, and recalculated after a mode
+switch and when the diagnostics or the decision trace ask for them.
+"""
+
+import datetime
+
+from helpers import START, const, make_controller, set_grid
+
+
+def test_excess_preview_keeps_hold():
+    print("Testing excess preview")
+    print("=" * 50)
+    # 30A export per phase is far above the excess threshold
+    hass, clock, controller = make_controller(grid=-30, evse_import=0, evse_offered=0)
+    for second in range(0, 60, 5):
+        clock.current = START + datetime.timedelta(seconds=second)
+        data = controller.calculate()
+        assert data["target_evse_excess"] > 0
+        assert controller.loop.excess_charge_start_time is None
+    assert controller.request_mode_targets()["Excess"] > 0
+    assert controller.loop.excess_charge_start_time is None
+
+    # Selecting Excess starts the hold
+    hass.states.set("select.dynamic_ocpp_evse_charging_mode", "Excess")
+    clock.current += datetime.timedelta(seconds=5)
+    controller.calculate()
+    assert controller.loop.excess_charge_start_time == clock.current
+    print("✅ The excess hold only starts once Excess is selected")
+
+
+def test_targets_refresh_on_request_and_switch():
+    print("Testing mode target refresh")
+    print("=" * 50)
+    hass, clock, controller = make_controller(charging_mode="Solar", grid=-20, evse_import=0, evse_offered=0)
+    assert controller.request_mode_targets() == {}
+    assert controller.calculate()["target_evse_solar"] > 0
+
+    # Within the diagnostics interval the other targets are kept
+    set_grid(hass, 5)
+    clock.current += datetime.timedelta(seconds=5)
+    assert controller.calculate()["target_evse_excess"] > 0
+    # The diagnostics and the decision trace get them recalculated
+    targets = controller.request_mode_targets()
+    assert targets["Excess"] == 0 and targets["Solar"] == 0
+    assert set(targets) == {"Standard", "Eco", "Solar", "Excess"}
+
+    # After a switch the previously selected mode is recalculated right away
+    set_grid(hass, -20)
+    clock.current += datetime.timedelta(seconds=5)
+    assert controller.calculate()["target_evse_solar"] > 0
+    set_grid(hass, 5)
+    hass.states.set("select.dynamic_ocpp_evse_charging_mode", "Standard")
+    clock.current += datetime.timedelta(seconds=5)
+    data = controller.calculate()
+    assert data["target_evse_solar"] == 0, data["target_evse_solar"]
+    assert clock.current - START < datetime.timedelta(seconds=const.DEFAULT_MODE_DIAGNOSTICS_INTERVAL)
+    print("✅ Targets recalculated on request and after a mode switch")
+
+
+if __name__ == "__main__":
+    test_excess_preview_keeps_hold()
+    test_targets_refresh_on_request_and_switch()
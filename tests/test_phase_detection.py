@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the phase detection from the charger phase currents.
+A noisy phase around 1 A must not flip the phase count, more phases are
+taken over at once and fewer only after a delay, and the attributes are
+only parsed and evaluated again when the charger reports new currents.
+"""
+
+import datetime
+
+from helpers import CONFIG, START, calc, const, make_controller
+from component import load_module
+
+calculation = load_module("calculation")
+
+
+class CountingAttributes(dict):
+    """Attributes that count how often they are parsed."""
+
+    parsed = 0
+
+    def items(self):
+        CountingAttributes.parsed += 1
+        return super().items()
+
+
+def snapshot(currents):
+    return calculation.InputSnapshot(
+        calc.build_input_plan(CONFIG).config,
+        phases=3,
+        evse_current_offered=16.0,
+        evse_phase_currents=currents,
+    )
+
+
+def test_hysteresis():
+    print("Testing phase detection hysteresis")
+    print("=" * 50)
+    detection = calculation.PhaseDetection()
+    now = START
+
+    def detect(currents, seconds=1):
+        nonlocal detection, now
+        now += datetime.timedelta(seconds=seconds)
+        detection = calculation.detect_phases(detection, snapshot(currents), now)
+        return detection.phases, detection.calc_used
+
+    assert detect((10.0, 0.0, 0.0)) == (1, "1-1")
+    # L2 noise around 1 A, which flipped between 1 and 2 phases with a fixed 1 A threshold
+    for noise in (0.8, 1.2, 0.9, 1.4, 0.7, 1.1):
+        assert detect((10.0, noise, 0.0)) == (1, "1-1")
+
+    # More phases are taken over at once, and stay while a phase reads above 0.5 A
+    assert detect((10.0, 8.0, 8.0)) == (3, "1-3")
+    assert detect((10.0, 0.9, 8.0)) == (3, "1-3")
+
+    # Fewer phases only once they were measured for the drop delay
+    assert detect((10.0, 0.0, 8.0)) == (3, "1-3")
+    assert detection.drop_since == now
+    assert detect((10.0, 0.0, 8.0), seconds=calculation.PHASE_DROP_SECONDS - 5) == (3, "1-3")
+    assert detect((10.0, 0.0, 8.0), seconds=5) == (2, "1-2")
+    assert detection.drop_since is None
+
+    # A drop that does not last is forgotten
+    assert detect((10.0, 0.0, 0.0)) == (2, "1-2")
+    assert detect((10.0, 0.0, 8.0)) == (2, "1-2")
+    assert detection.drop_since is None
+
+    # Without an offered current the published phase count is used, then the safe default
+    unmeasured = calculation.detect_phases(detection, snapshot((10.0, 0.0, 0.0))._replace(evse_current_offered=None), now)
+    assert (unmeasured.phases, unmeasured.calc_used) == (3, "2-3")
+    unmeasured = calculation.detect_phases(detection, snapshot(())._replace(evse_current_offered=None, phases=None), now)
+    assert (unmeasured.phases, unmeasured.calc_used) == (3, "3-3")
+    print("✅ Noise around 1 A ignored, drop taken over after the delay")
+
+
+def test_detection_cache():
+    print("Testing phase detection cache")
+    print("=" * 50)
+    detection = calculation.detect_phases(calculation.PhaseDetection(), snapshot((10.0, 0.0, 0.0)), START)
+    # Unchanged readings return the cached result
+    assert calculation.detect_phases(detection, snapshot((10.0, 0.0, 0.0)), START) is detection
+    assert calculation.detect_phases(detection, snapshot((10.0, 9.0, 0.0)), START) is not detection
+
+    hass, clock, controller = make_controller(power_limit=11000, grid=5, evse_offered=16)
+
+    # Home Assistant keeps the attributes object while only the state changes
+    attributes = CountingAttributes(L1="10.0", L2="0.0", L3="0.0", unit_of_measurement="A")
+    for tick in range(10):
+        clock.current = START + datetime.timedelta(seconds=tick)
+        hass.states.set("sensor.charger_current_import", str(10 + tick % 2), attributes)
+        data = controller.calculate()
+        assert (data[const.CONF_PHASES], data["calc_used"]) == (1, "1-1")
+        if tick == 0:
+            cached = controller.loop.phase_detection
+    assert CountingAttributes.parsed == 1
+    assert controller.loop.phase_detection is cached
+
+    # New phase currents are parsed and detected on the next tick
+    hass.states.set("sensor.charger_current_import", "10", CountingAttributes(L1="10.0", L2="10.0", L3="10.0"))
+    data = controller.calculate()
+    assert (data[const.CONF_PHASES], data["calc_used"]) == (3, "1-3")
+    assert CountingAttributes.parsed == 2
+    assert controller.loop.phase_detection is not cached
+    print("✅ 10 ticks, attributes parsed once")
+
+
+if __name__ == "__main__":
+    test_hysteresis()
+    test_detection_cache()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the on-demand tick profiler of the profile service.
+Profiles controller ticks like the coordinator does and checks that only
+the armed ticks are profiled, that the profiler disarms itself after the
+ticks or the timeout, that the stats and hot functions are reported, and
+that the charging profile dispatches are timed while it is armed.
+"""
+
+import os
+import pstats
+import tempfile
+
+from helpers import FakeMonotonic, make_controller
+from component import load_module
+
+profiler = load_module("profiler")
+
+
+def tick(tick_profiler, controller):
+    """Same wrapping as DynamicOcppEvseCoordinator._async_tick, return whether the tick was profiled."""
+    ticks = tick_profiler.ticks
+    data = tick_profiler.call(controller.calculate)
+    assert data["available_current"] is not None
+    return tick_profiler.ticks > ticks
+
+
+def test_profiles_armed_ticks_only():
+    print("Testing tick profiler")
+    print("=" * 50)
+    controller = make_controller(phases=3, grid=5)[2]
+    tick_profiler = profiler.TickProfiler()
+    assert not tick(tick_profiler, controller)
+
+    tick_profiler.arm(3)
+    profiled = [tick(tick_profiler, controller) for _ in range(5)]
+    assert profiled == [True, True, True, False, False]
+    assert tick_profiler.finished
+
+    stats = tick_profiler.take_stats()
+    assert not tick_profiler.active and not tick_profiler.finished
+    top = profiler.top_functions(stats, 10)
+    assert len(top) == 10
+    assert top == sorted(top, key=lambda row: row["tottime_ms"], reverse=True)
+    functions = {row["function"] for row in profiler.top_functions(stats, 1000)}
+    assert any("(calculate_available_current)" in function for function in functions)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "profile.prof")
+        stats.dump_stats(path)
+        assert pstats.Stats(path).total_calls == stats.total_calls
+    print(f"✅ 3 of 5 ticks profiled, hottest function {top[0]['function']}")
+
+
+def test_profiler_times_out():
+    print("Testing profiler timeout")
+    print("=" * 50)
+    controller = make_controller(phases=3, grid=5)[2]
+    clock = FakeMonotonic()
+    tick_profiler = profiler.TickProfiler(clock)
+    tick_profiler.arm(100, timeout=10)
+    assert tick(tick_profiler, controller)
+    clock.value += 10
+    assert tick_profiler.finished
+    assert not tick(tick_profiler, controller)
+    assert tick_profiler.take_stats() is not None and tick_profiler.ticks == 1
+
+    # Nothing ran before the timeout, there are no stats
+    tick_profiler.arm(5, timeout=10)
+    clock.value += 10
+    assert tick_profiler.finished
+    assert tick_profiler.take_stats() is None
+    print("✅ Profiling stops after the timeout")
+
+
+def test_dispatch_timing():
+    print("Testing dispatch timing")
+    print("=" * 50)
+    tick_profiler = profiler.TickProfiler()
+    tick_profiler.record_dispatch(0.5, True)
+    assert tick_profiler.dispatches == []
+
+    tick_profiler.arm(2)
+    tick_profiler.record_dispatch(0.2, True)
+    tick_profiler.record_dispatch(0.4, False)
+    tick_profiler.take_stats()
+    # Dispatches after the profiling ended are not counted, the summary stays
+    tick_profiler.record_dispatch(1.0, True)
+    assert tick_profiler.dispatch_summary() == {"attempts": 2, "failed": 1, "mean_ms": 300.0, "max_ms": 400.0}
+    tick_profiler.arm(2)
+    assert tick_profiler.dispatch_summary() == {"attempts": 0, "failed": 0, "mean_ms": None, "max_ms": None}
+    print("✅ Dispatches timed while armed")
+
+
+if __name__ == "__main__":
+    test_profiles_armed_ticks_only()
+    test_profiler_times_out()
+    test_dispatch_timing()
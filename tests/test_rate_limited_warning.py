@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the rate limited warnings about missing inputs.
+An input that stays unavailable is reported once per interval instead of on
+every tick, and the next warning counts the ones dropped in between.
+"""
+
+import datetime
+import logging
+
+from helpers import START, FakeMonotonic, calc, make_controller
+
+
+class RecordingHandler(logging.Handler):
+    """Handler that keeps the formatted messages."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def recording_logger(name):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.WARNING)
+    handler = RecordingHandler()
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def test_rate_limited_warning():
+    print("Testing rate limited warning")
+    print("=" * 50)
+    logger, handler = recording_logger("test_rate_limited_warning")
+    clock = FakeMonotonic()
+    warn = calc.RateLimitedWarning(logger, 300, clock=clock)
+
+    for _ in range(5):
+        warn("sensor.a", "Missing %s", "sensor.a")
+    # Keys are limited separately
+    warn("sensor.b", "Missing %s", "sensor.b")
+    assert handler.messages == ["Missing sensor.a", "Missing sensor.b"], handler.messages
+
+    clock.value += 299
+    warn("sensor.a", "Missing %s", "sensor.a")
+    assert len(handler.messages) == 2
+    clock.value += 1
+    warn("sensor.a", "Missing %s", "sensor.a")
+    assert handler.messages[-1] == "Missing sensor.a (5 similar warnings suppressed)", handler.messages[-1]
+    clock.value += 300
+    warn("sensor.a", "Missing %s", "sensor.a")
+    assert handler.messages[-1] == "Missing sensor.a"
+    print("✅ One warning per key and interval, with the suppressed count")
+
+
+def test_missing_entity_warned_once_per_interval():
+    print("Testing missing entity warnings")
+    print("=" * 50)
+    logger, handler = recording_logger("test_missing_entity")
+    monotonic = FakeMonotonic()
+    warn_missing_entity = calc._warn_missing_entity
+    calc._warn_missing_entity = calc.RateLimitedWarning(logger, calc.MISSING_ENTITY_WARNING_INTERVAL, clock=monotonic)
+    try:
+        # The offered current entity is never set
+        hass, clock, controller = make_controller(grid=5, evse_import=0)
+        for tick in range(20):
+            clock.current = START + datetime.timedelta(seconds=tick)
+            monotonic.value += 1
+            controller.calculate()
+        warnings = [message for message in handler.messages if "sensor.charger_current_offered" in message]
+        assert warnings == ["Failed to get state for sensor: sensor.charger_current_offered (input: evse_current_offered)"], warnings
+
+        monotonic.value += calc.MISSING_ENTITY_WARNING_INTERVAL
+        controller.calculate()
+        warnings = [message for message in handler.messages if "sensor.charger_current_offered" in message]
+        assert len(warnings) == 2 and warnings[-1].endswith("(19 similar warnings suppressed)"), warnings
+    finally:
+        calc._warn_missing_entity = warn_missing_entity
+    print("✅ 21 ticks without the entity, 2 warnings")
+
+
+if __name__ == "__main__":
+    test_rate_limited_warning()
+    test_missing_entity_warned_once_per_interval()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the offline replay harness.
+Replays a synthetic solar day through the real calculation and checks the
+resulting limits against the configured bounds and the ramp rate.
+"""
+
+import datetime
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+import replay
+
+ENTITY_ID = "dynamic_ocpp_evse"
+CONFIG = {
+    "entity_id": ENTITY_ID,
+    "phase_a_current_entity_id": "sensor.grid_l1",
+    "phase_b_current_entity_id": "sensor.grid_l2",
+    "phase_c_current_entity_id": "sensor.grid_l3",
+    "main_breaker_rating": 25,
+    "invert_phases": False,
+    "max_import_power_entity_id": "sensor.power_limit",
+    "phase_voltage": 230,
+    "update_frequency": 5,
+    "charge_pause_duration": 180,
+    "evse_current_import_entity_id": "sensor.charger_current_import",
+    "evse_current_offered_entity_id": "sensor.charger_current_offered",
+    "evse_single_phase": False,
+    "evse_minimum_charge_current": 6,
+    "evse_maximum_charge_current": 16,
+    "charging_mode_entity_id": f"select.{ENTITY_ID}_charging_mode",
+    "min_current_entity_id": f"number.{ENTITY_ID}_min_current",
+    "max_current_entity_id": f"number.{ENTITY_ID}_max_current",
+    "battery_soc_entity_id": "None",
+    "battery_power_entity_id": "None",
+    "battery_soc_target_entity_id": f"number.{ENTITY_ID}_home_battery_soc_target",
+    "allow_grid_charging_entity_id": f"switch.{ENTITY_ID}_allow_grid_charging",
+    "power_buffer_entity_id": f"number.{ENTITY_ID}_power_buffer",
+}
+
+
+def synthetic_history(hours=6):
+    """Build a history with a solar export bump and the helper entity states."""
+    start = datetime.datetime(2025, 6, 1, 9, tzinfo=datetime.timezone.utc)
+    events = [
+        (start, CONFIG["charging_mode_entity_id"], "Solar", {}),
+        (start, CONFIG["min_current_entity_id"], "6", {}),
+        (start, CONFIG["max_current_entity_id"], "16", {}),
+        (start, CONFIG["battery_soc_target_entity_id"], "80", {}),
+        (start, CONFIG["allow_grid_charging_entity_id"], "on", {}),
+        (start, CONFIG["power_buffer_entity_id"], "0", {}),
+        (start, "sensor.power_limit", "11000", {}),
+        (start, "sensor.charger_current_offered", "0", {}),
+        (start, "sensor.charger_current_import", "0", {}),
+    ]
+    seconds = hours * 3600
+    for s in range(0, seconds, 10):
+        when = start + datetime.timedelta(seconds=s)
+        export = 20 * math.sin(math.pi * s / seconds)
+        for phase in ("sensor.grid_l1", "sensor.grid_l2", "sensor.grid_l3"):
+            events.append((when, phase, str(round(2 - export, 2)), {}))
+    return events
+
+
+def test_replay_synthetic_day():
+    """Limits stay within the EVSE bounds and follow the ramp rate."""
+    print("Testing offline replay")
+    print("=" * 50)
+    rows = []
+    summary = replay.replay(CONFIG, synthetic_history(), writer=rows.append)
+    print(f"  Ticks: {summary['ticks']}, OCPP commands: {summary['commands']}, errors: {summary['errors']}")
+
+    assert summary["errors"] == 0
+    assert summary["ticks"] == len(rows)
+    assert summary["commands"] > 0
+
+    interval = CONFIG["update_frequency"]
+    previous = None
+    for row in rows:
+        limit = row["limit"]
+        assert limit == 0 or CONFIG["evse_minimum_charge_current"] <= limit <= CONFIG["evse_maximum_charge_current"]
+        available = row["available_current"]
+        if previous is not None and previous > 0 and available > 0:
+            # Ramp up is limited to 0.3A/s, allow for rounding to 0.1A
+            assert available - previous <= 0.3 * interval + 0.1, f"ramp too fast at {row['time']}"
+        previous = available
+    print(f"  Highest limit: {summary['max_limit']}A")
+    print("✅ Replay limits within bounds")
+
+
+if __name__ == "__main__":
+    test_replay_synthetic_day()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-tick hot path of the charge current calculation.
+
+Times every stage of a tick against a stubbed state machine with a realistic
+number of entities and checks the results against the latency budgets below.
+Results can be written to JSON and compared with an earlier run, so
+regressions are visible in review.
+
+Run with:
+    python tools/benchmark.py --output bench.json
+    python tools/benchmark.py --compare bench.json
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from component import load_module
+from fake_hass import FakeConfigEntry, FakeHass
+
+const = load_module("const")
+calc = load_module("dynamic_ocpp_evse")
+calculation = load_module("calculation")
+
+# Latency budgets in microseconds (p50, p99) per call on a desktop class CPU.
+# A Raspberry Pi 4 is roughly 5-10x slower, which still leaves a full tick
+# well below a millisecond.
+BUDGETS_US = {
+    "get_state_config": (50, 120),
+    "get_state_config_shared": (25, 60),
+    "get_charge_context_values": (25, 60),
+    "calculate_headroom": (10, 25),
+    "calculate_max_evse_available": (10, 25),
+    "calculate_standard_mode": (10, 25),
+    "calculate_eco_mode": (10, 25),
+    "calculate_solar_mode": (10, 25),
+    "calculate_excess_mode": (10, 25),
+    "apply_ramping": (10, 25),
+    "decide": (80, 160),
+    "tick": (150, 300),
+}
+
+# Number of unrelated entities in the stubbed state machine
+FILLER_ENTITIES = 2000
+ENTITY_ID = "dynamic_ocpp_evse"
+CONFIG = {
+    const.CONF_ENTITY_ID: ENTITY_ID,
+    const.CONF_PHASE_A_CURRENT_ENTITY_ID: "sensor.grid_l1",
+    const.CONF_PHASE_B_CURRENT_ENTITY_ID: "sensor.grid_l2",
+    const.CONF_PHASE_C_CURRENT_ENTITY_ID: "sensor.grid_power_l3",
+    const.CONF_MAIN_BREAKER_RATING: 25,
+    const.CONF_INVERT_PHASES: False,
+    const.CONF_MAX_IMPORT_POWER_ENTITY_ID: "sensor.power_limit",
+    const.CONF_PHASE_VOLTAGE: 230,
+    const.CONF_UPDATE_FREQUENCY: 5,
+    const.CONF_CHARGE_PAUSE_DURATION: 180,
+    const.CONF_EXCESS_EXPORT_THRESHOLD: 4000,
+    const.CONF_EVSE_CURRENT_IMPORT_ENTITY_ID: "sensor.charger_current_import",
+    const.CONF_EVSE_CURRENT_OFFERED_ENTITY_ID: "sensor.charger_current_offered",
+    const.CONF_EVSE_SINGLE_PHASE: False,
+    const.CONF_EVSE_SINGLE_PHASE_CURRENT_ENTITY_ID: "None",
+    const.CONF_EVSE_MINIMUM_CHARGE_CURRENT: 6,
+    const.CONF_EVSE_MAXIMUM_CHARGE_CURRENT: 16,
+    const.CONF_CHARGING_MODE_ENTITY_ID: f"select.{ENTITY_ID}_charging_mode",
+    const.CONF_MIN_CURRENT_ENTITY_ID: f"number.{ENTITY_ID}_min_current",
+    const.CONF_MAX_CURRENT_ENTITY_ID: f"number.{ENTITY_ID}_max_current",
+    const.CONF_BATTERY_SOC_ENTITY_ID: "sensor.battery_soc",
+    const.CONF_BATTERY_POWER_ENTITY_ID: "sensor.battery_power",
+    const.CONF_BATTERY_SOC_TARGET_ENTITY_ID: f"number.{ENTITY_ID}_home_battery_soc_target",
+    const.CONF_BATTERY_MAX_CHARGE_POWER: 5000,
+    const.CONF_BATTERY_MAX_DISCHARGE_POWER: 5000,
+    const.CONF_ALLOW_GRID_CHARGING_ENTITY_ID: f"switch.{ENTITY_ID}_allow_grid_charging",
+    const.CONF_POWER_BUFFER_ENTITY_ID: f"number.{ENTITY_ID}_power_buffer",
+}
+
+
+def build_hass(charging_mode):
+    """Return a stubbed hass with the configured inputs and filler entities."""
+    hass = FakeHass()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for i in range(FILLER_ENTITIES):
+        hass.states.set(f"sensor.filler_{i}", str(i % 100), {"unit_of_measurement": "W"}, now)
+    hass.states.set("sensor.grid_l1", "4.2", {"unit_of_measurement": "A"}, now)
+    hass.states.set("sensor.grid_l2", "-3.1", {"unit_of_measurement": "A"}, now)
+    hass.states.set("sensor.grid_power_l3", "-850", {"unit_of_measurement": "W"}, now)
+    hass.states.set("sensor.power_limit", "11000", {"unit_of_measurement": "W"}, now)
+    hass.states.set("sensor.charger_current_import", "8.1", {"L1": "8.1", "L2": "8.0", "L3": "8.2"}, now)
+    hass.states.set("sensor.charger_current_offered", "10", {}, now)
+    hass.states.set("sensor.battery_soc", "85", {}, now)
+    hass.states.set("sensor.battery_power", "-1200", {}, now)
+    hass.states.set(CONFIG[const.CONF_CHARGING_MODE_ENTITY_ID], charging_mode, {}, now)
+    hass.states.set(CONFIG[const.CONF_MIN_CURRENT_ENTITY_ID], "6", {}, now)
+    hass.states.set(CONFIG[const.CONF_MAX_CURRENT_ENTITY_ID], "16", {}, now)
+    hass.states.set(CONFIG[const.CONF_BATTERY_SOC_TARGET_ENTITY_ID], "80", {}, now)
+    hass.states.set(CONFIG[const.CONF_ALLOW_GRID_CHARGING_ENTITY_ID], "on", {}, now)
+    hass.states.set(CONFIG[const.CONF_POWER_BUFFER_ENTITY_ID], "500", {}, now)
+    hass.states.set(f"sensor.{ENTITY_ID}", "10", {const.CONF_PHASES: 3}, now)
+    return hass
+
+
+def measure(func, iterations):
+    """Return per call latencies in microseconds, peak bytes and retained blocks per call."""
+    for _ in range(min(iterations, 100)):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        func()
+        samples.append((time.perf_counter_ns() - start) / 1000)
+    samples.sort()
+
+    allocation_calls = min(iterations, 200)
+    tracemalloc.start()
+    func()
+    peak_per_call = 0
+    blocks_before = sys.getallocatedblocks()
+    for _ in range(allocation_calls):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        peak_per_call = max(peak_per_call, peak - current)
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+    return {
+        "p50_us": round(percentile(0.50), 2),
+        "p99_us": round(percentile(0.99), 2),
+        "mean_us": round(sum(samples) / len(samples), 2),
+        "peak_bytes_per_call": peak_per_call,
+        "retained_blocks_per_call": round((blocks_after - blocks_before) / allocation_calls, 2),
+    }
+
+
+def benchmark(iterations, charging_mode="Standard"):
+    """Time every stage of a tick and the full tick."""
+    hass = build_hass(charging_mode)
+    controller = calc.EvseController(hass, FakeConfigEntry(dict(CONFIG)))
+    snapshot = calc.get_state_config(controller)
+    context = calculation.decide(snapshot, calculation.LoopState(), datetime.datetime.now()).context
+    target_evse = calculation.calculate_standard_mode(context)
+    now = datetime.datetime.now()
+    # A ramp in progress, so every call goes through the rate limit
+    loop = calculation.LoopState(last_ramp_value=8, last_ramp_time=now - datetime.timedelta(seconds=5))
+
+    def tick():
+        # Same work as one coordinator tick, without the service calls
+        data = controller.calculate()
+        available_current = data[const.CONF_AVAILABLE_CURRENT]
+        controller.should_start_pause_timer(available_current)
+        limit = controller.resolve_limit(available_current, False)
+        controller.needs_dispatch(limit)
+
+    stages = {
+        # Every call reads the grid inputs, like the first entry of a tick
+        "get_state_config": lambda: (controller.grid.invalidate(), calc.get_state_config(controller)),
+        # The grid snapshot of the tick is reused, like every further entry on the same grid
+        "get_state_config_shared": lambda: calc.get_state_config(controller),
+        "get_charge_context_values": lambda: calculation.get_charge_context_values(snapshot),
+        "calculate_headroom": lambda: calculation.calculate_headroom(context),
+        "calculate_max_evse_available": lambda: calculation.calculate_max_evse_available(context),
+        "calculate_standard_mode": lambda: calculation.calculate_standard_mode(context),
+        "calculate_eco_mode": lambda: calculation.calculate_eco_mode(context),
+        "calculate_solar_mode": lambda: calculation.calculate_solar_mode(context),
+        "calculate_excess_mode": lambda: calculation.calculate_excess_mode(context, now),
+        "apply_ramping": lambda: calculation.apply_ramping(
+            loop, target_evse, target_evse, context.min_current, snapshot.evse_current_offered, now
+        ),
+        # The pure calculation core on its own, without reading the state machine
+        "decide": lambda: calculation.decide(snapshot, loop, now),
+        "tick": tick,
+    }
+    return {name: measure(func, iterations) for name, func in stages.items()}
+
+
+def check_budgets(results):
+    """Return the list of budget violations."""
+    violations = []
+    for name, result in results.items():
+        p50_budget, p99_budget = BUDGETS_US[name]
+        if result["p50_us"] > p50_budget:
+            violations.append(f"{name}: p50 {result['p50_us']}us > {p50_budget}us")
+        if result["p99_us"] > p99_budget:
+            violations.append(f"{name}: p99 {result['p99_us']}us > {p99_budget}us")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Dynamic OCPP EVSE hot path")
+    parser.add_argument("--iterations", type=int, default=5000, help="Timed calls per stage")
+    parser.add_argument("--mode", choices=["Standard", "Eco", "Solar", "Excess"], default="Standard")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with the results of an earlier run")
+    args = parser.parse_args()
+
+    # Production runs with debug logging disabled
+    logging.basicConfig(level=logging.WARNING)
+
+    results = benchmark(args.iterations, args.mode)
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+
+    print(f"{'Stage':<30} {'p50 us':>9} {'p99 us':>9} {'budget':>13} {'peak B':>8} {'blocks':>7}" + ("  p50 change" if previous else ""))
+    print("-" * (82 + (12 if previous else 0)))
+    for name, result in results.items():
+        p50_budget, p99_budget = BUDGETS_US[name]
+        line = (
+            f"{name:<30} {result['p50_us']:>9.2f} {result['p99_us']:>9.2f} {f'{p50_budget}/{p99_budget}':>13}"
+            f" {result['peak_bytes_per_call']:>8} {result['retained_blocks_per_call']:>7}"
+        )
+        if previous and name in previous and previous[name]["p50_us"]:
+            change = (result["p50_us"] - previous[name]["p50_us"]) / previous[name]["p50_us"] * 100
+            line += f"  {change:+9.1f}%"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "mode": args.mode,
+                "iterations": args.iterations,
+                "results": results,
+            }, f, indent=2)
+        print(f"\n✅ Results saved to: {args.output}")
+
+    violations = check_budgets(results)
+    if violations:
+        print("\n❌ Budget exceeded:")
+        for violation in violations:
+            print(f"  {violation}")
+        sys.exit(1)
+    print("\n✅ All stages within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""Import the Home Assistant free modules of the integration outside Home Assistant.
+
+The package __init__ of custom_components/dynamic_ocpp_evse imports Home
+Assistant, so the calculation modules are loaded through a bare package that
+points at the same directory without executing __init__.py.
+"""
+import importlib
+import sys
+import types
+from pathlib import Path
+
+COMPONENT_DIR = Path(__file__).resolve().parents[1] / "custom_components" / "dynamic_ocpp_evse"
+PACKAGE = "dynamic_ocpp_evse"
+
+
+def load_module(name):
+    """Import and return dynamic_ocpp_evse.<name> without Home Assistant."""
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [str(COMPONENT_DIR)]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(f"{PACKAGE}.{name}")
@@ -0,0 +1,78 @@
+"""Stand-ins for the parts of Home Assistant the controller uses outside Home Assistant.
+
+Shared by the tools and the tests. FakeState carries the same timestamps as
+homeassistant.core.State and FakeStates writes them the way the Home
+Assistant state machine does, so what the controller reads from a fake state
+is what it reads from a real one.
+"""
+
+
+class FakeState:
+    """Stand-in for homeassistant.core.State."""
+
+    __slots__ = ("entity_id", "state", "attributes", "last_changed", "last_updated", "last_reported")
+
+    def __init__(self, entity_id, state, attributes=None, last_changed=None, last_updated=None, last_reported=None):
+        self.entity_id = entity_id
+        self.state = state
+        self.attributes = attributes or {}
+        self.last_updated = last_updated
+        self.last_changed = last_changed or last_updated
+        self.last_reported = last_reported
+
+    def __repr__(self):
+        return f"<state {self.entity_id}={self.state}>"
+
+
+class FakeStates:
+    """Virtual state machine, supports get() and set().
+
+    A write of the same state and attributes keeps the State object. With
+    reports, like Home Assistant 2024.3 and later, it moves last_reported.
+    Without reports, like older versions and recorded history, last_reported
+    stays None and such a write changes nothing.
+    """
+
+    def __init__(self, reports=True):
+        self.reports = reports
+        self._states = {}
+
+    def get(self, entity_id):
+        return self._states.get(entity_id)
+
+    def set(self, entity_id, state, attributes=None, last_updated=None, last_reported=None):
+        """Write a state, last_updated is the time of the write unless last_reported is given."""
+        attributes = attributes or {}
+        reported = (last_reported or last_updated) if self.reports else None
+        old = self._states.get(entity_id)
+        if old is not None and old.state == state and old.attributes == attributes:
+            if reported is not None:
+                old.last_reported = reported
+            return
+        last_changed = old.last_changed if old is not None and old.state == state else None
+        self._states[entity_id] = FakeState(entity_id, state, attributes, last_changed or last_updated, last_updated, reported)
+
+
+class FakeHass:
+    """Virtual hass object exposing the state machine used by the calculation."""
+
+    def __init__(self, reports=True):
+        self.states = FakeStates(reports)
+
+
+class FakeConfigEntry:
+    """Stand-in for homeassistant.config_entries.ConfigEntry."""
+
+    def __init__(self, data, entry_id="fake"):
+        self.data = data
+        self.entry_id = entry_id
+
+
+class VirtualClock:
+    """Clock handed to the controller instead of datetime.datetime.now."""
+
+    def __init__(self, start):
+        self.current = start
+
+    def __call__(self):
+        return self.current
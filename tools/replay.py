@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Replay recorded input entity history through the charge current calculation.
+
+Feeds a Home Assistant history export through the real EvseController
+(get_state_config -> calculation.decide) with a virtual clock and a virtual
+state machine, then applies the same pause timer and dispatch decisions as
+the coordinator. Runs without Home Assistant and faster than real time.
+
+Supported inputs:
+- History CSV as downloaded from the Home Assistant history panel
+  (columns entity_id, state, last_changed)
+- Wide CSV with a timestamp column and one column per entity ID
+- History JSON as returned by /api/history/period (includes attributes, so
+  phase detection from the EVSE L1/L2/L3 attributes works)
+
+The config is either the config entry data as JSON, or a copy of
+.storage/core.config_entries (the dynamic_ocpp_evse entry is used).
+
+Run with:
+    python tools/replay.py --config entry.json --history history.csv --output replay.csv
+"""
+
+import argparse
+import csv
+import datetime
+import functools
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from component import load_module
+from fake_hass import FakeConfigEntry, FakeHass, VirtualClock
+
+const = load_module("const")
+calc = load_module("dynamic_ocpp_evse")
+
+OUTPUT_COLUMNS = [
+    "time",
+    "charging_mode",
+    "phases",
+    "max_evse_available",
+    "target_evse",
+    "available_current",
+    "pause_timer_active",
+    "limit",
+    "ocpp_limit_sent",
+    "error",
+]
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_time(value):
+    """Parse an ISO 8601 timestamp or epoch seconds into an aware UTC datetime."""
+    value = value.strip()
+    if "-" not in value[1:]:
+        return datetime.datetime.fromtimestamp(float(value), tz=datetime.timezone.utc)
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def load_config(path):
+    """Load the config entry data from a JSON file."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    # .storage/core.config_entries
+    if isinstance(data, dict) and "data" in data and isinstance(data["data"], dict) and "entries" in data["data"]:
+        for entry in data["data"]["entries"]:
+            if entry.get("domain") == const.DOMAIN:
+                return entry["data"]
+        raise ValueError(f"No {const.DOMAIN} entry found in {path}")
+    # A single exported config entry
+    if isinstance(data, dict) and data.get("domain") == const.DOMAIN and "data" in data:
+        return data["data"]
+    return data
+
+
+def load_history(path):
+    """Load recorded state changes as a time sorted list of (time, entity_id, state, attributes)."""
+    path = Path(path)
+    events = []
+    if path.suffix.lower() == ".json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        rows = [row for group in data for row in group] if data and isinstance(data[0], list) else data
+        for row in rows:
+            events.append((
+                parse_time(str(row.get("last_updated") or row["last_changed"])),
+                row["entity_id"],
+                str(row["state"]),
+                row.get("attributes") or {},
+            ))
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = [column.strip() for column in next(reader)]
+            if "entity_id" in header:
+                entity_column = header.index("entity_id")
+                state_column = header.index("state")
+                time_column = header.index("last_changed")
+                for row in reader:
+                    if row:
+                        events.append((parse_time(row[time_column]), row[entity_column], row[state_column], {}))
+            else:
+                # Wide format: first column is the timestamp, the others are entity IDs
+                for row in reader:
+                    if not row:
+                        continue
+                    when = parse_time(row[0])
+                    for entity_id, value in zip(header[1:], row[1:]):
+                        if value != "":
+                            events.append((when, entity_id, value, {}))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def replay(config_data, events, interval=None, start=None, end=None, charging_mode=None, writer=None):
+    """Replay the events and return a summary dict.
+
+    A tick runs every interval seconds of virtual time (the configured update
+    frequency by default). Every tick row is passed to writer, if given.
+    """
+    config_data = dict(config_data)
+    interval = datetime.timedelta(seconds=interval or config_data.get(const.CONF_UPDATE_FREQUENCY, 5))
+    if not events:
+        raise ValueError("No history to replay")
+    start = start or events[0][0]
+    end = end or events[-1][0]
+
+    # Recorded history has no reports of unchanged values, like Home Assistant before 2024.3
+    hass = FakeHass(reports=False)
+    clock = VirtualClock(start)
+    entry = FakeConfigEntry(config_data, entry_id="replay")
+    controller = calc.EvseController(hass, entry, clock=clock)
+    entity_id = config_data.get(const.CONF_ENTITY_ID)
+    mode_entity_id = config_data.get(const.CONF_CHARGING_MODE_ENTITY_ID)
+    if charging_mode is not None and mode_entity_id:
+        hass.states.set(mode_entity_id, charging_mode)
+    pause_duration = datetime.timedelta(seconds=config_data.get(const.CONF_CHARGE_PAUSE_DURATION, 180))
+    pause_timer_until = None
+
+    summary = {"ticks": 0, "commands": 0, "errors": 0, "max_limit": 0}
+    index = 0
+    now = start
+    while now <= end:
+        clock.current = now
+        # Apply every recorded change up to the current virtual time
+        while index < len(events) and events[index][0] <= now:
+            when, changed_entity_id, value, attributes = events[index]
+            if not (charging_mode is not None and changed_entity_id == mode_entity_id):
+                hass.states.set(changed_entity_id, value, attributes, when)
+            index += 1
+
+        row = {"time": now.isoformat()}
+        try:
+            data = controller.calculate()
+            available_current = data[const.CONF_AVAILABLE_CURRENT]
+            # Same pause timer and dispatch decisions as the coordinator
+            if controller.should_start_pause_timer(available_current):
+                pause_timer_until = now + pause_duration
+            pause_timer_active = pause_timer_until is not None and now < pause_timer_until
+            limit = controller.resolve_limit(available_current, pause_timer_active)
+            if controller.needs_dispatch(limit):
+                row["ocpp_limit_sent"] = limit
+                summary["commands"] += 1
+            summary["max_limit"] = max(summary["max_limit"], limit)
+            # Publish the phase count on our own sensor like the integration does
+            if entity_id:
+                hass.states.set(f"sensor.{entity_id}", available_current, {const.CONF_PHASES: data[const.CONF_PHASES]}, now)
+            row.update({
+                "charging_mode": data[const.CONF_CHARGING_MODE],
+                "phases": data[const.CONF_PHASES],
+                "max_evse_available": data["max_evse_available"],
+                "target_evse": data["target_evse"],
+                "available_current": available_current,
+                "pause_timer_active": pause_timer_active,
+                "limit": limit,
+            })
+        except Exception as e:
+            row["error"] = str(e)
+            summary["errors"] += 1
+        summary["ticks"] += 1
+        if writer is not None:
+            writer(row)
+        now += interval
+    summary["suppressed"] = controller.commands_suppressed
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded history through the Dynamic OCPP EVSE calculation")
+    parser.add_argument("--config", required=True, help="Config entry data as JSON, or a copy of .storage/core.config_entries")
+    parser.add_argument("--history", required=True, help="History export (CSV or JSON)")
+    parser.add_argument("--output", help="CSV file for the per tick results")
+    parser.add_argument("--interval", type=float, help="Seconds between ticks, defaults to the configured update frequency")
+    parser.add_argument("--start", help="Start of the replay window (ISO 8601)")
+    parser.add_argument("--end", help="End of the replay window (ISO 8601)")
+    parser.add_argument("--mode", choices=["Standard", "Eco", "Solar", "Excess"], help="Override the recorded charging mode")
+    parser.add_argument("--verbose", action="store_true", help="Show the calculation log output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.ERROR)
+
+    config_data = load_config(args.config)
+    events = load_history(args.history)
+    print(f"Loaded {len(events)} state changes from {args.history}")
+
+    output_file = None
+    writer = None
+    if args.output:
+        output_file = open(args.output, "w", newline="", encoding="utf-8")
+        csv_writer = csv.DictWriter(output_file, fieldnames=OUTPUT_COLUMNS)
+        csv_writer.writeheader()
+        writer = csv_writer.writerow
+
+    started = time.perf_counter()
+    try:
+        summary = replay(
+            config_data,
+            events,
+            interval=args.interval,
+            start=parse_time(args.start) if args.start else None,
+            end=parse_time(args.end) if args.end else None,
+            charging_mode=args.mode,
+            writer=writer,
+        )
+    finally:
+        if output_file is not None:
+            output_file.close()
+    elapsed = time.perf_counter() - started
+
+    print(f"Ticks: {summary['ticks']}, OCPP commands: {summary['commands']} ({summary['suppressed']} suppressed), errors: {summary['errors']}")
+    print(f"Highest limit: {summary['max_limit']}A")
+    print(f"Replayed in {elapsed:.2f}s ({summary['ticks'] / elapsed if elapsed else 0:.0f} ticks/s)")
+    if args.output:
+        print(f"✅ Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()